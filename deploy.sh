@@ -13,9 +13,10 @@ SYSTEMD_USER_DIR="${HOME}/.config/systemd/user"
 # Parse arguments
 FEATURES_DB=""
 VARIANT_STORE_DB=""
+POPULATION_STORE_DB=""
 
 usage(){
-  echo "Usage: $0 --features-db PATH --variant-store-db PATH"
+  echo "Usage: $0 --features-db PATH --variant-store-db PATH [--population-store-db PATH]"
   exit 1
 }
 
@@ -29,6 +30,10 @@ while [[ $# -gt 0 ]]; do
       VARIANT_STORE_DB="${2:-}"
       shift 2
       ;;
+    --population-store-db)
+      POPULATION_STORE_DB="${2:-}"
+      shift 2
+      ;;
     -h|--help)
       usage
       ;;
@@ -49,6 +54,15 @@ if [[ -z "$VARIANT_STORE_DB" || ! -f "$VARIANT_STORE_DB" ]]; then
   echo "Error: invalid variant-store-db: $VARIANT_STORE_DB"
   exit 1
 fi
+# Optional, the server falls back to the gnomAD API without it
+POPULATION_MOUNT=()
+if [[ -n "$POPULATION_STORE_DB" ]]; then
+  if [[ ! -f "$POPULATION_STORE_DB" ]]; then
+    echo "Error: invalid population-store-db: $POPULATION_STORE_DB"
+    exit 1
+  fi
+  POPULATION_MOUNT=(-v "${POPULATION_STORE_DB}:/db/population_store.db:Z")
+fi
 
 mkdir -p "$SYSTEMD_USER_DIR"
 
@@ -71,6 +85,7 @@ podman run -d \
   -p "$PORT:$PORT" \
   -v "${FEATURES_DB}:/db/features.db:Z" \
   -v "${VARIANT_STORE_DB}:/db/variant_store.db:Z" \
+  "${POPULATION_MOUNT[@]}" \
   -e PYTHONUNBUFFERED=1 \
   "$IMAGE"
 
@@ -0,0 +1,77 @@
+"""
+Packs the per base conservation_scores table of the features database
+(phastCons, phyloP, GERP and CADD) into a memory mappable track store,
+see server/flask-app/app/track_store.py for the format
+
+Usage : python3 conservation_tracks.py --features_db features.db
+            --output conservation_tracks.f32
+"""
+
+import argparse
+import itertools
+import sqlite3
+import sys
+
+# A copy of the server's module (see sync_shared_modules.py)
+import track_store  # pylint: disable=E0401
+
+
+def read_transcripts(conn, tracks):
+    """
+    Reads the scores of each transcript in turn
+    @returns iterable of (ensembl_transcript_id, tpos, scores)
+    """
+    rows = conn.execute(
+        f"""
+        SELECT ensembl_transcript_id, tpos, {', '.join(tracks)}
+        FROM conservation_scores
+        ORDER BY ensembl_transcript_id, tpos
+        """
+    )
+    for enst, transcript_rows in itertools.groupby(rows, key=lambda row: row[0]):
+        transcript_rows = list(transcript_rows)
+        yield (
+            enst,
+            [row[1] for row in transcript_rows],
+            {
+                track: [row[i + 2] for row in transcript_rows]
+                for i, track in enumerate(tracks)
+            },
+        )
+
+
+def main(args):
+    """Entry point"""
+    conn = sqlite3.connect(f'file:{args.features_db}?mode=ro', uri=True)
+    has_table = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='conservation_scores'"
+    ).fetchone()
+    if not has_table:
+        print(f'No conservation_scores table in {args.features_db}')
+        sys.exit(1)
+
+    print(f'Writing {", ".join(track_store.TRACKS)} to {args.output}')
+    n_transcripts = track_store.write_track_store(
+        args.output, read_transcripts(conn, track_store.TRACKS)
+    )
+    conn.close()
+    print(f'Packed the scores of {n_transcripts} transcripts')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Creates the memory mapped conservation track store'
+    )
+    parser.add_argument(
+        '--features_db',
+        required=True,
+        type=str,
+        help='Features sqlite3 database with the conservation_scores table',
+    )
+    parser.add_argument(
+        '--output',
+        required=True,
+        type=str,
+        help='Output track store (e.g. conservation_tracks.f32)',
+    )
+    main(args=parser.parse_args())
@@ -0,0 +1,111 @@
+"""
+Converts the per base genome_to_transcript_coordinates table of an
+existing features database into the transcript_exon_intervals table
+(one row per exon, see create_gpos_lookup.R) that the server reads
+
+Databases ingested from UTR_Genome_Transcript_Intervals.tsv already have
+the intervals, this only adds the index on them
+
+Usage : python3 exon_intervals.py --db_name features.db --drop_positions
+"""
+
+import argparse
+import sqlite3
+import sys
+
+INTERVALS_FROM_POSITIONS = """
+    CREATE TABLE transcript_exon_intervals AS
+    SELECT
+        chr,
+        ensembl_transcript_id,
+        strand,
+        exon_number,
+        min(genomic_pos) AS genomic_start,
+        max(genomic_pos) AS genomic_end,
+        min(transcript_pos) AS transcript_start,
+        max(transcript_pos) AS transcript_end
+    FROM genome_to_transcript_coordinates
+    GROUP BY chr, ensembl_transcript_id, strand, exon_number
+    ORDER BY ensembl_transcript_id, transcript_start
+"""
+
+
+def has_table(conn, name):
+    """
+    Whether the database has a table
+    """
+    return (
+        conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", [name]
+        ).fetchone()
+        is not None
+    )
+
+
+def check_intervals(conn):
+    """
+    Checks that every exon is a contiguous run of bases (the per base
+    table has one row per base, so its width matches on both axes)
+    @returns the number of exons that do not
+    """
+    return conn.execute(
+        """
+        SELECT count(*) FROM transcript_exon_intervals
+        WHERE genomic_end - genomic_start != transcript_end - transcript_start
+        """
+    ).fetchone()[0]
+
+
+def main(args):
+    """Entry point"""
+    conn = sqlite3.connect(args.db_name)
+
+    if not has_table(conn, 'transcript_exon_intervals'):
+        if not has_table(conn, 'genome_to_transcript_coordinates'):
+            print(f'No coordinate tables in {args.db_name}')
+            sys.exit(1)
+        print('Collapsing genome_to_transcript_coordinates into exon intervals')
+        conn.execute(INTERVALS_FROM_POSITIONS)
+        broken = check_intervals(conn)
+        if broken:
+            conn.execute('DROP TABLE transcript_exon_intervals')
+            print(f'{broken} exons are not contiguous, leaving the database as is')
+            sys.exit(1)
+
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_transcript_exon_intervals_transcript
+        ON transcript_exon_intervals (ensembl_transcript_id, transcript_start)
+        """
+    )
+    (n_exons,) = conn.execute(
+        'SELECT count(*) FROM transcript_exon_intervals'
+    ).fetchone()
+    print(f'{n_exons} exon intervals')
+
+    if args.drop_positions and has_table(conn, 'genome_to_transcript_coordinates'):
+        print('Dropping genome_to_transcript_coordinates')
+        conn.execute('DROP TABLE genome_to_transcript_coordinates')
+    conn.commit()
+
+    if args.drop_positions:
+        conn.execute('VACUUM')
+    conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Creates the exon interval coordinate table'
+    )
+    parser.add_argument(
+        '--db_name',
+        required=True,
+        type=str,
+        help='Features sqlite3 database',
+    )
+    parser.add_argument(
+        '--drop_positions',
+        action='store_true',
+        help='Drop the per base genome_to_transcript_coordinates table',
+    )
+    main(args=parser.parse_args())
@@ -164,16 +164,18 @@ tbl_models = {
         ],  # pylint: disable=C0301  # noqa: E501
         'dtype': None,  
     },
-    'genome_to_transcript_coordinates': {
-        'location': 'UTR_Genome_Transcript_Coordinates.tsv',  # pylint: disable=C0301  # noqa: E501
+    'transcript_exon_intervals': {
+        'location': 'UTR_Genome_Transcript_Intervals.tsv',  # pylint: disable=C0301  # noqa: E501
         'separator': '\t',
         'col_mappings': {
             'seqid': 'chr',
             'ensembl_transcript_id': 'ensembl_transcript_id',
             'strand': 'strand',
             'exon_number': 'exon_number',
-            'gpos': 'genomic_pos',
-            'tpos': 'transcript_pos',
+            'gstart': 'genomic_start',
+            'gend': 'genomic_end',
+            'tstart': 'transcript_start',
+            'tend': 'transcript_end',
         },
         'remove_ensembl_id_version_numbers': False,
         'ensembl_ids': None,
@@ -0,0 +1,432 @@
+"""
+Stores gnomAD and ClinVar variants that fall inside the MANE 5' UTRs
+in an indexed sqlite3 database so that the viewer can answer region
+queries from local disk rather than the gnomAD GraphQL API
+
+Usage : python3 population_store.py --db_name population_store.db
+            --regions ../../../data/pipeline/UTR_regions.tsv
+            --mane_file ../../../data/pipeline/MANE.GRCh38.v1.0.summary.txt.gz
+            --gnomad_vcf gnomad.genomes.v3.1.2.utr_sites.chr*.vcf
+            --clinvar_vcf clinvar_utr_filtered.vcf --overwrite
+"""
+
+import argparse
+import bisect
+import gzip
+import os
+import sqlite3
+import sys
+import tqdm
+import pandas as pd
+
+# Review status to number of gold stars
+# https://www.ncbi.nlm.nih.gov/clinvar/docs/review_status/
+GOLD_STARS = {
+    'practice guideline': 4,
+    'reviewed by expert panel': 3,
+    'criteria provided, multiple submitters, no conflicts': 2,
+    'criteria provided, conflicting interpretations': 1,
+    'criteria provided, single submitter': 1,
+}
+
+GNOMAD_TABLE = """
+    CREATE TABLE gnomad_variants (
+        chrom varchar,
+        pos int,
+        ref varchar,
+        alt varchar,
+        variant_id varchar,
+        rsid varchar,
+        ac int,
+        an int,
+        af real,
+        transcript_id varchar,
+        hgvsc varchar,
+        major_consequence varchar,
+        sift_prediction varchar,
+        polyphen_prediction varchar,
+        is_mane_select int
+    )"""
+
+CLINVAR_TABLE = """
+    CREATE TABLE clinvar_variants (
+        chrom varchar,
+        pos int,
+        ref varchar,
+        alt varchar,
+        variant_id varchar,
+        clinvar_variation_id varchar,
+        clinical_significance varchar,
+        review_status varchar,
+        gold_stars int,
+        major_consequence varchar,
+        transcript_id varchar,
+        hgvsc varchar,
+        in_gnomad int
+    )"""
+
+
+def open_vcf(path):
+    """
+    Opens a plain text or (b)gzipped VCF
+    """
+    if path.endswith('.gz') or path.endswith('.bgz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def normalise_chrom(chrom):
+    """
+    gnomAD v3 uses chr1 whereas ClinVar and the gnomAD API use 1
+    """
+    return chrom[3:] if chrom.startswith('chr') else chrom
+
+
+def read_regions(regions_file):
+    """
+    Reads the tabix regions file (CHROM, POS, POS_TO) created by
+    find_utr_regions.R into sorted, merged intervals per chromosome
+
+    @param regions_file : Path to the regions file
+    @returns regions (dict) : chrom -> ([starts], [ends])
+    """
+    regions_df = pd.read_csv(
+        regions_file, sep='\t', header=None, names=['chrom', 'start', 'end']
+    )
+    regions_df['chrom'] = regions_df['chrom'].astype(str).apply(normalise_chrom)
+    regions = {}
+    for chrom, chrom_df in regions_df.sort_values(['chrom', 'start']).groupby('chrom'):
+        starts, ends = [], []
+        for start, end in zip(chrom_df['start'], chrom_df['end']):
+            if starts and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        regions[chrom] = (starts, ends)
+    return regions
+
+
+def in_regions(regions, chrom, pos):
+    """
+    Is the chrom, pos inside one of the merged regions
+    """
+    if chrom not in regions:
+        return False
+    starts, ends = regions[chrom]
+    idx = bisect.bisect_right(starts, pos) - 1
+    return idx >= 0 and pos <= ends[idx]
+
+
+def parse_info(info_str):
+    """
+    Parses the VCF INFO column into a dictionary
+    """
+    info = {}
+    for field in info_str.split(';'):
+        key, _, value = field.partition('=')
+        info[key] = value if value else True
+    return info
+
+
+def parse_vep_format(header_line):
+    """
+    Gets the CSQ field names from the ##INFO=<ID=vep,...> (gnomAD) or
+    ##INFO=<ID=CSQ,...> (VEP run on a VCF) header line
+    """
+    return header_line.split('Format: ')[1].split('"')[0].split('|')
+
+
+def choose_vep_consequence(vep_str, vep_fields, mane_transcripts):
+    """
+    Picks the consequence on the MANE transcript (or the first
+    transcript consequence otherwise) from the VEP annotations
+
+    @param vep_str : The raw INFO/vep string
+    @param vep_fields : The CSQ field names from the header
+    @param mane_transcripts : Set of unversioned MANE ENSTs
+    @returns consequence (dict)
+    """
+    consequences = [dict(zip(vep_fields, csq.split('|'))) for csq in vep_str.split(',')]
+    transcript_csqs = [
+        csq for csq in consequences if csq.get('Feature', '').startswith('ENST')
+    ]
+    for csq in transcript_csqs:
+        if csq['Feature'].split('.')[0] in mane_transcripts:
+            csq['is_mane_select'] = 1
+            return csq
+    if transcript_csqs:
+        transcript_csqs[0]['is_mane_select'] = 0
+        return transcript_csqs[0]
+    return {'is_mane_select': 0}
+
+
+def none_if_empty(value):
+    """
+    VEP and ClinVar use empty strings and '.' as missing values
+    """
+    return None if value in ('', '.', None) else value
+
+
+def transcript_hgvsc(csq):
+    """
+    @returns the (transcript_id, hgvsc) of a VEP consequence, the HGVSc
+    without its transcript prefix as in the gnomAD API
+    """
+    hgvsc = none_if_empty(csq.get('HGVSc'))
+    return none_if_empty(csq.get('Feature')), hgvsc.split(':')[-1] if hgvsc else None
+
+
+def to_number(value, convert, default=None):
+    """
+    Converts an INFO value, default for the VCF missing values ('.' and
+    the empty values parse_info reads as flags)
+    """
+    if value is True or none_if_empty(value) is None:
+        return default
+    return convert(value)
+
+
+def read_gnomad_vcf(path, regions, mane_transcripts):
+    """
+    Yields the gnomAD rows that fall inside the 5' UTR regions
+    """
+    vep_fields = []
+    with open_vcf(path) as vcf:
+        for line in vcf:
+            if line.startswith('##INFO=<ID=vep'):
+                vep_fields = parse_vep_format(line)
+                continue
+            if line.startswith('#'):
+                continue
+            chrom, pos, rsid, ref, alt, _qual, _filter, info_str = line.rstrip(
+                '\n'
+            ).split('\t')[0:8]
+            chrom, pos = normalise_chrom(chrom), int(pos)
+            if alt == '.' or not in_regions(regions, chrom, pos):
+                continue
+            info = parse_info(info_str)
+            csq = (
+                choose_vep_consequence(info['vep'], vep_fields, mane_transcripts)
+                if 'vep' in info
+                else {'is_mane_select': 0}
+            )
+            transcript_id, hgvsc = transcript_hgvsc(csq)
+            yield (
+                chrom,
+                pos,
+                ref,
+                alt,
+                f'{chrom}-{pos}-{ref}-{alt}',
+                none_if_empty(rsid),
+                to_number(info.get('AC'), int, 0),
+                to_number(info.get('AN'), int, 0),
+                to_number(info.get('AF'), float),
+                transcript_id,
+                hgvsc,
+                none_if_empty(csq.get('Consequence', '').split('&')[0]),
+                none_if_empty(csq.get('SIFT')),
+                none_if_empty(csq.get('PolyPhen')),
+                csq['is_mane_select'],
+            )
+
+
+def read_clinvar_vcf(path, regions, mane_transcripts):
+    """
+    Yields the ClinVar rows that fall inside the 5' UTR regions
+    The transcript and HGVSc come from the VEP annotation (CSQ or vep) of
+    a ClinVar VCF run through VEP, and are otherwise filled in from gnomAD
+    once both are ingested (see fill_clinvar_transcripts)
+    """
+    vep_key, vep_fields = None, []
+    with open_vcf(path) as vcf:
+        for line in vcf:
+            if line.startswith('##INFO=<ID=CSQ') or line.startswith('##INFO=<ID=vep'):
+                vep_key = line[len('##INFO=<ID='):].split(',')[0]
+                vep_fields = parse_vep_format(line)
+                continue
+            if line.startswith('#'):
+                continue
+            chrom, pos, variation_id, ref, alt, _qual, _filter, info_str = line.rstrip(
+                '\n'
+            ).split('\t')[0:8]
+            chrom, pos = normalise_chrom(chrom), int(pos)
+            if alt == '.' or not in_regions(regions, chrom, pos):
+                continue
+            info = parse_info(info_str)
+            review_status = info.get('CLNREVSTAT', '').replace('_', ' ')
+            clinical_significance = info.get('CLNSIG', '').replace('_', ' ')
+            # MC=SO:0001623|5_prime_UTR_variant,SO:...
+            major_consequence = info.get('MC', '').split(',')[0].partition('|')[2]
+            transcript_id, hgvsc = (
+                transcript_hgvsc(
+                    choose_vep_consequence(info[vep_key], vep_fields, mane_transcripts)
+                )
+                if vep_key in info
+                else (None, None)
+            )
+            yield (
+                chrom,
+                pos,
+                ref,
+                alt,
+                f'{chrom}-{pos}-{ref}-{alt}',
+                variation_id,
+                none_if_empty(clinical_significance),
+                none_if_empty(review_status),
+                GOLD_STARS.get(review_status, 0),
+                none_if_empty(major_consequence),
+                transcript_id,
+                hgvsc,
+                0,
+            )
+
+
+def fill_clinvar_transcripts(conn):
+    """
+    Gives the ClinVar variants without a VEP annotation the transcript and
+    HGVSc of the same variant in gnomAD
+    """
+    conn.execute(
+        """
+        UPDATE clinvar_variants SET (transcript_id, hgvsc) = (
+            SELECT transcript_id, hgvsc FROM gnomad_variants
+            WHERE gnomad_variants.variant_id = clinvar_variants.variant_id
+            LIMIT 1
+        )
+        WHERE hgvsc IS NULL AND in_gnomad = 1
+        """
+    )
+
+
+def insert_in_batches(conn, table, rows, n_cols, batch_size):
+    """
+    Inserts the generated rows in batches of batch_size
+    """
+    placeholders = ', '.join(['?'] * n_cols)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            conn.executemany(f'INSERT INTO {table} VALUES ({placeholders})', batch)
+            conn.commit()
+            batch = []
+    if batch:
+        conn.executemany(f'INSERT INTO {table} VALUES ({placeholders})', batch)
+        conn.commit()
+
+
+def main(args):
+    """Entry point"""
+    if os.path.isfile(args.db_name) and not args.overwrite:
+        print(f'Database already exists at {args.db_name}')
+        sys.exit(0)
+    if os.path.isfile(args.db_name):
+        os.remove(args.db_name)
+
+    regions = read_regions(args.regions)
+    mane_summary_df = pd.read_csv(args.mane_file, sep='\t')
+    mane_transcripts = set(mane_summary_df['Ensembl_nuc'].str.split('.').str[0])
+
+    conn = sqlite3.connect(args.db_name)
+    conn.execute(GNOMAD_TABLE)
+    conn.execute(CLINVAR_TABLE)
+
+    for vcf_path in tqdm.tqdm(args.gnomad_vcf):
+        if args.verbose:
+            print(f'Ingesting gnomAD sites from {vcf_path}')
+        insert_in_batches(
+            conn,
+            'gnomad_variants',
+            read_gnomad_vcf(vcf_path, regions, mane_transcripts),
+            15,
+            args.batch_size,
+        )
+
+    for vcf_path in tqdm.tqdm(args.clinvar_vcf):
+        if args.verbose:
+            print(f'Ingesting ClinVar variants from {vcf_path}')
+        insert_in_batches(
+            conn,
+            'clinvar_variants',
+            read_clinvar_vcf(vcf_path, regions, mane_transcripts),
+            13,
+            args.batch_size,
+        )
+
+    print('Creating region indexes')
+    conn.execute('CREATE INDEX idx_gnomad_region ON gnomad_variants (chrom, pos)')
+    conn.execute('CREATE INDEX idx_clinvar_region ON clinvar_variants (chrom, pos)')
+    conn.execute(
+        'CREATE INDEX idx_gnomad_variant_id ON gnomad_variants (variant_id)'
+    )
+
+    # Flag the ClinVar variants that are also in gnomAD
+    conn.execute(
+        """
+        UPDATE clinvar_variants SET in_gnomad = 1
+        WHERE variant_id IN (SELECT variant_id FROM gnomad_variants)
+        """
+    )
+    fill_clinvar_transcripts(conn)
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.execute('VACUUM')
+    conn.close()
+    print(f'Completed creating population store {args.db_name}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Ingests gnomAD and ClinVar variants in the 5\' UTRs into sqlite3'
+    )
+    parser.add_argument(
+        '--db_name',
+        required=True,
+        type=str,
+        help='Output sqlite3 file name and location',
+    )
+    parser.add_argument(
+        '--regions',
+        required=True,
+        type=str,
+        help='Tabix regions file of the MANE 5\' UTRs (from find_utr_regions.R)',
+    )
+    parser.add_argument(
+        '--mane_file',
+        required=True,
+        type=str,
+        help='MANE summary file, used to pick the MANE consequence from VEP',
+    )
+    parser.add_argument(
+        '--gnomad_vcf',
+        nargs='+',
+        default=[],
+        type=str,
+        help='gnomAD sites VCF(s), ideally already subset with tabix -R',
+    )
+    parser.add_argument(
+        '--clinvar_vcf',
+        nargs='+',
+        default=[],
+        type=str,
+        help='ClinVar VCF(s), ideally already subset with tabix -R (and run '
+        'through VEP for the transcript HGVSc of the variants not in gnomAD)',
+    )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=10000,
+        help='Number of rows to insert per transaction',
+    )
+    parser.add_argument(
+        '--overwrite',
+        action='store_true',
+        help='Overwrite existing database if exists',
+    )
+    parser.add_argument(
+        '--verbose',
+        action='store_true',
+        help='Verbose outputs',
+    )
+    main(args=parser.parse_args())
@@ -0,0 +1,92 @@
+"""
+Precomputes the distribution of the translational efficiency of the ORFs
+of the features database, as quantiles (te_quantiles) and a histogram
+(te_histogram), so that the server ranks an ORF's efficiency among all
+of them without reading the whole orf_features table, see
+server/flask-app/app/reference_data.py
+
+Run again whenever orf_features changes
+
+Usage : python3 te_distribution.py --features_db features.db
+        python3 te_distribution.py --features_db features.db
+            --quantiles 10000 --bins 100
+"""
+
+import argparse
+import sqlite3
+
+# A copy of the server's module (see sync_shared_modules.py)
+import reference_data  # pylint: disable=E0401
+
+
+def write_distribution(conn, distribution):
+    """
+    Replaces the te_quantiles and te_histogram tables
+    """
+    n_quantiles = len(distribution.quantiles) - 1
+    conn.execute('DROP TABLE IF EXISTS te_quantiles')
+    conn.execute('DROP TABLE IF EXISTS te_histogram')
+    conn.execute(
+        'CREATE TABLE te_quantiles (quantile real PRIMARY KEY, efficiency real)'
+    )
+    conn.execute(
+        'CREATE TABLE te_histogram (bin_start real, bin_end real, orfs integer)'
+    )
+    conn.executemany(
+        'INSERT INTO te_quantiles VALUES (?, ?)',
+        [
+            (i / n_quantiles, efficiency)
+            for i, efficiency in enumerate(distribution.quantiles)
+        ],
+    )
+    conn.executemany(
+        'INSERT INTO te_histogram VALUES (?, ?, ?)',
+        zip(distribution.edges, distribution.edges[1:], distribution.counts),
+    )
+
+
+def main(args):
+    """Entry point"""
+    conn = sqlite3.connect(args.features_db)
+    distribution = reference_data.TEDistribution.from_values(
+        (value for (value,) in conn.execute('SELECT efficiency FROM orf_features')),
+        n_quantiles=args.quantiles,
+        n_bins=args.bins,
+    )
+    write_distribution(conn, distribution)
+
+    # The server looks ORFs up by id to rank them
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_orf_features_orf_id ON orf_features (orf_id)'
+    )
+    conn.commit()
+    conn.close()
+    print(
+        f'{len(distribution)} ORF efficiencies in {len(distribution.quantiles)} '
+        f'quantiles and {len(distribution.counts)} histogram bins'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Precomputes the translational efficiency distribution'
+    )
+    parser.add_argument(
+        '--features_db',
+        required=True,
+        type=str,
+        help='Features sqlite3 database (the distribution is written here)',
+    )
+    parser.add_argument(
+        '--quantiles',
+        type=int,
+        default=1000,
+        help='Number of quantile intervals, the precision of the ranks (Default: 1000)',
+    )
+    parser.add_argument(
+        '--bins',
+        type=int,
+        default=50,
+        help='Number of histogram bins (Default: 50)',
+    )
+    main(args=parser.parse_args())
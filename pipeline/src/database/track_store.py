@@ -0,0 +1,112 @@
+"""
+Packed per base score tracks (conservation and CADD)
+
+The scores of every transcript are stored in one file as little endian
+float32 arrays, one after the other for each track, so that the server
+can memory map the file and slice a transcript's tracks without reading
+or copying them
+
+    MAGIC | header length (uint32) | header (JSON) | data
+
+The header holds the track names and, per transcript, the offset of its
+arrays in the data (in values), the transcript position of the first
+value and the number of positions. Positions without a score are NaN
+
+This module only depends on numpy so that the pipeline can keep a copy of
+it (see sync_shared_modules.py)
+"""
+
+import json
+import os
+import shutil
+import struct
+
+import numpy as np  # pylint: disable=E0401
+
+MAGIC = b"VUTRTRK1"
+DTYPE = np.dtype("<f4")
+TRACKS = ("phastcons", "phylop", "gerp_s", "phred_cadd", "raw_cadd")
+# The data starts on a multiple of this
+ALIGNMENT = 64
+
+
+def pack_transcript(tpos, scores, tracks=TRACKS):
+    """
+    Lays out the scores of a transcript as dense arrays over its positions
+    @param tpos : transcript positions
+    @param scores : dictionary of track -> the scores at each tpos
+    @returns (first tpos, array of shape (len(tracks), n positions))
+    """
+    tpos = np.asarray(tpos, dtype=np.int64)
+    tpos_start = int(tpos.min())
+    packed = np.full((len(tracks), int(tpos.max()) - tpos_start + 1), np.nan, DTYPE)
+    for i, track in enumerate(tracks):
+        # (None becomes NaN)
+        packed[i, tpos - tpos_start] = np.asarray(scores[track], dtype=np.float64)
+    return tpos_start, packed
+
+
+def write_track_store(path, transcripts, tracks=TRACKS):
+    """
+    Writes a track store
+    @param transcripts : iterable of (ensembl_transcript_id, tpos, scores)
+    as taken by pack_transcript
+    @returns the number of transcripts written
+    """
+    index = {}
+    offset = 0
+    data_path = path + ".data"
+    with open(data_path, "wb") as data:
+        for enst, tpos, scores in transcripts:
+            tpos_start, packed = pack_transcript(tpos, scores, tracks)
+            data.write(packed.tobytes())
+            index[enst] = [offset, tpos_start, packed.shape[1]]
+            offset += packed.size
+
+    header = json.dumps({"tracks": list(tracks), "transcripts": index}).encode()
+    # Pad the header with whitespace so that the data is aligned
+    header += b" " * (-(len(MAGIC) + 4 + len(header)) % ALIGNMENT)
+    with open(path, "wb") as out, open(data_path, "rb") as data:
+        out.write(MAGIC)
+        out.write(struct.pack("<I", len(header)))
+        out.write(header)
+        shutil.copyfileobj(data, out)
+    os.remove(data_path)
+    return len(index)
+
+
+class TrackStore:
+    """
+    A memory mapped track store
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as store:
+            if store.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a track store")
+            (header_size,) = struct.unpack("<I", store.read(4))
+            header = json.loads(store.read(header_size))
+        self.path = path
+        self.tracks = header["tracks"]
+        self.index = header["transcripts"]
+        data_offset = len(MAGIC) + 4 + header_size
+        if os.path.getsize(path) > data_offset:
+            self.data = np.memmap(path, dtype=DTYPE, mode="r", offset=data_offset)
+        else:
+            self.data = np.empty(0, DTYPE)
+
+    def get(self, ensembl_transcript_id, tracks=None):
+        """
+        Gets the tracks of a transcript, as read only views of the file
+        @param tracks : the track names to return (default all)
+        @returns (first tpos, dictionary of track -> array) or None if
+        the transcript has no scores
+        """
+        if ensembl_transcript_id not in self.index:
+            return None
+        offset, tpos_start, length = self.index[ensembl_transcript_id]
+        return tpos_start, {
+            track: self.data[offset + i * length : offset + (i + 1) * length]
+            for i, track in enumerate(self.tracks)
+            if tracks is None or track in tracks
+        }
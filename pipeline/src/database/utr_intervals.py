@@ -0,0 +1,100 @@
+"""
+The cDNA intervals the viewer draws for the UTRannotator consequences
+(uAUG_gained, uAUG_lost, uSTOP_lost, uSTOP_gained and uFrameShift)
+
+A bound of an interval comes from the variant's annotation, the start
+site of the transcript and the buffer the viewer draws past it. The
+start site and buffer only enter a bound in a few fixed ways, by
+consequence, so the variant store keeps each bound with them taken out
+(the interval_start and interval_end columns written by
+pipeline/src/database/variant_store.py). The server adds them back with
+resolve_interval, without parsing the annotation
+
+An end of None is an open interval, one whose distance is NA in the
+annotation and so runs on into the buffer
+
+This module has no dependencies, so that the pipeline can keep a copy of
+it (see sync_shared_modules.py)
+"""
+
+CONSEQUENCES = ("uAUG_gained", "uAUG_lost", "uSTOP_lost", "uSTOP_gained", "uFrameShift")
+# Consequences whose start / closed end are counted back from the start site
+START_FROM_START_SITE = ("uSTOP_gained", "uFrameShift")
+END_FROM_START_SITE = ("uAUG_lost", "uSTOP_gained", "uFrameShift")
+
+
+def cdna_start(cdna_pos):
+    """
+    @returns the first position of a VEP cDNA_position (e.g. 120-121)
+    """
+    cdna_pos = str(cdna_pos)
+    return int(cdna_pos.split("-")[0]) if "-" in cdna_pos else int(cdna_pos)
+
+
+def _distance(value):
+    """
+    @returns an annotation distance, None if it is NA
+    """
+    return None if value == "NA" else int(value)
+
+
+def interval_offsets(consequence, annotation, cdna_pos):
+    """
+    The interval of a consequence without the start site and buffer
+    @param annotation : the UTRannotator annotation (dictionary)
+    @param cdna_pos : the variant's cDNA_position
+    @returns (start, end), None for other consequences
+    @raises KeyError / ValueError if the annotation lacks a distance
+    """
+    if consequence == "uAUG_gained":
+        start = cdna_start(cdna_pos)
+        distance = _distance(annotation["uAUG_gained_DistanceToStop"])
+        return start, None if distance is None else start + distance
+
+    if consequence == "uAUG_lost":
+        distance = _distance(annotation["uAUG_lost_DistanceToCDS"])
+        return (
+            int(annotation["uAUG_lost_CapDistanceToStart"]),
+            None if distance is None else -distance,
+        )
+
+    if consequence == "uSTOP_lost":
+        if annotation["uSTOP_lost_AltStop"] == "True":
+            return (
+                cdna_start(cdna_pos),
+                int(annotation["uSTOP_lost_AltStopDistanceToCDS"]),
+            )
+        return cdna_start(cdna_pos), None
+
+    if consequence == "uSTOP_gained":
+        distance = _distance(annotation["uSTOP_gained_newSTOPDistanceToCDS"])
+        return (
+            -int(annotation["uSTOP_gained_ref_StartDistanceToCDS"]),
+            None if distance is None else -distance,
+        )
+
+    if consequence == "uFrameShift":
+        start = -int(annotation["uFrameShift_ref_StartDistanceToCDS"])
+        length = _distance(annotation["uFrameShift_alt_type_length"])
+        return start, None if length is None else start + length
+
+    return None
+
+
+def resolve_interval(consequence, start, end, start_site, buffer_length):
+    """
+    Adds the start site and buffer back to the bounds of interval_offsets
+    @param start_site, buffer_length : integers
+    @returns (start, end) cDNA positions
+    """
+    if consequence in START_FROM_START_SITE:
+        start += start_site
+    if end is not None:
+        return start, end + start_site if consequence in END_FROM_START_SITE else end
+
+    if consequence in ("uAUG_gained", "uFrameShift"):
+        return start, start + start_site + buffer_length
+    if consequence == "uSTOP_lost":
+        return start, start_site + buffer_length
+    # The start site less a distance of start_site + buffer_length
+    return start, -buffer_length
@@ -6,34 +6,353 @@ import sqlite3
 import argparse
 import os
 import sys
-import json
 import tqdm
+import numpy as np
 import pandas as pd
 
-def parse_five_prime_utr_variant_consequence(conseq_str):
-    return {
-        annotation.split(':')[0]: annotation.split(':')[1]
-        for annotation in conseq_str.split(',')
-    }
+# Copies of the server's modules (see sync_shared_modules.py), which read
+# what this writes
+import variant_codec  # pylint: disable=E0401
+import utr_intervals  # pylint: disable=E0401
+
+VARIANT_ANNOTATIONS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS variant_annotations (
+        ensembl_transcript_id varchar,
+        variant_id varchar,
+        cdna_pos int,
+        five_prime_UTR_variant_consequence varchar,
+        five_prime_UTR_variant_annotation varchar,
+        annotations blob,
+        interval_start int,
+        interval_end int,
+        cdna_start int
+    )"""
+
 
 def convert_uploaded_variation_to_variant_id(uploaded_variation):
     return uploaded_variation.replace('_', '-').replace('/', '-')
 
-def process_batch(batch_df, c):
-    rows = []
-    for _, row in batch_df.iterrows():
-        variant_conseq = row.to_dict()
-        rows.append((
-            variant_conseq['Feature'],
-            convert_uploaded_variation_to_variant_id(variant_conseq['#Uploaded_variation']),
-            variant_conseq['cDNA_position'],
+
+def utr_interval(consequence, annotation, cdna_pos):
+    """
+    The interval_start and interval_end of a variant (see the server's
+    utr_intervals.py)
+    @returns (None, None) if its consequence has no interval or its
+    annotation lacks a distance (the server then works it out per request)
+    """
+    try:
+        offsets = utr_intervals.interval_offsets(
+            consequence, variant_codec.parse_utr_annotation(annotation), cdna_pos
+        )
+    except (KeyError, TypeError, ValueError):
+        offsets = None
+    return offsets or (None, None)
+
+
+def cdna_start(cdna_pos):
+    """
+    The first position of a VEP cDNA_position, which is a range for indels
+    (e.g. 120-121) and so is stored as text, for the server to filter and
+    sort the variants of a window by
+    @returns None if it has no first position (e.g. ?-121)
+    """
+    try:
+        return utr_intervals.cdna_start(cdna_pos)
+    except ValueError:
+        return None
+
+
+def variant_row(variant_conseq, codec):
+    """
+    The variant_annotations row of a VEP row : the fields the server reads
+    as typed columns, the rest of the VEP row as a compressed blob (see
+    variant_codec.py), the precomputed UTR consequence interval and the
+    first cDNA position
+    """
+    return (
+        variant_conseq['Feature'],
+        convert_uploaded_variation_to_variant_id(variant_conseq['#Uploaded_variation']),
+        variant_conseq['cDNA_position'],
+        variant_conseq['five_prime_UTR_variant_consequence'],
+        variant_conseq['five_prime_UTR_variant_annotation'],
+        codec.encode(variant_conseq),
+        *utr_interval(
             variant_conseq['five_prime_UTR_variant_consequence'],
-            json.dumps(parse_five_prime_utr_variant_consequence(variant_conseq['five_prime_UTR_variant_annotation'])),
-            json.dumps(variant_conseq),
-        ))
-    c.executemany('INSERT INTO variant_annotations VALUES (?, ?, ?, ?, ?, ?)', rows)
+            variant_conseq['five_prime_UTR_variant_annotation'],
+            variant_conseq['cDNA_position'],
+        ),
+        cdna_start(variant_conseq['cDNA_position']),
+    )
+
+
+def process_batch(batch_df, c, codec):
+    """
+    Stores a batch of VEP rows
+    """
+    rows = [variant_row(row.to_dict(), codec) for _, row in batch_df.iterrows()]
+    c.executemany(
+        'INSERT INTO variant_annotations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows
+    )
+
+
+def add_intervals(conn):
+    """
+    Adds the interval_start, interval_end and cdna_start columns to a store
+    built without them, from its typed columns
+    """
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(variant_annotations)')]
+    if 'interval_start' not in columns:
+        conn.execute('ALTER TABLE variant_annotations ADD COLUMN interval_start int')
+        conn.execute('ALTER TABLE variant_annotations ADD COLUMN interval_end int')
+    if 'cdna_start' not in columns:
+        conn.execute('ALTER TABLE variant_annotations ADD COLUMN cdna_start int')
+    rows = conn.execute("""
+        SELECT rowid, five_prime_UTR_variant_consequence,
+            five_prime_UTR_variant_annotation, cdna_pos
+        FROM variant_annotations""")
+    print('Computing the UTR consequence intervals and first cDNA positions')
+    conn.executemany(
+        """
+        UPDATE variant_annotations
+        SET interval_start = ?, interval_end = ?, cdna_start = ?
+        WHERE rowid = ?""",
+        (
+            (
+                *utr_interval(consequence, annotation, cdna_pos),
+                cdna_start(cdna_pos),
+                rowid,
+            )
+            for rowid, consequence, annotation, cdna_pos in tqdm.tqdm(rows.fetchall())
+        ),
+    )
+    conn.commit()
+
+
+def sample_variants(chunks, sample_size=10000, seed=0):
+    """
+    Draws a uniform sample of the rows of the whole variant file, read a
+    batch (DataFrame) at a time. Its first rows are all of one chromosome
+    and a few genes, so they make a poor preset dictionary for the rest
+    """
+    rng = np.random.default_rng(seed)
+    sample = None
+    print(f'Sampling {sample_size} variants for the annotations dictionary')
+    for chunk_df in tqdm.tqdm(chunks):
+        chunk_df = chunk_df.assign(sample_key=rng.random(len(chunk_df)))
+        sample = chunk_df if sample is None else pd.concat([sample, chunk_df])
+        sample = sample.nsmallest(sample_size, 'sample_key')
+    return sample.drop(columns='sample_key')
+
+
+def create_codec(sample_df, c):
+    """
+    Creates the codec from a sample of the variant file and saves it in
+    store_metadata
+    """
+    codec = variant_codec.AnnotationCodec.from_sample(
+        [row.to_dict() for _, row in sample_df.iterrows()]
+    )
+    c.execute('DROP TABLE IF EXISTS store_metadata')
+    c.execute('CREATE TABLE store_metadata (key varchar PRIMARY KEY, value blob)')
+    c.executemany('INSERT INTO store_metadata VALUES (?, ?)', codec.metadata())
+    return codec
+
+
+def create_search_index(conn):
+    """
+    Builds the typeahead index used by /viewer/possible_variants
+
+    Every variant of a transcript is on the same chromosome, so the key is
+    the upper cased variant id without the chromosome (e.g. 150904976-T-A)
+    and partial ids are answered with a range scan on
+    (ensembl_transcript_id, search_key)
+    """
+    print('Creating variant search index')
+    conn.execute('DROP TABLE IF EXISTS variant_search')
+    conn.execute("""
+        CREATE TABLE variant_search (
+            ensembl_transcript_id varchar,
+            search_key varchar,
+            variant_id varchar,
+            PRIMARY KEY (ensembl_transcript_id, search_key)
+        ) WITHOUT ROWID""")
+    conn.execute("""
+        INSERT OR IGNORE INTO variant_search
+        SELECT ensembl_transcript_id,
+            upper(substr(variant_id, instr(variant_id, '-') + 1)) AS search_key,
+            variant_id
+        FROM variant_annotations
+        ORDER BY ensembl_transcript_id, search_key""")
+    conn.commit()
+
+
+# The queries the server makes, for the query plans in the report
+SERVER_QUERIES = {
+    'transcript variants': (
+        'SELECT variant_id, cdna_pos, five_prime_UTR_variant_consequence, '
+        'five_prime_UTR_variant_annotation, interval_start, interval_end '
+        'FROM variant_annotations WHERE ensembl_transcript_id = ?'
+    ),
+    'first variants': (
+        'SELECT variant_id FROM variant_annotations '
+        'WHERE ensembl_transcript_id = ? LIMIT 5'
+    ),
+    'utr impact': (
+        'SELECT cdna_pos, five_prime_UTR_variant_consequence, '
+        'five_prime_UTR_variant_annotation, interval_start, interval_end '
+        'FROM variant_annotations WHERE ensembl_transcript_id = ? AND variant_id = ?'
+    ),
+    'variant transcripts': (
+        'SELECT ensembl_transcript_id FROM variant_annotations WHERE variant_id = ?'
+    ),
+    'variants window': (
+        'SELECT variant_id, cdna_pos, cdna_start, five_prime_UTR_variant_consequence '
+        'FROM variant_annotations '
+        'WHERE ensembl_transcript_id = ? AND cdna_start BETWEEN ? AND ? '
+        'AND (cdna_start, variant_id, '
+        "COALESCE(five_prime_UTR_variant_consequence, '')) > (?, ?, ?) "
+        'ORDER BY cdna_start, variant_id, '
+        "COALESCE(five_prime_UTR_variant_consequence, '') LIMIT ?"
+    ),
+    'batch annotations': (
+        'SELECT ensembl_transcript_id, variant_id, cdna_pos, '
+        'five_prime_UTR_variant_consequence, five_prime_UTR_variant_annotation, '
+        'interval_start, interval_end FROM variant_annotations '
+        'WHERE variant_id IN (SELECT value FROM json_each(?))'
+    ),
+    'typeahead': (
+        'SELECT variant_id FROM variant_search WHERE ensembl_transcript_id = ? '
+        'AND search_key >= ? AND search_key < ? LIMIT 10'
+    ),
+}
+
+
+def finalise(conn, page_size):
+    """
+    Optimises the store once it has been ingested, as it is only ever read
+
+    - Rewrites variant_annotations in (ensembl_transcript_id, variant_id)
+      order, so the rows of a transcript sit on neighbouring pages
+    - Indexes the transcript and variant lookups and the cDNA ordered
+      variant windows (only the first variants and variant transcripts
+      lookups are covered, the others read the table rows)
+    - ANALYZEs for the query planner
+    - VACUUMs into the given page size (WAL has to be off to change it)
+    """
+    print('Sorting variant_annotations by transcript')
+    (schema,) = conn.execute(
+        "SELECT sql FROM sqlite_master "
+        "WHERE type='table' AND name='variant_annotations'"
+    ).fetchone()
+    conn.execute('DROP TABLE IF EXISTS variant_annotations_sorted')
+    conn.execute(schema.replace('variant_annotations', 'variant_annotations_sorted', 1))
+    conn.execute("""
+        INSERT INTO variant_annotations_sorted
+        SELECT * FROM variant_annotations
+        ORDER BY ensembl_transcript_id, variant_id""")
+    conn.execute('DROP TABLE variant_annotations')
+    conn.execute('ALTER TABLE variant_annotations_sorted RENAME TO variant_annotations')
+
+    print('Creating indexes')
+    # Transcript -> variants (first variants, typeahead fallback and the
+    # seek for the per transcript and per variant annotation lookups)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_variant_annotations_transcript
+        ON variant_annotations (ensembl_transcript_id, variant_id)""")
+    # Variant -> transcripts
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_variant_annotations_variant
+        ON variant_annotations (variant_id, ensembl_transcript_id)""")
+    # Transcript -> variants in the order of the viewer's windows, on the
+    # sort key of the server's query so that the pages aren't sorted
+    # (stores from before cdna_start need --intervals_only first)
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(variant_annotations)')]
+    if 'cdna_start' in columns:
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_variant_annotations_window
+            ON variant_annotations (
+                ensembl_transcript_id, cdna_start, variant_id,
+                COALESCE(five_prime_UTR_variant_consequence, '')
+            )""")
+    conn.commit()
+
+    print('Analyzing')
+    conn.execute('ANALYZE')
+    conn.commit()
+
+    print(f'Vacuuming with a page size of {page_size}')
+    conn.execute('PRAGMA journal_mode = DELETE')
+    conn.execute(f'PRAGMA page_size = {int(page_size)}')
+    conn.execute('VACUUM')
+
+
+def write_report(conn, report_file):
+    """
+    Writes the table / index sizes and the query plan of each server query
+    """
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    lines = [
+        f'page_size: {page_size}',
+        f'page_count: {page_count}',
+        f'size: {page_size * page_count / 2**20:.1f} MiB',
+        '',
+        'Table and index sizes',
+    ]
+    try:
+        sizes = conn.execute(
+            'SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY 2 DESC'
+        ).fetchall()
+        lines += [f'  {name}: {size / 2**20:.1f} MiB' for name, size in sizes]
+    except sqlite3.OperationalError:
+        lines.append('  (sqlite3 was built without the dbstat virtual table)')
+
+    try:
+        zdict, blob_size = conn.execute(
+            """
+            SELECT (SELECT length(value) FROM store_metadata WHERE key = 'zdict'),
+                (SELECT AVG(length(annotations)) FROM variant_annotations)"""
+        ).fetchone()
+        lines += [
+            '',
+            f'Annotations dictionary: {zdict} of {variant_codec.ZDICT_SIZE} bytes',
+            f'Mean annotations size: {blob_size or 0:.1f} bytes',
+        ]
+    except sqlite3.OperationalError:
+        lines += ['', 'Annotations dictionary: none (a store of the JSON format)']
+
+    lines += ['', 'Query plans']
+    for name, query in SERVER_QUERIES.items():
+        params = [''] * query.count('?')
+        lines.append(f'  {name}: {query}')
+        lines += [
+            f'    {row[3]}'
+            for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params)
+        ]
+
+    report = '\n'.join(lines) + '\n'
+    with open(report_file, 'w', encoding='utf-8') as f:
+        f.write(report)
+    print(report)
+
 
 def main(args):
+    if args.search_index_only or args.finalise_only or args.intervals_only:
+        conn = sqlite3.connect(args.db_name)
+        if args.intervals_only:
+            add_intervals(conn)
+        if args.search_index_only:
+            create_search_index(conn)
+        if args.finalise_only:
+            finalise(conn, args.page_size)
+            write_report(conn, args.report or f'{args.db_name}.report.txt')
+        conn.close()
+        return
+
+    if not args.variant_file:
+        print('--variant_file is required to build the database')
+        sys.exit(1)
+
     if os.path.isfile(args.db_name) and not args.overwrite:
         print(f'Database already exists at {args.db_name}')
         sys.exit(0)
@@ -43,30 +362,84 @@ def main(args):
     c = conn.cursor()
 
     print(f'Creating table variant table in database {args.db_name}')
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS variant_annotations (
-            ensembl_transcript_id varchar,
-            variant_id varchar,
-            cdna_pos int,
-            five_prime_UTR_variant_consequence varchar,
-            five_prime_UTR_variant_annotation data,
-            annotations data
-        )"""
-    )
+    c.execute(VARIANT_ANNOTATIONS_SCHEMA)
     print(f'Completed creating tables')
 
     batch_size = 10000  # Adjust the batch size based on available memory
+    sample_df = sample_variants(
+        pd.read_csv(args.variant_file, sep='\t', chunksize=batch_size)
+    )
+    codec = create_codec(sample_df, c)
     chunk_iter = pd.read_csv(args.variant_file, sep='\t', chunksize=batch_size)
     for chunk_df in tqdm.tqdm(chunk_iter):
-        process_batch(chunk_df, c)
+        process_batch(chunk_df, c, codec)
         conn.commit()
 
+    create_search_index(conn)
+    finalise(conn, args.page_size)
+    write_report(conn, args.report or f'{args.db_name}.report.txt')
     conn.close()
 
+
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Ingresses all variant data into a sqlite3 database')
-    parser.add_argument('--db_name', required=True, type=str, help='Output sqlite3 file name and location')
-    parser.add_argument('--variant_file', required=True, type=str, help='The variant tsv file to be ingested')
-    parser.add_argument('--overwrite', action='store_true', help='Overwrite existing database if exists')
-    parser.add_argument('--verbose', action='store_true', help='Verbose outputs')
+    parser = argparse.ArgumentParser(
+        description='Ingresses all variant data into a sqlite3 database'
+    )
+    parser.add_argument(
+        '--db_name',
+        required=True,
+        type=str,
+        help='Output sqlite3 file name and location',
+    )
+    parser.add_argument(
+        '--variant_file',
+        required=False,
+        type=str,
+        help=(
+            'The variant tsv file to be ingested '
+            '(required unless --search_index_only)'
+        ),
+    )
+    parser.add_argument(
+        '--overwrite',
+        action='store_true',
+        help='Overwrite existing database if exists',
+    )
+    parser.add_argument(
+        '--search_index_only',
+        action='store_true',
+        help='Only (re)build the variant search index of an existing database',
+    )
+    parser.add_argument(
+        '--intervals_only',
+        action='store_true',
+        help=(
+            'Only add the UTR consequence intervals and first cDNA positions to an '
+            'existing database (then run --finalise_only to compact it)'
+        ),
+    )
+    parser.add_argument(
+        '--finalise_only',
+        action='store_true',
+        help='Only sort, index, analyze and vacuum an existing database',
+    )
+    parser.add_argument(
+        '--page_size',
+        type=int,
+        default=16384,
+        help='Page size of the finalised database (Default: 16384)',
+    )
+    parser.add_argument(
+        '--report',
+        type=str,
+        help=(
+            'Where to write the index size / query plan report '
+            '(Default: <db_name>.report.txt)'
+        ),
+    )
+    parser.add_argument(
+        '--verbose',
+        action='store_true',
+        help='Verbose outputs',
+    )
     main(args=parser.parse_args())
@@ -0,0 +1,210 @@
+"""
+Materialises the static data shown on the viewer page for every MANE
+transcript as one compressed "viewer bundle" row in the features database,
+so that the server can render a page from a single key lookup
+
+Run after both databases have been built (the bundles need rebuilding
+whenever either database is)
+
+Usage : python3 viewer_bundles.py --features_db features.db
+            --variant_db variant_store.db --overwrite
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import zlib
+import tqdm
+
+# Bump when the shape of the bundle changes, along with BUNDLE_VERSION in the
+# server's helpers.py (which rebuilds other versions from the tables)
+# 2 : The conservation scores are read from the track store instead
+# 3 : Only the few example variant ids, not all_possible_variants
+BUNDLE_VERSION = 3
+
+
+def dict_factory(cursor, row):
+    """
+    converts rows into dictionaries
+    """
+    return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+
+
+def fetch_value(conn, query, params, key, default=None):
+    """
+    Gets a single column from the first row of the query
+    """
+    row = conn.execute(query, params).fetchone()
+    return row[key] if row is not None else default
+
+
+def build_bundle(features, variants, summary):
+    """
+    Collects the static data for the viewer page of a transcript,
+    mirroring build_viewer_bundle in the server's helpers.py
+
+    @param features : Connection to the features database
+    @param variants : Connection to the variant database
+    @param summary : The transcript's mane_summary row
+    @returns bundle (dict)
+    """
+    enst = summary['ensembl_transcript_id']
+    ensg = summary['ensembl_gene_id']
+    hgnc = summary['hgnc_symbol']
+
+    return {
+        'bundle_version': BUNDLE_VERSION,
+        'ensembl_transcript_id': enst,
+        'ensembl_gene_id': ensg,
+        'hgnc': hgnc,
+        'name': summary['name'],
+        'refseq_match': summary['refseq_transcript_id'],
+        'other_transcripts': [
+            row['ensembl_transcript_id']
+            for row in features.execute(
+                'SELECT ensembl_transcript_id FROM mane_summary '
+                'WHERE ensembl_gene_id=?',
+                [ensg],
+            )
+            if row['ensembl_transcript_id'] != enst
+        ],
+        'gene_features': features.execute(
+            'SELECT * FROM mane_genomic_features WHERE ensembl_gene_id=?', [ensg]
+        ).fetchall(),
+        'five_prime_utr_stats': features.execute(
+            'SELECT * FROM mane_transcript_features WHERE ensembl_transcript_id=?',
+            [enst],
+        ).fetchone(),
+        'transcript_features': features.execute(
+            'SELECT * FROM orf_features WHERE ensembl_transcript_id=?', [enst]
+        ).fetchall(),
+        'constraint': fetch_value(
+            features,
+            'SELECT loeuf FROM loeuf_constraint WHERE ensembl_gene_id=?',
+            [ensg],
+            'loeuf',
+        ),
+        'clingen_entry': fetch_value(
+            features,
+            'SELECT haplo_score FROM clingen WHERE hgnc_symbol=?',
+            [hgnc],
+            'haplo_score',
+            'Not curated',
+        ),
+        'omim_id': fetch_value(
+            features,
+            'SELECT omim_entry FROM omim WHERE ensembl_gene_id=?',
+            [ensg],
+            'omim_entry',
+        ),
+        'smorfs': features.execute(
+            'SELECT * FROM smorf_locations WHERE ensembl_transcript_id=?', [enst]
+        ).fetchall(),
+        'few_possible_variants': [
+            row['variant_id']
+            for row in variants.execute(
+                'SELECT variant_id FROM variant_annotations '
+                'WHERE ensembl_transcript_id=? LIMIT 5',
+                [enst],
+            )
+        ],
+    }
+
+
+def main(args):
+    """Entry point"""
+    features = sqlite3.connect(args.features_db)
+    features.row_factory = dict_factory
+    variants = sqlite3.connect(f'file:{args.variant_db}?mode=ro', uri=True)
+    variants.row_factory = dict_factory
+
+    exists = features.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='viewer_bundles'"
+    ).fetchone()
+    if exists and not args.overwrite:
+        print(f'Viewer bundles already exist in {args.features_db}')
+        sys.exit(0)
+
+    # Speeds up the per transcript lookups on the un-indexed tables
+    if args.create_indexes:
+        print('Creating lookup indexes')
+        for tbl, col in [
+            ('mane_summary', 'ensembl_gene_id'),
+            ('mane_genomic_features', 'ensembl_gene_id'),
+            ('mane_transcript_features', 'ensembl_transcript_id'),
+            ('orf_features', 'ensembl_transcript_id'),
+            ('smorf_locations', 'ensembl_transcript_id'),
+            ('conservation_scores', 'ensembl_transcript_id'),
+        ]:
+            features.execute(
+                f'CREATE INDEX IF NOT EXISTS idx_{tbl}_{col} ON {tbl} ({col})'
+            )
+
+    features.execute('DROP TABLE IF EXISTS viewer_bundles')
+    features.execute(
+        """
+        CREATE TABLE viewer_bundles (
+            ensembl_transcript_id varchar PRIMARY KEY,
+            bundle blob
+        ) WITHOUT ROWID"""
+    )
+
+    summaries = features.execute('SELECT * FROM mane_summary').fetchall()
+    print(f'Building viewer bundles for {len(summaries)} transcripts')
+    for summary in tqdm.tqdm(summaries):
+        bundle = build_bundle(features, variants, summary)
+        features.execute(
+            'INSERT INTO viewer_bundles VALUES (?, ?)',
+            [
+                summary['ensembl_transcript_id'],
+                zlib.compress(
+                    json.dumps(bundle, separators=(',', ':')).encode('utf-8'),
+                    args.compression_level,
+                ),
+            ],
+        )
+    features.commit()
+    features.close()
+    variants.close()
+    print('Completed creating viewer bundles')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Precomputes the static viewer page data per MANE transcript'
+    )
+    parser.add_argument(
+        '--features_db',
+        required=True,
+        type=str,
+        help='Features sqlite3 database (the bundles are written here)',
+    )
+    parser.add_argument(
+        '--variant_db',
+        required=True,
+        type=str,
+        help='Variant store sqlite3 database',
+    )
+    parser.add_argument(
+        '--compression_level',
+        type=int,
+        default=9,
+        help='zlib compression level (Default: 9)',
+    )
+    parser.add_argument(
+        '--create_indexes',
+        action='store_true',
+        help='Index the per transcript lookup columns before building',
+    )
+    parser.add_argument(
+        '--overwrite',
+        action='store_true',
+        help='Overwrite existing bundles if they exist',
+    )
+    parser.add_argument(
+        '--verbose',
+        action='store_true',
+        help='Verbose outputs',
+    )
+    main(args=parser.parse_args())
@@ -0,0 +1,202 @@
+"""
+Throughput of a single gunicorn worker under a slow gnomAD upstream
+
+Starts a stub gnomAD GraphQL API that answers every region query after
+--delay seconds, then for each worker class runs one gunicorn worker
+against it (with the gnomAD and response caches off, so every request
+goes upstream) and hits /viewer/population/<transcript> from
+--concurrency clients for --duration seconds
+
+Needs a features.db and variant_store.db (without a population store, so
+the gnomAD API is used)
+
+Usage : python3 concurrency_benchmark.py --features_db ../../data/database/features.db
+            --variant_db ../../data/database/variant_store.db
+            --transcripts ENST00000274599 ENST00000380152
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FLASK_APP = os.path.join(HERE, '..', 'flask-app')
+
+EMPTY_REGION = json.dumps(
+    {'data': {'region': {'variants': [], 'clinvar_variants': []}}}
+).encode()
+
+
+def free_port():
+    """Finds an unused local port"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_upstream(port, delay):
+    """
+    Serves an empty gnomAD region response after delay seconds
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        """Slow gnomAD API"""
+
+        def do_POST(self):  # pylint: disable=C0103
+            """Answers any query"""
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(EMPTY_REGION)))
+            self.end_headers()
+            self.wfile.write(EMPTY_REGION)
+
+        def log_message(self, *args):  # pylint: disable=W0221
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_gunicorn(worker_class, port, args, upstream_port):
+    """
+    Starts one gunicorn worker of the given class
+    """
+    env = {
+        **os.environ,
+        'FLASK_ENV': 'production',
+        'FLASK_FEATURES_DATABASE': json.dumps(os.path.abspath(args.features_db)),
+        'FLASK_VARIANT_DATABASE': json.dumps(os.path.abspath(args.variant_db)),
+        'FLASK_POPULATION_DATABASE': json.dumps('/nonexistent/population_store.db'),
+        'FLASK_GNOMAD_API_FALLBACK': 'true',
+        'FLASK_GNOMAD_API_URL': json.dumps(f'http://127.0.0.1:{upstream_port}/api'),
+        'FLASK_GNOMAD_CACHE_SIZE': '0',
+        'FLASK_GNOMAD_POOL_SIZE': str(args.concurrency * 4),
+        'FLASK_GNOMAD_MAX_WORKERS': str(args.concurrency * 4),
+        'FLASK_RESPONSE_CACHE_BYTES': '0',
+        'GUNICORN_WORKER_CLASS': worker_class,
+        'GUNICORN_WORKERS': '1',
+        'GUNICORN_THREADS': str(args.threads),
+        'GUNICORN_BIND': f'127.0.0.1:{port}',
+    }
+    proc = subprocess.Popen(  # pylint: disable=R1732
+        [sys.executable, '-m', 'gunicorn', 'wsgi:app', '-c', 'gunicorn.conf.py'],
+        cwd=FLASK_APP,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1)
+            return proc
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f'gunicorn ({worker_class}) did not start')
+
+
+def run_load(port, transcripts, concurrency, duration):
+    """
+    Requests the population tracks from concurrency clients
+    @returns (latencies, errors)
+    """
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    lock = threading.Lock()
+
+    def client(seed):
+        rng = random.Random(seed)
+        while time.monotonic() < deadline:
+            url = f'http://127.0.0.1:{port}/viewer/population/{rng.choice(transcripts)}'
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=60) as resp:
+                    resp.read()
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            except (urllib.error.URLError, ConnectionError) as error:
+                with lock:
+                    errors.append(error)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def main(args):
+    """Entry point"""
+    upstream_port = free_port()
+    upstream = start_stub_upstream(upstream_port, args.delay)
+    print(
+        f'Upstream delay {args.delay} s, {args.concurrency} clients, '
+        f'{args.duration} s per run, 1 worker'
+    )
+    for worker_class in args.worker_classes:
+        port = free_port()
+        proc = start_gunicorn(worker_class, port, args, upstream_port)
+        try:
+            latencies, errors = run_load(
+                port, args.transcripts, args.concurrency, args.duration
+            )
+        finally:
+            proc.terminate()
+            proc.wait()
+        latencies.sort()
+        label = (
+            worker_class
+            if worker_class != 'gthread'
+            else f'gthread ({args.threads} threads)'
+        )
+        p50 = statistics.median(latencies) if latencies else 0
+        p95 = latencies[int(0.95 * len(latencies))] if latencies else 0
+        print(
+            f'{label:<22} {len(latencies) / args.duration:8.1f} req/s '
+            f'p50={p50 * 1000:8.1f} ms p95={p95 * 1000:8.1f} ms '
+            f'errors={len(errors)}'
+        )
+    upstream.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Slow upstream concurrency benchmark')
+    parser.add_argument(
+        '--features_db', required=True, type=str, help='Features database'
+    )
+    parser.add_argument(
+        '--variant_db', required=True, type=str, help='Variant database'
+    )
+    parser.add_argument(
+        '--transcripts', nargs='+', required=True, help='Transcripts to request'
+    )
+    parser.add_argument('--delay', type=float, default=1.0, help='Upstream delay (s)')
+    parser.add_argument(
+        '--concurrency', type=int, default=50, help='Concurrent clients'
+    )
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per run')
+    parser.add_argument(
+        '--threads', type=int, default=4, help='Threads per gthread worker'
+    )
+    parser.add_argument(
+        '--worker_classes',
+        nargs='+',
+        default=['gthread', 'gevent'],
+        help='Gunicorn worker classes to compare',
+    )
+    main(args=parser.parse_args())
@@ -0,0 +1,176 @@
+"""
+A local stub of the gnomAD GraphQL API, for benchmarking without the
+live API
+
+Answers the region queries of the server's gnomAD client
+(gnomad_client.REGION_QUERY) with synthetic gnomAD and ClinVar SNVs at a
+share of the region's positions. Responses are deterministic, and the
+reference bases are those of synthetic_databases.py, so the variants
+match the possible variants of a synthetic variant store. An optional
+delay stands in for the latency of the real API
+
+Usage : python3 gnomad_stub.py --port 8010
+        python3 gnomad_stub.py --port 8010 --delay 0.3 --density 0.1
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from synthetic_databases import BASES, reference_base
+
+REGION_RE = re.compile(
+    r'region\(\s*chrom:\s*"([^"]+)"\s*,\s*start:\s*(\d+)\s*,\s*stop:\s*(\d+)'
+)
+CLINICAL_SIGNIFICANCE = (
+    'Benign',
+    'Likely benign',
+    'Uncertain significance',
+    'Likely pathogenic',
+    'Pathogenic',
+)
+REVIEW_STATUS = (
+    'criteria provided, single submitter',
+    'criteria provided, multiple submitters, no conflicts',
+    'reviewed by expert panel',
+)
+
+
+def position_hash(chrom, pos, salt):
+    """
+    @returns a stable pseudo random number for a position
+    """
+    return zlib.crc32(f'{salt}:{chrom}:{pos}'.encode())
+
+
+def region_response(chrom, start, stop, density):
+    """
+    The API response for a region
+    @param density : share of positions with a gnomAD variant (a fifth
+    of which are also in ClinVar)
+    """
+    variants, clinvar_variants = [], []
+    threshold = int(density * 2**32)
+    for pos in range(start, stop + 1):
+        if position_hash(chrom, pos, 'gnomad') >= threshold:
+            continue
+        ref = reference_base(chrom, pos)
+        alt = BASES[(BASES.index(ref) + 1 + position_hash(chrom, pos, 'alt') % 3) % 4]
+        variant_id = f'{chrom}-{pos}-{ref}-{alt}'
+        ac = 1 + position_hash(chrom, pos, 'ac') % 200
+        variants.append({
+            'ref': ref,
+            'pos': pos,
+            'alt': alt,
+            'hgvsc': f'c.-{1 + pos % 300}{ref}>{alt}',
+            'variant_id': variant_id,
+            'genome': {'af': ac / 152312, 'an': 152312, 'ac': ac},
+            'transcript_consequence': {
+                'is_mane_select': True,
+                'major_consequence': '5_prime_UTR_variant',
+                'sift_prediction': None,
+                'polyphen_prediction': None,
+                'is_mane_select_version': True,
+            },
+        })
+        if position_hash(chrom, pos, 'clinvar') % 5 == 0:
+            clinvar_hash = position_hash(chrom, pos, 'significance')
+            clinvar_variants.append({
+                'transcript_id': None,
+                'ref': ref,
+                'pos': pos,
+                'alt': alt,
+                'in_gnomad': True,
+                'clinvar_variation_id': str(clinvar_hash % 10**6),
+                'gold_stars': clinvar_hash % 4,
+                'variant_id': variant_id,
+                'review_status': REVIEW_STATUS[clinvar_hash % len(REVIEW_STATUS)],
+                'hgvsc': f'c.-{1 + pos % 300}{ref}>{alt}',
+                'clinical_significance': CLINICAL_SIGNIFICANCE[
+                    clinvar_hash % len(CLINICAL_SIGNIFICANCE)
+                ],
+                'major_consequence': '5_prime_UTR_variant',
+            })
+    region = {'variants': variants, 'clinvar_variants': clinvar_variants}
+    return {'data': {'region': region}}
+
+
+def start_gnomad_stub(port, delay=0.0, density=0.05, host='127.0.0.1'):
+    """
+    Serves the stub API from a background thread
+    @returns the server (stop it with shutdown())
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        """gnomAD GraphQL API"""
+
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):  # pylint: disable=C0103
+            """Answers region queries"""
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            query = body.decode('utf-8')
+            if 'json' in self.headers.get('Content-Type', ''):
+                query = json.loads(query).get('query', '')
+            match = REGION_RE.search(query)
+            if match is None:
+                self.reply(
+                    400, {'errors': [{'message': 'Only region queries are stubbed'}]}
+                )
+                return
+            chrom, start, stop = (
+                match.group(1),
+                int(match.group(2)),
+                int(match.group(3)),
+            )
+            if delay:
+                time.sleep(delay)
+            self.reply(200, region_response(chrom, start, stop, density))
+
+        def reply(self, status, payload):
+            """Sends a JSON response"""
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):  # pylint: disable=W0221
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(args):
+    """Entry point"""
+    server = start_gnomad_stub(args.port, args.delay, args.density, args.host)
+    print(
+        f'gnomAD stub on http://{args.host}:{args.port}/api '
+        f'(set FLASK_GNOMAD_API_URL), Ctrl-C to stop'
+    )
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub gnomAD GraphQL API')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Bind address')
+    parser.add_argument('--port', type=int, default=8010, help='Port')
+    parser.add_argument('--delay', type=float, default=0.0, help='Response delay (s)')
+    parser.add_argument(
+        '--density',
+        type=float,
+        default=0.05,
+        help='Share of positions with a gnomAD variant',
+    )
+    main(args=parser.parse_args())
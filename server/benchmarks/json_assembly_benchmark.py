@@ -0,0 +1,230 @@
+"""
+Benchmarks building the largest JSON payloads in SQLite
+(json_group_array / json_object) against the previous path of a Python
+dictionary per row serialised by json.dumps
+
+Times a page of /viewer/variants (get_possible_variants_window) and the
+ORFs of the viewer page (get_all_orfs_features) on synthetic stores
+
+Usage : python3 json_assembly_benchmark.py
+        python3 json_assembly_benchmark.py --transcripts 200 --variants 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'flask-app'))
+
+BASES = 'ACGT'
+CONSEQUENCES = ('uAUG_gained', 'uSTOP_gained', 'uSTOP_lost', 'uFrameShift')
+
+
+def build_synthetic_stores(directory, n_transcripts, n_variants, n_orfs):
+    """
+    Writes a variant store (variant_annotations with the pipeline's
+    indexes) and a features database with the orf_features table
+    @returns (variant store path, features database path)
+    """
+    variant_db = os.path.join(directory, 'variant_store.db')
+    conn = sqlite3.connect(variant_db)
+    conn.execute(
+        """
+        CREATE TABLE variant_annotations (
+            ensembl_transcript_id varchar,
+            variant_id varchar,
+            cdna_pos int,
+            five_prime_UTR_variant_consequence varchar,
+            five_prime_UTR_variant_annotation data,
+            annotations data
+        )"""
+    )
+    rng = random.Random(0)
+    for t in range(n_transcripts):
+        rows = []
+        for i in range(n_variants // 3):
+            pos = 1_000_000 + i
+            ref = BASES[(pos * 7) % 4]
+            rows.extend(
+                (
+                    f'ENST{t:011d}',
+                    f'1-{pos}-{ref}-{alt}',
+                    i + 1,
+                    rng.choice(CONSEQUENCES),
+                    '{}',
+                    '{}',
+                )
+                for alt in BASES
+                if alt != ref
+            )
+        conn.executemany('INSERT INTO variant_annotations VALUES (?, ?, ?, ?, ?, ?)', rows)
+    conn.execute(
+        """CREATE INDEX idx_variant_annotations_transcript
+        ON variant_annotations (ensembl_transcript_id, variant_id)"""
+    )
+    conn.commit()
+    conn.close()
+
+    features_db = os.path.join(directory, 'features.db')
+    conn = sqlite3.connect(features_db)
+    conn.execute(
+        """
+        CREATE TABLE orf_features (
+            ensembl_transcript_id TEXT, orf_start_codon INTEGER,
+            orf_stop_codon INTEGER, orf_seq TEXT, orf_type TEXT, frame TEXT,
+            kozak_context TEXT, kozak_consensus_strength TEXT, orf_id TEXT,
+            efficiency REAL, lower_bound REAL, upper_bound REAL,
+            orf_start_codon_genome INTEGER, orf_stop_codon_genome INTEGER,
+            context TEXT
+        )"""
+    )
+    for t in range(n_transcripts):
+        conn.executemany(
+            'INSERT INTO orf_features VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [
+                (
+                    f'ENST{t:011d}', i * 3, i * 3 + 60,
+                    ''.join(rng.choice(BASES) for _ in range(60)), 'uORF',
+                    'Out_of_frame', 'GCCATGG', 'Strong', f'ENST{t:011d}_{i}',
+                    rng.random(), rng.random(), rng.random(),
+                    1_000_000 + i * 3, 1_000_060 + i * 3, 'GCCATGG',
+                )
+                for i in range(n_orfs)
+            ],
+        )
+    conn.execute('CREATE INDEX idx_orf_features ON orf_features (ensembl_transcript_id)')
+    conn.commit()
+    conn.close()
+    return variant_db, features_db
+
+
+def dict_factory(cursor, row):
+    """The features database's row factory"""
+    return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+
+
+def previous_variants_window(conn, ensembl_transcript_id, limit):
+    """
+    The first page of possible variants, as the helper used to build it
+    """
+    rows = conn.execute(
+        """
+        SELECT variant_id, cdna_pos,
+            five_prime_UTR_variant_consequence AS consequence
+        FROM variant_annotations
+        WHERE ensembl_transcript_id = ?
+        AND cdna_pos BETWEEN ? AND ?
+        AND (cdna_pos, variant_id, five_prime_UTR_variant_consequence) > (?, ?, ?)
+        ORDER BY cdna_pos, variant_id, five_prime_UTR_variant_consequence LIMIT ?
+        """,
+        [ensembl_transcript_id, 1, sys.maxsize, 0, '', '', limit + 1],
+    ).fetchall()
+    return json.dumps([dict(row) for row in rows[0:limit]])
+
+
+def previous_orfs(conn, ensembl_transcript_id):
+    """
+    The ORFs of a transcript, as the helper used to read them
+    """
+    rows = conn.execute(
+        'SELECT * FROM orf_features WHERE ensembl_transcript_id=?',
+        [ensembl_transcript_id],
+    ).fetchall()
+    return json.dumps(rows)
+
+
+def time_calls(func, args_list):
+    """
+    @returns the time of each call in seconds
+    """
+    timings = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name, timings):
+    """Prints the latency summary of a run"""
+    timings = sorted(timings)
+    p50 = timings[len(timings) // 2] * 1000
+    p95 = timings[min(int(0.95 * len(timings)), len(timings) - 1)] * 1000
+    print(
+        f'{name:<32} n={len(timings):<6} mean={statistics.mean(timings) * 1000:8.3f} ms '
+        f'p50={p50:8.3f} ms p95={p95:8.3f} ms'
+    )
+
+
+def main(args):
+    """Entry point"""
+    directory = tempfile.mkdtemp()
+    print(
+        f'Generating {args.transcripts} transcripts with {args.variants} variants '
+        f'and {args.orfs} ORFs in {directory}'
+    )
+    variant_db, features_db = build_synthetic_stores(
+        directory, args.transcripts, args.variants, args.orfs
+    )
+
+    os.environ.setdefault('FLASK_ENV', 'development')
+    # pylint: disable=C0415,E0401
+    from app import create_app, features_db as features, variant_db as variants
+    from app.helpers import get_all_orfs_features, get_possible_variants_window
+
+    app = create_app()
+    app.config.update(VARIANT_DATABASE=variant_db, FEATURES_DATABASE=features_db)
+    variants.init_app(app)
+    features.init_app(app)
+
+    rng = random.Random(1)
+    ensts = [f'ENST{rng.randrange(args.transcripts):011d}' for _ in range(args.queries)]
+    variant_conn = sqlite3.connect(f'file:{variant_db}?mode=ro', uri=True)
+    variant_conn.row_factory = sqlite3.Row
+    features_conn = sqlite3.connect(f'file:{features_db}?mode=ro', uri=True)
+    features_conn.row_factory = dict_factory
+
+    with app.app_context():
+        # Same output either way
+        assert json.loads(get_possible_variants_window(ensts[0], limit=args.limit)[0]) == (
+            json.loads(previous_variants_window(variant_conn, ensts[0], args.limit))
+        )
+        report(
+            'variants page, dict rows',
+            time_calls(
+                previous_variants_window,
+                [(variant_conn, enst, args.limit) for enst in ensts],
+            ),
+        )
+        report(
+            'variants page, SQLite JSON',
+            time_calls(
+                lambda enst: get_possible_variants_window(enst, limit=args.limit),
+                [(enst,) for enst in ensts],
+            ),
+        )
+        report(
+            'ORFs, dict rows',
+            time_calls(previous_orfs, [(features_conn, enst) for enst in ensts]),
+        )
+        report(
+            'ORFs, SQLite JSON',
+            time_calls(get_all_orfs_features, [(enst,) for enst in ensts]),
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SQLite JSON assembly benchmark')
+    parser.add_argument('--transcripts', type=int, default=100, help='Synthetic transcripts')
+    parser.add_argument('--variants', type=int, default=6000, help='Variants per transcript')
+    parser.add_argument('--orfs', type=int, default=200, help='ORFs per transcript')
+    parser.add_argument('--limit', type=int, default=500, help='Variants per page')
+    parser.add_argument('--queries', type=int, default=500, help='Calls per path')
+    main(args=parser.parse_args())
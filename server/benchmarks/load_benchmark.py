@@ -0,0 +1,405 @@
+"""
+Load test of the server on synthetic databases
+
+Builds synthetic databases (synthetic_databases.py) unless given
+existing ones, starts the gnomAD stub (gnomad_stub.py) and a gunicorn
+server with them, then drives a weighted mix of the viewer endpoints
+from --concurrency keep-alive clients for --duration seconds and
+reports the latency percentiles and throughput of each endpoint
+
+    viewer              /viewer/<transcript>
+    utr_impact          /viewer/utr_impact (as the viewer page asks for it)
+    possible_variants   /viewer/possible_variants (typeahead prefixes)
+    variant_search      /variant_search/<variant>
+    population          /viewer/population/<transcript> (gnomAD stub)
+
+The server's response and gnomAD caches are off unless --caches is
+given, so every request does its full work. With --url an already
+running server is load tested instead (it has to be serving the
+databases given, for the requests to hit)
+
+Usage : python3 load_benchmark.py
+        python3 load_benchmark.py --transcripts 5000 --concurrency 32 --duration 60
+            --workers 4 --worker_class gthread --threads 8
+        python3 load_benchmark.py --features_db features.db --variant_db variant_store.db
+            --url http://127.0.0.1:8080 --mix viewer=1 utr_impact=4
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from concurrency_benchmark import FLASK_APP, free_port
+from gnomad_stub import start_gnomad_stub
+from synthetic_databases import add_arguments, build
+
+DEFAULT_MIX = {
+    'viewer': 1,
+    'utr_impact': 3,
+    'possible_variants': 4,
+    'variant_search': 1,
+    'population': 1,
+}
+# The viewer page's visualisation buffer (bases past the start codon)
+BUFFER = 40
+SAMPLE_SIZE = 20000
+
+
+class Workload:
+    """
+    The transcripts and variants requests are drawn from
+    """
+
+    def __init__(self, features_db, variant_db):
+        with sqlite3.connect(f'file:{features_db}?mode=ro', uri=True) as conn:
+            self.utr_lengths = dict(
+                conn.execute(
+                    'SELECT ensembl_transcript_id, five_prime_utr_length FROM mane_transcript_features'
+                )
+            )
+        with sqlite3.connect(f'file:{variant_db}?mode=ro', uri=True) as conn:
+            self.variants = conn.execute(
+                f"""
+                SELECT ensembl_transcript_id, variant_id FROM variant_annotations
+                ORDER BY random() LIMIT {SAMPLE_SIZE}
+                """
+            ).fetchall()
+        self.variants = [
+            (enst, variant_id)
+            for enst, variant_id in self.variants
+            if enst in self.utr_lengths
+        ]
+        self.transcripts = list(self.utr_lengths)
+        if not self.transcripts or not self.variants:
+            raise RuntimeError('No transcripts or variants to request')
+
+    def path(self, endpoint, rng):
+        """
+        @returns the path of a request to an endpoint
+        """
+        if endpoint == 'viewer':
+            return f'/viewer/{rng.choice(self.transcripts)}'
+        if endpoint == 'population':
+            return f'/viewer/population/{rng.choice(self.transcripts)}'
+        enst, variant_id = rng.choice(self.variants)
+        if endpoint == 'utr_impact':
+            query = {
+                'variant_id': variant_id,
+                'ensembl_transcript_id': enst,
+                'start_site': self.utr_lengths[enst],
+                'buffer': BUFFER,
+            }
+            return f'/viewer/utr_impact?{urllib.parse.urlencode(query)}'
+        if endpoint == 'possible_variants':
+            # As typed, from the first few characters to the whole id
+            query = {
+                'ensembl_transcript_id': enst,
+                'search_term': variant_id[0:rng.randint(3, len(variant_id))],
+            }
+            return f'/viewer/possible_variants?{urllib.parse.urlencode(query)}'
+        if endpoint == 'variant_search':
+            return f'/variant_search/{variant_id}'
+        raise ValueError(f'Unknown endpoint {endpoint}')
+
+
+def start_server(args, features_db, variant_db, conservation_tracks, upstream_port):
+    """
+    Starts gunicorn on the databases
+    @returns (process, base url)
+    """
+    port = free_port()
+    env = {
+        **os.environ,
+        'FLASK_ENV': 'production',
+        'FLASK_FEATURES_DATABASE': json.dumps(os.path.abspath(features_db)),
+        'FLASK_VARIANT_DATABASE': json.dumps(os.path.abspath(variant_db)),
+        'FLASK_POPULATION_DATABASE': json.dumps('/nonexistent/population_store.db'),
+        'FLASK_CONSERVATION_TRACKS': json.dumps(
+            os.path.abspath(conservation_tracks or '/nonexistent/conservation_tracks.f32')
+        ),
+        'FLASK_GNOMAD_API_FALLBACK': 'true',
+        'FLASK_GNOMAD_API_URL': json.dumps(f'http://127.0.0.1:{upstream_port}/api'),
+        'FLASK_GNOMAD_POOL_SIZE': str(args.concurrency),
+        'GUNICORN_WORKER_CLASS': args.worker_class,
+        'GUNICORN_WORKERS': str(args.workers),
+        'GUNICORN_THREADS': str(args.threads),
+        'GUNICORN_BIND': f'127.0.0.1:{port}',
+        'GUNICORN_PRELOAD': '0' if args.no_preload else '1',
+    }
+    if not args.caches:
+        env.update({'FLASK_GNOMAD_CACHE_SIZE': '0', 'FLASK_RESPONSE_CACHE_BYTES': '0'})
+    proc = subprocess.Popen(  # pylint: disable=R1732
+        [sys.executable, '-m', 'gunicorn', 'wsgi:app', '-c', 'gunicorn.conf.py'],
+        cwd=FLASK_APP,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(150):
+        try:
+            urllib.request.urlopen(f'{url}/health', timeout=1)
+            return proc, url
+        except (urllib.error.URLError, ConnectionError):
+            if proc.poll() is not None:
+                break
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError('gunicorn did not start (see --verbose)')
+
+
+def run_load(url, workload, mix, concurrency, duration, warmup):
+    """
+    Sends requests from concurrency clients, each over its own keep-alive
+    connection, timing those sent after the warmup
+    @returns (endpoint -> latencies, endpoint -> status -> count, seconds)
+    """
+    endpoints = list(mix)
+    weights = [mix[endpoint] for endpoint in endpoints]
+    target = urllib.parse.urlsplit(url)
+    latencies = {endpoint: [] for endpoint in endpoints}
+    statuses = {endpoint: {} for endpoint in endpoints}
+    lock = threading.Lock()
+    start_time = time.monotonic()
+    measure_from = start_time + warmup
+    deadline = measure_from + duration
+
+    def client(seed):
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection(target.hostname, target.port, timeout=60)
+        while time.monotonic() < deadline:
+            endpoint = rng.choices(endpoints, weights)[0]
+            path = target.path.rstrip('/') + workload.path(endpoint, rng)
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+                resp = conn.getresponse()
+                resp.read()
+                status = resp.status
+            except (http.client.HTTPException, OSError) as error:
+                conn.close()
+                conn = http.client.HTTPConnection(target.hostname, target.port, timeout=60)
+                status = type(error).__name__
+            elapsed = time.perf_counter() - start
+            if time.monotonic() < measure_from:
+                continue
+            with lock:
+                statuses[endpoint][status] = statuses[endpoint].get(status, 0) + 1
+                if status == 200:
+                    latencies[endpoint].append(elapsed)
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.monotonic() - measure_from
+
+
+def worker_memory(pid):
+    """
+    The memory of each worker of a gunicorn master, from
+    /proc/<pid>/smaps_rollup (Linux only)
+    @returns [(worker pid, rss, pss, private) in kB]
+    """
+    memory = []
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children', encoding='utf-8') as children:
+            workers = [int(child) for child in children.read().split()]
+        for worker in sorted(workers):
+            fields = {}
+            with open(f'/proc/{worker}/smaps_rollup', encoding='utf-8') as rollup:
+                for line in rollup:
+                    name, _, value = line.partition(':')
+                    if value.strip().endswith('kB'):
+                        fields[name] = int(value.split()[0])
+            memory.append((
+                worker,
+                fields.get('Rss', 0),
+                fields.get('Pss', 0),
+                fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+            ))
+    except OSError:
+        return []
+    return memory
+
+
+def percentile(timings, q):
+    """
+    @returns the q-th percentile of sorted timings (nearest rank)
+    """
+    return timings[min(int(q / 100 * len(timings)), len(timings) - 1)]
+
+
+def report(latencies, statuses, seconds):
+    """Prints the latency summary of each endpoint and of the whole mix"""
+    print(
+        f'{"endpoint":<18} {"requests":>8} {"errors":>7} {"req/s":>8} '
+        f'{"mean":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"max":>8}  (ms)'
+    )
+    rows = list(latencies.items()) + [
+        ('all', [timing for timings in latencies.values() for timing in timings])
+    ]
+    for endpoint, timings in rows:
+        if endpoint == 'all':
+            counts = {}
+            for endpoint_statuses in statuses.values():
+                for status, count in endpoint_statuses.items():
+                    counts[status] = counts.get(status, 0) + count
+        else:
+            counts = statuses[endpoint]
+        requests = sum(counts.values())
+        errors = requests - counts.get(200, 0)
+        timings = sorted(timings)
+        if timings:
+            summary = ' '.join(
+                f'{value * 1000:8.1f}'
+                for value in (
+                    statistics.mean(timings),
+                    percentile(timings, 50),
+                    percentile(timings, 95),
+                    percentile(timings, 99),
+                    timings[-1],
+                )
+            )
+        else:
+            summary = ' '.join(f'{"-":>8}' for _ in range(5))
+        print(f'{endpoint:<18} {requests:>8} {errors:>7} {requests / seconds:8.1f} {summary}')
+    for endpoint, counts in statuses.items():
+        failures = {status: count for status, count in counts.items() if status != 200}
+        if failures:
+            print(f'{endpoint} errors : {failures}')
+
+
+def parse_mix(values):
+    """
+    @returns endpoint -> weight from endpoint=weight arguments
+    """
+    if not values:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for value in values:
+        endpoint, _, weight = value.partition('=')
+        if endpoint not in DEFAULT_MIX:
+            raise SystemExit(f'Unknown endpoint {endpoint}, one of {", ".join(DEFAULT_MIX)}')
+        mix[endpoint] = float(weight or 1)
+    return mix
+
+
+def main(args):
+    """Entry point"""
+    mix = parse_mix(args.mix)
+    conservation_tracks = args.conservation_tracks_file
+    if args.features_db and args.variant_db:
+        features_db, variant_db = args.features_db, args.variant_db
+    else:
+        args.output = args.output or tempfile.mkdtemp()
+        args.overwrite = True
+        print(f'Generating {args.transcripts} synthetic transcripts in {args.output}')
+        features_db, variant_db = build(args)
+        if args.conservation_tracks:
+            conservation_tracks = os.path.join(args.output, 'conservation_tracks.f32')
+    workload = Workload(features_db, variant_db)
+
+    upstream = None
+    proc = None
+    url = args.url
+    if url is None:
+        upstream_port = free_port()
+        upstream = start_gnomad_stub(upstream_port, args.gnomad_delay, args.gnomad_density)
+        proc, url = start_server(
+            args, features_db, variant_db, conservation_tracks, upstream_port
+        )
+    print(
+        f'{len(workload.transcripts)} transcripts, {args.concurrency} clients, '
+        f'{args.duration} s after a {args.warmup} s warmup against {url}'
+    )
+    if proc is not None:
+        print(
+            f'{args.workers} {args.worker_class} worker(s)'
+            + (f', {args.threads} threads each' if args.worker_class == 'gthread' else '')
+            + (', caches on' if args.caches else ', caches off')
+            + (', not preloaded' if args.no_preload else ', preloaded')
+            + f', gnomAD stub delay {args.gnomad_delay} s'
+        )
+    print(f'Mix : {", ".join(f"{endpoint}={weight:g}" for endpoint, weight in mix.items())}')
+    memory = []
+    try:
+        latencies, statuses, seconds = run_load(
+            url, workload, mix, args.concurrency, args.duration, args.warmup
+        )
+        if proc is not None:
+            memory = worker_memory(proc.pid)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        if upstream is not None:
+            upstream.shutdown()
+    report(latencies, statuses, seconds)
+    for worker, rss, pss, private in memory:
+        print(
+            f'worker {worker} : RSS {rss / 1024:.1f} MB, PSS {pss / 1024:.1f} MB, '
+            f'private {private / 1024:.1f} MB'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Server load test on synthetic databases')
+    parser.add_argument('--features_db', type=str, help='Existing features database')
+    parser.add_argument('--variant_db', type=str, help='Existing variant store')
+    parser.add_argument(
+        '--conservation_tracks_file',
+        type=str,
+        help='Existing conservation track store (with --features_db)',
+    )
+    parser.add_argument(
+        '--output', type=str, help='Folder for the synthetic databases (Default: temporary)'
+    )
+    parser.add_argument('--url', type=str, help='Load test a running server instead')
+    parser.add_argument(
+        '--mix',
+        nargs='+',
+        help='endpoint=weight of the requests (Default: {})'.format(
+            ' '.join(f'{endpoint}={weight}' for endpoint, weight in DEFAULT_MIX.items())
+        ),
+    )
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=3, help='Unmeasured seconds first')
+    parser.add_argument('--workers', type=int, default=2, help='Gunicorn workers')
+    parser.add_argument('--worker_class', type=str, default='gevent', help='Worker class')
+    parser.add_argument('--threads', type=int, default=4, help='Threads per gthread worker')
+    parser.add_argument(
+        '--caches', action='store_true', help='Keep the response and gnomAD caches on'
+    )
+    parser.add_argument(
+        '--gnomad_delay', type=float, default=0.1, help='gnomAD stub response delay (s)'
+    )
+    parser.add_argument(
+        '--gnomad_density',
+        type=float,
+        default=0.05,
+        help='Share of 5\' UTR positions with a gnomAD variant',
+    )
+    parser.add_argument(
+        '--no_preload',
+        action='store_true',
+        help='Load the app in each worker rather than in the gunicorn master',
+    )
+    parser.add_argument('--verbose', action='store_true', help='Show the gunicorn log')
+    add_arguments(parser)
+    main(args=parser.parse_args())
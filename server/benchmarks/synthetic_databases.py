@@ -0,0 +1,658 @@
+"""
+Builds synthetic features and variant store databases, at a configurable
+scale, to benchmark the server without the real databases
+
+The features database has every table of pipeline/src/database/model.py
+(named as in their col_mappings) along with transcript_exon_intervals
+and the lookup indexes the server relies on. The variant store is
+written in the pipeline's compact format (variant_codec.py), then search
+indexed and finalised by pipeline/src/database/variant_store.py
+
+Each gene has one MANE transcript with a 5' UTR of 1 to 3 exons, on
+either strand, and every transcript's coordinates are consistent across
+the tables. The reference base of a position is a function of the
+position (reference_base), which the gnomAD stub (gnomad_stub.py) uses
+too, so that the population variants it returns are in the variant
+store
+
+Usage : python3 synthetic_databases.py --output /tmp/vutr
+        python3 synthetic_databases.py --output /tmp/vutr --transcripts 5000
+            --variant_fraction 0.5 --bundles --conservation_tracks
+"""
+
+import argparse
+import importlib.util
+import os
+import random
+import sqlite3
+import sys
+import zlib
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+PIPELINE = HERE / '..' / '..' / 'pipeline' / 'src' / 'database'
+FLASK_APP = HERE / '..' / 'flask-app'
+# The pipeline's modules import their neighbours (e.g. variant_codec)
+sys.path.insert(0, str(PIPELINE))
+
+BASES = 'ACGT'
+COMPLEMENT = str.maketrans('ACGT', 'TGCA')
+CHROMOSOMES = [str(i) for i in range(1, 23)] + ['X']
+# Genomic distance between neighbouring genes
+LOCUS_SPACING = 100_000
+CONSEQUENCES = ('uAUG_gained', 'uAUG_lost', 'uSTOP_gained', 'uSTOP_lost', 'uFrameShift')
+KOZAK_STRENGTHS = ('Weak', 'Moderate', 'Strong')
+# Share of the variant positions with an insertion as well
+INSERTION_FRACTION = 0.1
+ORF_TYPES = ('uORF', 'OutOfFrame_oORF', 'inFrame_oORF')
+
+INTEGER_COLUMNS = {
+    'ncbi_gene_id', 'five_prime_utr_length', 'three_prime_utr_length',
+    'num_five_prime_utr_exons', 'start_site_pos', 'cds_start', 'cds_end',
+    'cds_length', 'orf_start_codon', 'orf_stop_codon', 'orf_start_codon_genome',
+    'orf_stop_codon_genome', 'start', 'end', 'exon_number', 'genomic_start',
+    'genomic_end', 'transcript_start', 'transcript_end', 'genome_start',
+    'genome_end', 'block_count', 'dataset_count', 'smorf_length',
+    'isoform_count', 'omim_entry', 'entrez', 'pos', 'tpos', 'haplo_score',
+    'triplo_score',
+}
+REAL_COLUMNS = {
+    'efficiency', 'lower_bound', 'upper_bound', 'loeuf', 'score', 'phastcons',
+    'phylop', 'gerp_rs', 'gerp_s', 'phred_cadd', 'raw_cadd',
+}
+
+# Not in model.py, ingested from UTR_Genome_Transcript_Intervals.tsv
+EXON_INTERVAL_COLUMNS = (
+    'chr', 'ensembl_transcript_id', 'strand', 'exon_number', 'genomic_start',
+    'genomic_end', 'transcript_start', 'transcript_end',
+)
+
+# As created by viewer_bundles.py --create_indexes, exon_intervals.py and
+# te_distribution.py
+FEATURE_INDEXES = [
+    ('mane_summary', 'ensembl_transcript_id'),
+    ('mane_summary', 'ensembl_gene_id'),
+    ('mane_genomic_features', 'ensembl_gene_id'),
+    ('mane_transcript_features', 'ensembl_transcript_id'),
+    ('orf_features', 'ensembl_transcript_id'),
+    ('orf_features', 'orf_id'),
+    ('smorf_locations', 'ensembl_transcript_id'),
+    ('conservation_scores', 'ensembl_transcript_id'),
+    ('transcript_exon_intervals', 'ensembl_transcript_id, transcript_start'),
+]
+
+
+def load_module(name, path):
+    """
+    Loads a module of the pipeline or the server by path
+    """
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def reference_base(chrom, pos):
+    """
+    @returns the (forward strand) synthetic reference base of a position
+    """
+    return BASES[zlib.crc32(f'{chrom}:{pos}'.encode()) % 4]
+
+
+def transcript_ids(index):
+    """
+    @returns the (transcript, gene, protein, symbol) ids of a transcript
+    """
+    return (
+        f'ENST{index + 1:011d}',
+        f'ENSG{index + 1:011d}',
+        f'ENSP{index + 1:011d}',
+        f'SYN{index + 1}',
+    )
+
+
+def transcript_locus(index):
+    """
+    @returns the chromosome and genomic start of a transcript
+    """
+    return (
+        CHROMOSOMES[index % len(CHROMOSOMES)],
+        1_000_000 + (index // len(CHROMOSOMES)) * LOCUS_SPACING,
+    )
+
+
+def layout_transcript(rng, index, max_utr_length, exon_map_class):
+    """
+    Lays out the exons of a transcript
+    @returns dictionary of the transcript's coordinates
+    """
+    chrom, locus = transcript_locus(index)
+    strand = rng.choice('+-')
+    utr_length = rng.randint(30, max_utr_length)
+    cds_length = rng.randrange(300, 3000, 3)
+    three_prime_utr_length = rng.randint(100, 1000)
+    length = utr_length + cds_length + three_prime_utr_length
+
+    # Split the 5' UTR into exons, the last of which holds the CDS
+    n_utr_exons = min(rng.randint(1, 3), utr_length // 10)
+    cuts = sorted(rng.sample(range(5, utr_length - 4), n_utr_exons - 1))
+    tstarts = [1] + [cut + 1 for cut in cuts]
+    tends = cuts + [length]
+
+    # Forward strand offsets, mirrored for the - strand
+    offsets = []
+    offset = 0
+    for tstart, tend in zip(tstarts, tends):
+        offsets.append((offset, offset + tend - tstart))
+        offset += tend - tstart + 1 + rng.randint(200, 5000)
+    span = offsets[-1][1] + 1
+    exons = []
+    for (start, end), tstart, tend in zip(offsets, tstarts, tends):
+        if strand == '-':
+            start, end = span - 1 - end, span - 1 - start
+        exons.append((locus + start, locus + end, tstart, tend))
+
+    return {
+        'chrom': chrom,
+        'strand': strand,
+        'start': locus,
+        'end': locus + span - 1,
+        'utr_length': utr_length,
+        'cds_length': cds_length,
+        'three_prime_utr_length': three_prime_utr_length,
+        'length': length,
+        'exons': exons,
+        'n_utr_exons': n_utr_exons,
+        'exon_map': exon_map_class(
+            chrom, strand, [(gstart, gend, tstart) for gstart, gend, tstart, _ in exons]
+        ),
+    }
+
+
+def transcript_sequence(layout, tstart, tend):
+    """
+    @returns the transcript sequence between two transcript positions
+    """
+    seq = ''.join(
+        reference_base(layout['chrom'], layout['exon_map'].to_genome(tpos))
+        for tpos in range(tstart, tend + 1)
+    )
+    return seq.translate(COMPLEMENT) if layout['strand'] == '-' else seq
+
+
+def genomic_interval(layout, tstart, tend):
+    """
+    @returns the (lower, upper) genomic coordinates of a transcript interval
+    """
+    ends = (layout['exon_map'].to_genome(tstart), layout['exon_map'].to_genome(tend))
+    return min(ends), max(ends)
+
+
+def utr_annotation(rng, consequence, tpos, utr_length):
+    """
+    A UTRannotator annotation (key:value,...) for a consequence, with the
+    fields find_intervals_for_utr_consequence reads
+    """
+    kozak_context = ''.join(rng.choice(BASES) for _ in range(3)) + 'ATGG'
+    distance_to_cds = utr_length - tpos
+    # Only the fields of the consequence are drawn
+    fields = {
+        'uAUG_gained': lambda: [
+            ('KozakContext', kozak_context),
+            ('KozakStrength', rng.choice(KOZAK_STRENGTHS)),
+            ('DistanceToCDS', distance_to_cds),
+            ('type', rng.choice(ORF_TYPES)),
+            ('DistanceToStop', rng.choice([rng.randint(3, 90), 'NA'])),
+            ('CapDistanceToStart', tpos),
+            ('Evidence', 'False'),
+        ],
+        'uAUG_lost': lambda: [
+            ('type', rng.choice(ORF_TYPES)),
+            ('CapDistanceToStart', tpos),
+            ('DistanceToCDS', distance_to_cds),
+            ('KozakContext', kozak_context),
+            ('KozakStrength', rng.choice(KOZAK_STRENGTHS)),
+            ('DistanceToStop', rng.randint(3, 90)),
+            ('Evidence', 'False'),
+        ],
+        'uSTOP_gained': lambda: [
+            ('ref_StartDistanceToCDS', distance_to_cds + rng.randint(3, 60)),
+            ('newSTOPDistanceToCDS', rng.choice([distance_to_cds, 'NA'])),
+            ('ref_type', rng.choice(ORF_TYPES)),
+            ('KozakContext', kozak_context),
+            ('KozakStrength', rng.choice(KOZAK_STRENGTHS)),
+            ('Evidence', 'False'),
+        ],
+        'uSTOP_lost': lambda: [
+            ('AltStop', rng.choice(['True', 'False'])),
+            ('AltStopDistanceToCDS', rng.randint(1, 200)),
+            ('FrameWithCDS', rng.choice(['inFrame', 'outOfFrame'])),
+            ('KozakContext', kozak_context),
+            ('KozakStrength', rng.choice(KOZAK_STRENGTHS)),
+            ('Evidence', 'False'),
+        ],
+        'uFrameShift': lambda: [
+            ('ref_type', rng.choice(ORF_TYPES)),
+            ('ref_StartDistanceToCDS', distance_to_cds + rng.randint(3, 60)),
+            ('alt_type', rng.choice(ORF_TYPES)),
+            ('alt_type_length', rng.randint(3, 300)),
+            ('KozakContext', kozak_context),
+            ('KozakStrength', rng.choice(KOZAK_STRENGTHS)),
+            ('Evidence', 'False'),
+        ],
+    }[consequence]()
+    return ','.join(f'{consequence}_{key}:{value}' for key, value in fields)
+
+
+def transcript_variants(rng, index, layout, variant_fraction):
+    """
+    The VEP rows of the possible high impact variants of a transcript,
+    all three alternate alleles at a share of its 5' UTR positions, and
+    at a tenth of those an insertion too, whose cDNA_position is the
+    range of the two positions either side (e.g. 120-121) as VEP gives
+    """
+    enst, ensg, _, _ = transcript_ids(index)
+    chrom = layout['chrom']
+    rows = []
+    for tpos in range(1, layout['utr_length'] + 1):
+        if rng.random() >= variant_fraction:
+            continue
+        gpos = layout['exon_map'].to_genome(tpos)
+        ref = reference_base(chrom, gpos)
+        # (alt, cDNA_position)
+        alleles = [(alt, tpos) for alt in BASES if alt != ref]
+        if rng.random() < INSERTION_FRACTION and 1 < tpos < layout['utr_length']:
+            # After the reference base on the genome, so 3' of tpos on the
+            # forward strand and 5' of it on the reverse strand
+            after = tpos if layout['strand'] == '+' else tpos - 1
+            alleles.append((ref + rng.choice(BASES), f'{after}-{after + 1}'))
+        for alt, cdna_position in alleles:
+            consequence = rng.choice(CONSEQUENCES)
+            rows.append({
+                '#Uploaded_variation': f'{chrom}_{gpos}_{ref}/{alt}',
+                'Location': f'{chrom}:{gpos}',
+                'Allele': alt,
+                'Gene': ensg,
+                'Feature': enst,
+                'Feature_type': 'Transcript',
+                'Consequence': '5_prime_UTR_variant',
+                'cDNA_position': cdna_position,
+                'CDS_position': '-',
+                'Protein_position': '-',
+                'Amino_acids': '-',
+                'Codons': '-',
+                'Existing_variation': '-',
+                'Extra': f'IMPACT=MODIFIER;STRAND={1 if layout["strand"] == "+" else -1}',
+                'five_prime_UTR_variant_consequence': consequence,
+                'five_prime_UTR_variant_annotation': utr_annotation(
+                    rng, consequence, tpos, layout['utr_length']
+                ),
+            })
+    return rows
+
+
+def create_tables(conn, tbl_models):
+    """
+    Creates the tables of the model with typed columns (as pandas'
+    to_sql would from the parsed files)
+    @returns table -> column names
+    """
+    tables = {
+        tbl: list(dict.fromkeys(model['col_mappings'].values()))
+        for tbl, model in tbl_models.items()
+    }
+    tables['transcript_exon_intervals'] = list(EXON_INTERVAL_COLUMNS)
+    for tbl, columns in tables.items():
+        conn.execute(f'DROP TABLE IF EXISTS {tbl}')
+        definitions = ', '.join(
+            '"{}" {}'.format(
+                col,
+                'INTEGER' if col in INTEGER_COLUMNS
+                else 'REAL' if col in REAL_COLUMNS
+                else 'TEXT',
+            )
+            for col in columns
+        )
+        conn.execute(f'CREATE TABLE {tbl} ({definitions})')
+    return tables
+
+
+def insert_rows(conn, tables, tbl, rows):
+    """
+    Inserts dictionaries into a table, missing columns are NULL
+    """
+    columns = tables[tbl]
+    conn.executemany(
+        f'INSERT INTO {tbl} VALUES ({", ".join("?" * len(columns))})',
+        [[row.get(col) for col in columns] for row in rows],
+    )
+
+
+def feature_rows(rng, index, layout, max_orfs):
+    """
+    The rows of a transcript in each features table
+    @returns dictionary of table -> rows
+    """
+    enst, ensg, ensp, symbol = transcript_ids(index)
+    chrom, strand = layout['chrom'], layout['strand']
+    utr_length = layout['utr_length']
+    seq = transcript_sequence(layout, 1, layout['length'])
+    common = {
+        'chr': f'chr{chrom}',
+        'source': 'ENSEMBL',
+        'score': None,
+        'strand': strand,
+        'ensembl_gene_id': ensg,
+        'gene_type': 'protein_coding',
+        'hgnc_symbol': symbol,
+    }
+    transcript = {
+        **common,
+        'ensembl_transcript_id': enst,
+        'transcript_type': 'protein_coding',
+        'transcript_name': f'{symbol}-201',
+        'tag': 'MANE_Select',
+        'ensembl_protein_id': ensp,
+        'parent': f'gene:{ensg}',
+    }
+    genomic = [
+        {**common, 'type': 'gene', 'ID': f'gene:{ensg}',
+         'start': layout['start'], 'end': layout['end']},
+        {**transcript, 'type': 'transcript', 'ID': f'transcript:{enst}',
+         'start': layout['start'], 'end': layout['end']},
+    ]
+    exon_intervals = []
+    for number, (gstart, gend, tstart, tend) in enumerate(layout['exons'], 1):
+        genomic.append({
+            **transcript, 'type': 'exon', 'start': gstart, 'end': gend,
+            'exon_number': number, 'exon_id': f'ENSE{index + 1:08d}{number:03d}',
+            'parent': f'transcript:{enst}',
+        })
+        exon_intervals.append({
+            'chr': f'chr{chrom}', 'ensembl_transcript_id': enst, 'strand': strand,
+            'exon_number': number, 'genomic_start': gstart, 'genomic_end': gend,
+            'transcript_start': tstart, 'transcript_end': tend,
+        })
+        if tstart <= utr_length:
+            utr_start, utr_end = genomic_interval(layout, tstart, min(tend, utr_length))
+            genomic.append({
+                **transcript, 'type': 'five_prime_UTR', 'start': utr_start,
+                'end': utr_end, 'exon_number': number,
+                'parent': f'transcript:{enst}',
+            })
+    cds_start, cds_end = genomic_interval(
+        layout, utr_length + 1, utr_length + layout['cds_length']
+    )
+    genomic.append({
+        **transcript, 'type': 'CDS', 'start': cds_start, 'end': cds_end,
+        'phase': 0, 'exon_number': layout['n_utr_exons'],
+        'parent': f'transcript:{enst}', 'ID': f'CDS:{ensp}',
+    })
+
+    orfs, orf_locations = [], []
+    for _ in range(rng.randint(0, max_orfs)):
+        start = rng.randint(1, max(utr_length - 9, 1))
+        stop = min(start + 3 * rng.randint(2, 60), layout['length'] - 3)
+        gstart, gend = genomic_interval(layout, start, stop + 2)
+        efficiency = rng.uniform(0.2, 1.4)
+        orf_id = f'{enst}_{start}_{stop}'
+        orfs.append({
+            'ensembl_transcript_id': enst,
+            'orf_start_codon': start,
+            'orf_stop_codon': stop,
+            'orf_seq': seq[start - 1:stop + 2],
+            'orf_type': rng.choice(ORF_TYPES),
+            'frame': rng.choice(['Inframe', 'Out_of_frame']),
+            'kozak_context': seq[max(start - 7, 0):start + 4],
+            'kozak_consensus_strength': rng.choice(KOZAK_STRENGTHS),
+            'orf_id': orf_id,
+            'efficiency': efficiency,
+            'lower_bound': efficiency * 0.9,
+            'upper_bound': efficiency * 1.1,
+            'orf_start_codon_genome': gstart if strand == '+' else gend,
+            'orf_stop_codon_genome': gend if strand == '+' else gstart,
+            'context': seq[max(start - 7, 0):start + 4],
+        })
+        orf_locations.append({
+            'ensembl_transcript_id': enst, 'orf_id': orf_id, 'strand': strand,
+            'start': gstart, 'end': gend,
+        })
+
+    smorfs = []
+    for number in range(rng.randint(0, 2)):
+        start = rng.randint(1, max(utr_length - 30, 1))
+        end = start + 3 * rng.randint(5, 10)
+        gstart, gend = genomic_interval(layout, start, end)
+        smorfs.append({
+            'chr': f'chr{chrom}', 'genome_start': gstart, 'genome_end': gend,
+            'smorf_id': f'smORF_{index + 1}_{number}', 'score': 1000,
+            'strand': strand, 'block_count': 1, 'start_codon': 'ATG',
+            'aa_seq': 'M' + 'A' * ((end - start) // 3 - 1),
+            'dataset_count': 1, 'name': f'smORF_{index + 1}_{number}',
+            'confidence': rng.choice(['high', 'low']), 'type': 'uORF',
+            'gene_name': symbol, 'ensembl_gene_id': ensg,
+            'smorf_length': (end - start) // 3, 'isoform_count': 1,
+            'ensembl_transcript_id': enst, 'transcript_start': start,
+            'transcript_end': end, 'kozak_consensus_strength': rng.choice(KOZAK_STRENGTHS),
+            'efficiency': rng.uniform(0.2, 1.4),
+        })
+
+    conservation = []
+    for tpos in range(1, utr_length + 1):
+        conservation.append({
+            'chr': f'chr{chrom}',
+            'pos': layout['exon_map'].to_genome(tpos),
+            'tpos': tpos,
+            'ensembl_transcript_id': enst,
+            'phastcons': rng.random(),
+            'phylop': rng.uniform(-5, 10),
+            'gerp_rs': rng.uniform(-6, 6),
+            'gerp_s': rng.uniform(-6, 6),
+            'phred_cadd': rng.uniform(0, 30),
+            'raw_cadd': rng.uniform(-1, 5),
+        })
+
+    return {
+        'mane_summary': [{
+            'ensembl_transcript_id': enst, 'ensembl_gene_id': ensg,
+            'ensembl_protein_id': ensp, 'ncbi_gene_id': index + 1,
+            'refseq_transcript_id': f'NM_{index + 1:06d}.1',
+            'refseq_protein_id': f'NP_{index + 1:06d}.1',
+            'mane_status': 'MANE Select', 'name': f'synthetic gene {index + 1}',
+            'hgnc_symbol': symbol, 'hgnc_id': f'HGNC:{index + 1}',
+        }],
+        'mane_transcript_features': [{
+            'ensembl_transcript_id': enst,
+            'five_prime_utr_length': utr_length,
+            'three_prime_utr_length': layout['three_prime_utr_length'],
+            'num_five_prime_utr_exons': layout['n_utr_exons'],
+            'start_site_pos': utr_length + 1,
+            'cds_start': utr_length + 1,
+            'cds_end': utr_length + layout['cds_length'],
+            'strand': strand,
+            'hgnc_symbol': symbol,
+            'seq': seq,
+            'cds_length': layout['cds_length'],
+        }],
+        'mane_genomic_features': genomic,
+        'transcript_exon_intervals': exon_intervals,
+        'orf_features': orfs,
+        'orf_locations': orf_locations,
+        'smorf_locations': smorfs,
+        'conservation_scores': conservation,
+        'loeuf_constraint': [{
+            'hgnc_symbol': symbol, 'ensembl_transcript_id': enst,
+            'ensembl_gene_id': ensg, 'loeuf': rng.uniform(0.1, 2),
+        }],
+        'omim': [{
+            'omim_entry': 100000 + index, 'type': 'gene', 'entrez': index + 1,
+            'hgnc_id': f'HGNC:{index + 1}', 'ensembl_gene_id': ensg,
+        }] if rng.random() < 0.3 else [],
+        'clingen': [{
+            'hgnc_symbol': symbol, 'gene_id': index + 1,
+            'haplo_score': rng.choice([0, 1, 2, 3, 30]),
+            'triplo_score': rng.choice([0, 1, 2, 3]),
+        }] if rng.random() < 0.2 else [],
+    }
+
+
+def translational_efficiencies(rng):
+    """
+    The translational efficiency of every NNNNNNATGN Kozak context
+    """
+    rows = []
+    for i in range(4 ** 7):
+        context = ''.join(BASES[(i >> (2 * k)) & 3] for k in range(6)) + 'ATG'
+        context += BASES[(i >> 12) & 3]
+        efficiency = rng.uniform(0.2, 1.4)
+        rows.append({
+            'context': context,
+            'efficiency': efficiency,
+            'lower_bound': efficiency * 0.9,
+            'upper_bound': efficiency * 1.1,
+        })
+    return rows
+
+
+def build(args):
+    """
+    Writes the databases
+    @returns (features database path, variant store path)
+    """
+    os.makedirs(args.output, exist_ok=True)
+    features_path = os.path.join(args.output, 'features.db')
+    variant_path = os.path.join(args.output, 'variant_store.db')
+    for path in (features_path, variant_path):
+        if os.path.exists(path):
+            if not args.overwrite:
+                print(f'{path} already exists, use --overwrite to replace it')
+                sys.exit(1)
+            os.remove(path)
+
+    model = load_module('model', PIPELINE / 'model.py')
+    coordinates = load_module('coordinates', FLASK_APP / 'app' / 'coordinates.py')
+    variant_store = load_module('variant_store', PIPELINE / 'variant_store.py')
+
+    features = sqlite3.connect(features_path)
+    tables = create_tables(features, model.tbl_models)
+    variants = sqlite3.connect(variant_path)
+    variants.execute(variant_store.VARIANT_ANNOTATIONS_SCHEMA)
+
+    rng = random.Random(args.seed)
+    insert_rows(features, tables, 'translational_efficiencies', translational_efficiencies(rng))
+    codec = None
+    n_variants = 0
+    for index in range(args.transcripts):
+        layout = layout_transcript(rng, index, args.max_utr_length, coordinates.ExonMap)
+        for tbl, rows in feature_rows(rng, index, layout, args.max_orfs).items():
+            insert_rows(features, tables, tbl, rows)
+
+        rows = transcript_variants(rng, index, layout, args.variant_fraction)
+        if not rows:
+            continue
+        if codec is None:
+            # As variant_store.create_codec, from the first transcript
+            codec = variant_store.variant_codec.AnnotationCodec.from_sample(rows)
+            variants.execute('CREATE TABLE store_metadata (key varchar PRIMARY KEY, value blob)')
+            variants.executemany('INSERT INTO store_metadata VALUES (?, ?)', codec.metadata())
+        variants.executemany(
+            'INSERT INTO variant_annotations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [variant_store.variant_row(row, codec) for row in rows],
+        )
+        n_variants += len(rows)
+        if (index + 1) % 1000 == 0:
+            print(f'{index + 1} transcripts, {n_variants} variants')
+
+    for tbl, columns in FEATURE_INDEXES:
+        features.execute(
+            f'CREATE INDEX idx_{tbl}_{columns.split(",")[0]} ON {tbl} ({columns})'
+        )
+    te_distribution = load_module('te_distribution', PIPELINE / 'te_distribution.py')
+    te_distribution.write_distribution(
+        features,
+        te_distribution.reference_data.TEDistribution.from_values(
+            value for (value,) in features.execute('SELECT efficiency FROM orf_features')
+        ),
+    )
+    features.commit()
+    features.close()
+    variants.commit()
+    print(f'Wrote {args.transcripts} transcripts and {n_variants} variants')
+
+    variant_store.create_search_index(variants)
+    variant_store.finalise(variants, args.page_size)
+    variants.close()
+
+    if args.bundles:
+        viewer_bundles = load_module('viewer_bundles', PIPELINE / 'viewer_bundles.py')
+        viewer_bundles.main(
+            argparse.Namespace(
+                features_db=features_path,
+                variant_db=variant_path,
+                compression_level=9,
+                create_indexes=False,
+                overwrite=True,
+            )
+        )
+    if args.conservation_tracks:
+        conservation_tracks = load_module(
+            'conservation_tracks', PIPELINE / 'conservation_tracks.py'
+        )
+        conservation_tracks.main(
+            argparse.Namespace(
+                features_db=features_path,
+                output=os.path.join(args.output, 'conservation_tracks.f32'),
+            )
+        )
+    return features_path, variant_path
+
+
+def main(args):
+    """Entry point"""
+    features_path, variant_path = build(args)
+    for path in (features_path, variant_path):
+        print(f'{path} : {os.path.getsize(path) / 2**20:.1f} MiB')
+
+
+def add_arguments(parser):
+    """
+    Adds the scale arguments (shared with load_benchmark.py)
+    """
+    parser.add_argument('--transcripts', type=int, default=1000, help='MANE transcripts')
+    parser.add_argument(
+        '--max_utr_length', type=int, default=500, help='Longest 5\' UTR (bases)'
+    )
+    parser.add_argument(
+        '--variant_fraction',
+        type=float,
+        default=0.3,
+        help='Share of 5\' UTR positions with possible high impact variants',
+    )
+    parser.add_argument('--max_orfs', type=int, default=10, help='Most ORFs per transcript')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument(
+        '--page_size',
+        type=int,
+        default=16384,
+        help='Page size of the finalised variant store',
+    )
+    parser.add_argument(
+        '--bundles', action='store_true', help='Precompute the viewer bundles'
+    )
+    parser.add_argument(
+        '--conservation_tracks',
+        action='store_true',
+        help='Write the memory mapped conservation track store',
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Builds synthetic features and variant store databases'
+    )
+    parser.add_argument('--output', required=True, type=str, help='Output folder')
+    parser.add_argument(
+        '--overwrite', action='store_true', help='Replace existing databases'
+    )
+    add_arguments(parser)
+    main(args=parser.parse_args())
@@ -0,0 +1,202 @@
+"""
+Benchmarks the /viewer/possible_variants typeahead against the old
+substring (LIKE '%term%') query
+
+Either point it at a real variant store (built by
+pipeline/src/database/variant_store.py, which also builds the
+variant_search index) or let it generate a synthetic one
+
+Usage : python3 typeahead_benchmark.py --variant_db variant_store.db
+        python3 typeahead_benchmark.py --rows 20000000 --transcripts 19000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'flask-app'))
+sys.path.insert(0, os.path.join(HERE, '..', '..', 'pipeline', 'src', 'database'))
+
+BASES = 'ACGT'
+
+
+def build_synthetic_store(db_name, n_rows, n_transcripts):
+    """
+    Writes a variant store with every possible SNV over consecutive
+    positions of each transcript (3 rows per position)
+    """
+    from variant_store import create_search_index  # pylint: disable=C0415,E0401
+
+    conn = sqlite3.connect(db_name)
+    conn.execute(
+        """
+        CREATE TABLE variant_annotations (
+            ensembl_transcript_id varchar,
+            variant_id varchar,
+            cdna_pos int,
+            five_prime_UTR_variant_consequence varchar,
+            five_prime_UTR_variant_annotation data,
+            annotations data
+        )"""
+    )
+    per_transcript = max(n_rows // n_transcripts, 3)
+    rng = random.Random(0)
+    for t in range(n_transcripts):
+        chrom = str(t % 22 + 1)
+        start = rng.randint(1_000_000, 200_000_000)
+        rows = []
+        for i in range(per_transcript // 3):
+            pos = start + i
+            ref = BASES[(pos * 7) % 4]
+            rows.extend(
+                (
+                    f'ENST{t:011d}',
+                    f'{chrom}-{pos}-{ref}-{alt}',
+                    i + 1,
+                    'uAUG_gained',
+                    '{}',
+                    '{}',
+                )
+                for alt in BASES
+                if alt != ref
+            )
+        conn.executemany(
+            'INSERT INTO variant_annotations VALUES (?, ?, ?, ?, ?, ?)', rows
+        )
+        conn.commit()
+    # Like the pipeline output, variant_annotations itself is not indexed
+    create_search_index(conn)
+    conn.close()
+
+
+def sample_queries(db_name, n_queries):
+    """
+    Picks (transcript, partial variant id) pairs, truncating real ids to
+    emulate someone part way through typing
+    """
+    conn = sqlite3.connect(db_name)
+    n_rows = conn.execute('SELECT max(rowid) FROM variant_annotations').fetchone()[0]
+    rng = random.Random(1)
+    queries = []
+    while len(queries) < n_queries:
+        row = conn.execute(
+            'SELECT ensembl_transcript_id, variant_id FROM variant_annotations '
+            'WHERE rowid = ?',
+            [rng.randint(1, n_rows)],
+        ).fetchone()
+        if row is None:
+            continue
+        enst, variant_id = row
+        # Typed with or without the chromosome
+        term = variant_id if rng.random() < 0.5 else variant_id.split('-', 1)[1]
+        queries.append((enst, term[0 : rng.randint(3, len(term))]))
+    conn.close()
+    return queries
+
+
+def percentiles(timings):
+    """
+    @returns p50, p95 and p99 in milliseconds
+    """
+    timings = sorted(timings)
+
+    def pick(q):
+        return timings[min(int(q * len(timings)), len(timings) - 1)] * 1000
+
+    return pick(0.5), pick(0.95), pick(0.99)
+
+
+def report(name, timings):
+    """Prints the latency summary of a run"""
+    p50, p95, p99 = percentiles(timings)
+    mean = statistics.mean(timings) * 1000
+    print(
+        f'{name:<28} n={len(timings):<6} mean={mean:8.3f} ms '
+        f'p50={p50:8.3f} ms p95={p95:8.3f} ms p99={p99:8.3f} ms'
+    )
+
+
+def bench_endpoint(db_name, queries):
+    """
+    Times the /viewer/possible_variants endpoint end to end
+    """
+    os.environ.setdefault('FLASK_ENV', 'development')
+    from app import create_app, variant_db  # pylint: disable=C0415,E0401
+
+    app = create_app()
+    app.config['VARIANT_DATABASE'] = db_name
+    variant_db.init_app(app)
+    client = app.test_client()
+    timings = []
+    for enst, term in queries:
+        start = time.perf_counter()
+        resp = client.get(
+            '/viewer/possible_variants',
+            query_string={'ensembl_transcript_id': enst, 'search_term': term},
+        )
+        timings.append(time.perf_counter() - start)
+        assert resp.status_code == 200, resp.data
+    return timings
+
+
+def bench_like(db_name, queries):
+    """
+    Times the substring query the endpoint used to run
+    """
+    conn = sqlite3.connect(f'file:{db_name}?mode=ro', uri=True)
+    timings = []
+    for enst, term in queries:
+        start = time.perf_counter()
+        conn.execute(
+            """
+            SELECT variant_id FROM variant_annotations
+            WHERE variant_id LIKE ? COLLATE NOCASE AND ensembl_transcript_id = ?
+            LIMIT 10""",
+            ['%' + term + '%', enst],
+        ).fetchall()
+        timings.append(time.perf_counter() - start)
+    conn.close()
+    return timings
+
+
+def main(args):
+    """Entry point"""
+    db_name = args.variant_db
+    if db_name is None:
+        db_name = os.path.join(tempfile.mkdtemp(), 'variant_store.db')
+        print(f'Generating {args.rows} synthetic rows in {db_name}')
+        start = time.perf_counter()
+        build_synthetic_store(db_name, args.rows, args.transcripts)
+        print(f'Built in {time.perf_counter() - start:.1f} s')
+    print(f'Database size {os.path.getsize(db_name) / 2**20:.1f} MiB')
+
+    queries = sample_queries(db_name, args.queries)
+    report('possible_variants (index)', bench_endpoint(db_name, queries))
+    if not args.skip_like:
+        like_timings = bench_like(db_name, queries[0 : args.like_queries])
+        report('LIKE %term% (previous)', like_timings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Typeahead search benchmark')
+    parser.add_argument(
+        '--variant_db', type=str, help='Existing variant store to query'
+    )
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Synthetic rows')
+    parser.add_argument(
+        '--transcripts', type=int, default=1000, help='Synthetic transcripts'
+    )
+    parser.add_argument(
+        '--queries', type=int, default=2000, help='Number of searches'
+    )
+    parser.add_argument(
+        '--like_queries', type=int, default=20, help='Number of LIKE searches to time'
+    )
+    parser.add_argument('--skip_like', action='store_true', help='Only time the index')
+    main(args=parser.parse_args())
@@ -0,0 +1,205 @@
+"""
+Compares the size and decode cost of the variant store formats
+
+- json : the previous format, the parsed UTR annotation and the whole VEP
+  row stored as JSON text
+- compact : typed columns and a dictionary compressed values blob
+  (server/flask-app/app/variant_codec.py)
+
+Run it on the parsed VEP output of a chromosome (the --variant_file given
+to pipeline/src/database/variant_store.py), or on synthetic rows
+
+Usage : python3 variant_encoding_benchmark.py --variant_file chr22_utr_variants.tsv
+        python3 variant_encoding_benchmark.py --rows 200000
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', '..', 'pipeline', 'src', 'database'))
+
+import variant_store  # noqa: E402 # pylint: disable=C0413,E0401
+
+variant_codec = variant_store.variant_codec
+
+SCHEMA = """
+    CREATE TABLE variant_annotations (
+        ensembl_transcript_id varchar,
+        variant_id varchar,
+        cdna_pos int,
+        five_prime_UTR_variant_consequence varchar,
+        five_prime_UTR_variant_annotation varchar,
+        annotations blob
+    )"""
+
+CONSEQUENCES = {
+    'uAUG_gained': 'uAUG_gained_KozakContext:{k},uAUG_gained_KozakStrength:{s},'
+    'uAUG_gained_DistanceToCDS:{a},uAUG_gained_type:uORF,uAUG_gained_DistanceToStop:{b},'
+    'uAUG_gained_CapDistanceToStart:{c},uAUG_gained_Evidence:False',
+    'uSTOP_gained': 'uSTOP_gained_ref_StartDistanceToCDS:{a},uSTOP_gained_newSTOPDistanceToCDS:{b},'
+    'uSTOP_gained_KozakContext:{k},uSTOP_gained_KozakStrength:{s},uSTOP_gained_Evidence:False',
+    'uAUG_lost': 'uAUG_lost_type:uORF,uAUG_lost_CapDistanceToStart:{c},uAUG_lost_DistanceToCDS:{a},'
+    'uAUG_lost_DistanceToStop:{b},uAUG_lost_KozakContext:{k},uAUG_lost_KozakStrength:{s},'
+    'uAUG_lost_Evidence:False',
+}
+
+
+def synthetic_vep_rows(n_rows):
+    """
+    Rows shaped like the parsed VEP + UTRannotator tab output
+    """
+    rng = random.Random(0)
+    rows = []
+    for i in range(n_rows):
+        transcript = i // 600
+        pos = 17_000_000 + transcript * 1000 + (i % 600) // 3
+        ref, alt = 'ACGT'[pos % 4], 'ACGT'[(pos + i % 3 + 1) % 4]
+        conseq = rng.choice(list(CONSEQUENCES))
+        cdna = (i % 600) // 3 + 1
+        rows.append(
+            {
+                '#Uploaded_variation': f'22_{pos}_{ref}/{alt}',
+                'Location': f'22:{pos}',
+                'Allele': alt,
+                'Gene': f'ENSG{transcript:011d}',
+                'Feature': f'ENST{transcript:011d}',
+                'Feature_type': 'Transcript',
+                'Consequence': '5_prime_UTR_variant',
+                'cDNA_position': cdna,
+                'CDS_position': '-',
+                'Protein_position': '-',
+                'Amino_acids': '-',
+                'Codons': '-',
+                'Existing_variation': '-',
+                'IMPACT': 'MODIFIER',
+                'DISTANCE': '-',
+                'STRAND': rng.choice([1, -1]),
+                'FLAGS': '-',
+                'SYMBOL': f'GENE{transcript}',
+                'SYMBOL_SOURCE': 'HGNC',
+                'HGNC_ID': f'HGNC:{transcript + 1000}',
+                'MANE_SELECT': f'NM_{transcript:06d}.4',
+                'five_prime_UTR_variant_consequence': conseq,
+                'five_prime_UTR_variant_annotation': CONSEQUENCES[conseq].format(
+                    k=''.join(rng.choice('ACGT') for _ in range(7)),
+                    s=rng.choice(['Weak', 'Moderate', 'Strong']),
+                    a=rng.randint(1, 300),
+                    b=rng.randint(1, 300),
+                    c=cdna,
+                ),
+                'Existing_uORFs': rng.randint(0, 3),
+                'Existing_OutOfFrame_oORFs': rng.randint(0, 2),
+                'Existing_InFrame_oORFs': 0,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def build_json_store(db_name, chunks):
+    """The previous format (chunks reads the rows a DataFrame at a time)"""
+    conn = sqlite3.connect(db_name)
+    conn.execute(SCHEMA)
+    for chunk_df in chunks():
+        rows = []
+        for _, row in chunk_df.iterrows():
+            variant_conseq = row.to_dict()
+            rows.append(
+                (
+                    variant_conseq['Feature'],
+                    variant_store.convert_uploaded_variation_to_variant_id(
+                        variant_conseq['#Uploaded_variation']
+                    ),
+                    variant_conseq['cDNA_position'],
+                    variant_conseq['five_prime_UTR_variant_consequence'],
+                    json.dumps(
+                        variant_codec.parse_utr_annotation(
+                            variant_conseq['five_prime_UTR_variant_annotation']
+                        )
+                    ),
+                    json.dumps(variant_conseq),
+                )
+            )
+        conn.executemany('INSERT INTO variant_annotations VALUES (?, ?, ?, ?, ?, ?)', rows)
+        conn.commit()
+    conn.execute('VACUUM')
+    conn.close()
+
+
+def build_compact_store(db_name, chunks):
+    """The format written by variant_store.py"""
+    conn = sqlite3.connect(db_name)
+    conn.execute(variant_store.VARIANT_ANNOTATIONS_SCHEMA)
+    c = conn.cursor()
+    codec = variant_store.create_codec(variant_store.sample_variants(chunks()), c)
+    for chunk_df in chunks():
+        variant_store.process_batch(chunk_df, c, codec)
+        conn.commit()
+    conn.execute('VACUUM')
+    conn.close()
+
+
+def time_decode(db_name):
+    """
+    Decodes every row (UTR annotation and full VEP row)
+    @returns seconds per row for (UTR annotation, full row)
+    """
+    conn = sqlite3.connect(db_name)
+    conn.row_factory = sqlite3.Row
+    codec = variant_codec.codec_from_connection(conn)
+    rows = conn.execute('SELECT * FROM variant_annotations').fetchall()
+    conn.close()
+
+    start = time.perf_counter()
+    for row in rows:
+        variant_codec.parse_utr_annotation(row['five_prime_UTR_variant_annotation'])
+    utr = (time.perf_counter() - start) / len(rows)
+
+    start = time.perf_counter()
+    for row in rows:
+        codec.decode(row['annotations'], row)
+    full = (time.perf_counter() - start) / len(rows)
+    return utr, full
+
+
+def main(args):
+    """Entry point"""
+    workdir = tempfile.mkdtemp()
+    if args.variant_file:
+        def chunks():
+            return pd.read_csv(args.variant_file, sep='\t', chunksize=10000)
+    else:
+        synthetic = synthetic_vep_rows(args.rows)
+
+        def chunks():
+            return (synthetic[i : i + 10000] for i in range(0, len(synthetic), 10000))
+
+    results = {}
+    for name, build in [('json', build_json_store), ('compact', build_compact_store)]:
+        db_name = os.path.join(workdir, f'{name}.db')
+        start = time.perf_counter()
+        build(db_name, chunks)
+        build_time = time.perf_counter() - start
+        utr, full = time_decode(db_name)
+        results[name] = os.path.getsize(db_name)
+        print(
+            f'{name:<8} size={os.path.getsize(db_name) / 2**20:8.1f} MiB '
+            f'build={build_time:6.1f} s utr_decode={utr * 1e6:6.2f} us/row '
+            f'full_decode={full * 1e6:6.2f} us/row'
+        )
+    print(f'compact / json size: {results["compact"] / results["json"]:.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Variant store encoding benchmark')
+    parser.add_argument('--variant_file', type=str, help='Parsed VEP tsv to ingest')
+    parser.add_argument('--rows', type=int, default=100000, help='Synthetic rows')
+    main(args=parser.parse_args())
@@ -9,10 +9,17 @@ from .config import config_by_name
 # Add the features database as well
 from . import variant_db
 from . import features_db
+from . import population_db
+from . import conservation_db
+from . import gnomad_client
+from . import http_cache
+from . import static_assets
+from . import metrics
 
 # Register blueprints
 from .viewer import viewer as viewer_blueprint
 from .main import main as main_blueprint
+from .annotate import annotate as annotate_blueprint
 
 
 def create_app():
@@ -22,10 +29,20 @@ def create_app():
     app = Flask(__name__)
     # create the app through the app configuration
     app.config.from_object(config_by_name[environ.get('FLASK_ENV')])
+    # Allow deployments to override settings, e.g. FLASK_GNOMAD_API_URL
+    app.config.from_prefixed_env()
 
     features_db.init_app(app)
     variant_db.init_app(app)
+    population_db.init_app(app)
+    conservation_db.init_app(app)
+    gnomad_client.init_app(app)
+    # The asset build is part of the build identifier
+    static_assets.init_app(app)
+    http_cache.init_app(app)
+    metrics.init_app(app)
     app.register_blueprint(viewer_blueprint)
     app.register_blueprint(main_blueprint)
+    app.register_blueprint(annotate_blueprint)
 
     return app
@@ -0,0 +1,421 @@
+"""
+Flask blueprint for the batch variant annotation API
+
+POST /api/annotate takes a VCF (uploaded as the vcf field of a form, or as
+the request body, optionally gzipped) or a JSON list of variant ids
+(e.g. ["5-150904976-T-A", "chr1:1001:A>C"]). It finds the MANE
+transcripts with an exon over each variant and streams back one
+line per variant and transcript, with the variant's UTRannotator
+consequence and its interval, as NDJSON (default) or TSV (?format=tsv).
+With ?vep=true each line also has the variant's full VEP row, decoded
+from the variant store's annotations column
+
+The input is read and annotated a chunk of variants at a time
+(ANNOTATE_CHUNK_SIZE), each chunk with one variant store query and one
+features database query, so memory stays bounded however many variants
+are sent
+"""
+
+import io
+import itertools
+import json
+import os
+import re
+import zlib
+from sqlite3 import Error as SQLiteError  # pylint: disable=E0401
+
+from flask import (  # pylint: disable=E0401
+    Blueprint,
+    current_app,
+    jsonify,
+    request,
+    stream_with_context,
+)
+
+from . import features_db
+from .coordinates import normalise_chrom
+from .helpers import (
+    find_intervals_for_utr_consequence,
+    get_transcript_features_batch,
+    get_variant_annotations_batch,
+)
+from .metrics import span
+from . import variant_db
+from .variant_codec import parse_utr_annotation
+
+annotate = Blueprint("annotate", __name__)
+
+# chrom-pos-ref-alt, with -, :, _ or / and > as separators
+VARIANT_RE = re.compile(
+    r"^(?:chr)?([0-9]+|[XYM]|MT)[-:_](\d+)[-:_]([ACGTN]+)[-:_/>]([ACGTN]+)$",
+    re.IGNORECASE,
+)
+# The columns of the TSV output (the NDJSON lines have the same keys)
+COLUMNS = (
+    "input",
+    "variant_id",
+    "ensembl_transcript_id",
+    "hgnc_symbol",
+    "cdna_pos",
+    "consequence",
+    "start",
+    "end",
+    "kozak_strength",
+    "annotation",
+    "error",
+)
+# Added to the columns by ?vep=true
+VEP_COLUMN = "vep"
+GZIP_MAGIC = b"\x1f\x8b"
+READ_SIZE = 65536  # bytes of the VCF read at a time
+
+
+class VariantRecord:
+    """
+    A variant of the input, or the error in reading it
+    """
+
+    __slots__ = ("input", "variant_id", "chrom", "pos", "error")
+
+    def __init__(self, given, variant_id=None, error=None):
+        self.input = given
+        self.variant_id = variant_id
+        self.chrom = self.pos = None
+        if variant_id is not None:
+            chrom, pos = variant_id.split("-")[0:2]
+            self.chrom, self.pos = chrom, int(pos)
+        self.error = error
+
+
+def variant_id_of(chrom, pos, ref, alt):
+    """
+    @returns the gnomAD style variant id (1-1001-A-C) of the variant store
+    """
+    return f"{normalise_chrom(chrom)}-{int(pos)}-{ref.upper()}-{alt.upper()}"
+
+
+def parse_variant(given):
+    """
+    Reads a variant of a JSON list
+    @returns VariantRecord
+    """
+    match = VARIANT_RE.match(str(given).strip())
+    if match is None:
+        return VariantRecord(given, error="Not a chrom-pos-ref-alt variant")
+    return VariantRecord(given, variant_id_of(*match.groups()))
+
+
+def parse_vcf(lines):
+    """
+    Reads the variants of VCF lines, one record per alternate allele
+    (symbolic alleles are reported as errors)
+    @returns iterable of VariantRecord
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        if not line.strip() or line.startswith("#"):
+            continue
+        fields = line.rstrip("\r\n").split("\t")
+        if len(fields) < 5 or not fields[1].isdigit():
+            yield VariantRecord(line.rstrip("\r\n"), error="Not a VCF record")
+            continue
+        chrom, pos, vcf_id, ref, alts = fields[0:5]
+        for alt in alts.split(","):
+            given = vcf_id if vcf_id != "." else f"{chrom}-{pos}-{ref}-{alt}"
+            if not re.fullmatch(r"[ACGTNacgtn]+", f"{ref}{alt}"):
+                yield VariantRecord(given, error=f"Unsupported allele {ref}>{alt}")
+                continue
+            yield VariantRecord(given, variant_id_of(chrom, pos, ref, alt))
+
+
+def gunzip(chunks):
+    """
+    Decompresses gzipped chunks, including the concatenated gzip members
+    of a bgzipped VCF
+    """
+    decompressor = zlib.decompressobj(wbits=31)
+    for chunk in chunks:
+        while chunk:
+            yield decompressor.decompress(chunk)
+            if not decompressor.eof:
+                break
+            chunk = decompressor.unused_data
+            decompressor = zlib.decompressobj(wbits=31)
+
+
+def read_lines(stream):
+    """
+    Reads a binary stream a block at a time, gunzipped if need be
+    @returns iterable of lines (bytes)
+    """
+    chunks = iter(lambda: stream.read(READ_SIZE), b"")
+    first = next(chunks, b"")
+    chunks = itertools.chain([first], chunks)
+    if first.startswith(GZIP_MAGIC):
+        chunks = gunzip(chunks)
+    pending = b""
+    for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def detach_upload(upload):
+    """
+    Opens the uploaded file again, as werkzeug closes the uploads with the
+    request, before the response is streamed
+    @returns a binary file object at the start of the upload
+    """
+    stream = upload.stream
+    try:
+        # Spooled to a temporary file
+        detached = os.fdopen(os.dup(stream.fileno()), "rb")
+        detached.seek(0)
+        return detached
+    except (AttributeError, io.UnsupportedOperation):
+        # Small uploads are kept in memory
+        stream.seek(0)
+        return io.BytesIO(stream.read())
+
+
+def read_records():
+    """
+    The variants of the request, read lazily from a VCF
+    @returns iterable of VariantRecord
+    @raises ValueError if there is no input
+    """
+    if request.is_json:
+        body = request.get_json(silent=True)
+        variants = body.get("variants") if isinstance(body, dict) else body
+        if not isinstance(variants, list):
+            raise ValueError("Send a JSON list of variants or {\"variants\": [...]}")
+        return (parse_variant(given) for given in variants)
+    if request.mimetype == "multipart/form-data":
+        if "vcf" not in request.files:
+            raise ValueError("Upload the VCF as the vcf field")
+        return parse_vcf(read_lines(detach_upload(request.files["vcf"])))
+    # Any other body is the VCF itself (not parsed as a form)
+    if request.content_length:
+        return parse_vcf(read_lines(request.stream))
+    raise ValueError(
+        "Send a VCF (as the vcf field or the body) or a JSON list of variants"
+    )
+
+
+def annotate_chunk(records, buffer_length, start_sites, with_vep=False):
+    """
+    Annotates a chunk of variants, with one lookup of the variant store
+    and one of the features database for the start sites
+    @param start_sites : the 5' UTR length of the transcripts seen so far
+    (added to for the chunk's transcripts)
+    @param with_vep : whether to add the full VEP row of each variant
+    @returns the output rows (dictionaries)
+    """
+    exon_index = features_db.get_exon_index()
+    resolver = features_db.get_identifier_resolver()
+    stored = get_variant_annotations_batch(
+        [record.variant_id for record in records if record.variant_id is not None],
+        with_vep,
+    )
+
+    # The MANE transcripts over each variant, and those in the store
+    transcripts = {}
+    for record in records:
+        if record.variant_id is None:
+            continue
+        overlapping = set(exon_index.transcripts_at(record.chrom, record.pos))
+        overlapping.update(
+            row["ensembl_transcript_id"] for row in stored.get(record.variant_id, [])
+        )
+        transcripts[record.variant_id] = sorted(overlapping)
+    missing = {enst for ensts in transcripts.values() for enst in ensts} - set(
+        start_sites
+    )
+    if missing:
+        start_sites.update(
+            {
+                enst: None if features is None else features["five_prime_utr_length"]
+                for enst, features in get_transcript_features_batch(missing).items()
+            }
+        )
+
+    rows = []
+    for record in records:
+        if record.variant_id is None:
+            rows.append({"input": record.input, "error": record.error})
+            continue
+        if not transcripts[record.variant_id]:
+            rows.append({"input": record.input, "variant_id": record.variant_id})
+        for enst in transcripts[record.variant_id]:
+            summary = resolver.get("ensembl_transcript_id", enst)
+            row = {
+                "input": record.input,
+                "variant_id": record.variant_id,
+                "ensembl_transcript_id": enst,
+                "hgnc_symbol": summary.hgnc_symbol if summary else None,
+            }
+            variants = [
+                variant
+                for variant in stored.get(record.variant_id, [])
+                if variant["ensembl_transcript_id"] == enst
+            ]
+            if not variants:
+                rows.append(row)
+            for variant in variants:
+                rows.append(
+                    {**row, **annotated(variant, start_sites.get(enst), buffer_length)}
+                )
+                if with_vep:
+                    rows[-1][VEP_COLUMN] = variant_db.decode_annotations(variant)
+    return rows
+
+
+def annotated(variant, start_site, buffer_length):
+    """
+    The consequence and interval columns of a variant store row
+    @param start_site : the 5' UTR length of its transcript
+    """
+    columns = {
+        "cdna_pos": variant["cdna_pos"],
+        "consequence": variant["five_prime_UTR_variant_consequence"],
+    }
+    if start_site is None:
+        return {**columns, "error": "No 5' UTR length for the transcript"}
+    try:
+        columns["annotation"] = annotation = parse_utr_annotation(
+            variant["five_prime_UTR_variant_annotation"]
+        )
+        intervals = find_intervals_for_utr_consequence(
+            var_id=variant["variant_id"],
+            conseq_type=variant["five_prime_UTR_variant_consequence"],
+            conseq_dict=annotation,
+            cdna_pos=variant["cdna_pos"],
+            start_site=start_site,
+            buffer_length=buffer_length,
+            annotation_id=variant["variant_id"],
+            offsets=variant_db.utr_interval(variant),
+        )
+    except (KeyError, ValueError) as error:
+        return {**columns, "error": f"Incomplete annotation ({error})"}
+    return {
+        **columns,
+        "start": intervals.get("start"),
+        "end": intervals.get("end"),
+        "kozak_strength": intervals.get("kozak_strength"),
+    }
+
+
+def ndjson_line(row, columns=COLUMNS):
+    """
+    @returns a row as a line of JSON
+    """
+    return json.dumps({column: row.get(column) for column in columns}) + "\n"
+
+
+def tsv_line(row, columns=COLUMNS):
+    """
+    @returns a row as a line of TSV (the annotation as key:value pairs and
+    the VEP row as JSON)
+    """
+    values = []
+    for column in columns:
+        value = row.get(column)
+        if column == "annotation" and value:
+            value = ",".join(f"{key}:{item}" for key, item in value.items())
+        elif column == VEP_COLUMN and value:
+            value = json.dumps(value)
+        values.append("" if value is None else str(value).replace("\t", " "))
+    return "\t".join(values) + "\n"
+
+
+def stream_annotations(
+    records, buffer_length, chunk_size, line, header=None, with_vep=False
+):
+    """
+    Annotates the records a chunk at a time
+    A chunk whose lookups fail gets an error row per variant, as the
+    response has already started
+    @param line : formats a row as a line of output
+    @returns iterable of output lines
+    """
+    if header is not None:
+        yield header
+    start_sites = {}
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            return
+        with span("annotate_chunk"):
+            try:
+                rows = annotate_chunk(chunk, buffer_length, start_sites, with_vep)
+            except SQLiteError as error:
+                current_app.logger.error("Could not annotate a chunk: %s", error)
+                rows = [
+                    {
+                        "input": record.input,
+                        "variant_id": record.variant_id,
+                        "error": f"Database error occurred: {error}",
+                    }
+                    for record in chunk
+                ]
+        yield "".join(line(row) for row in rows)
+
+
+@annotate.route("/api/annotate", methods=["POST"])
+def annotate_variants_api():
+    """
+    A streamed API resource annotating a batch of variants
+    @param format : ndjson (default) or tsv
+    @param buffer : bases drawn past the start site (default 40, as the
+    viewer)
+    @param vep : true to add the full VEP row of each variant
+    """
+    output = request.args.get("format", "ndjson")
+    buffer_length = request.args.get("buffer", 40, type=int)
+    with_vep = request.args.get("vep", "false").lower() in ("true", "1")
+    columns = COLUMNS + (VEP_COLUMN,) if with_vep else COLUMNS
+    if output not in ("ndjson", "tsv"):
+        return jsonify({"message": "format must be ndjson or tsv", "data": []}), 400
+
+    try:
+        records = read_records()
+        # Fails before the response starts, rather than part way through it
+        features_db.get_exon_index()
+    except ValueError as error:
+        return jsonify({"message": str(error), "data": []}), 400
+    except SQLiteError as error:
+        return (
+            jsonify(
+                {
+                    "message": "Database error occurred: {}".format(str(error)),
+                    "data": [],
+                }
+            ),
+            500,
+        )
+
+    chunk_size = current_app.config["ANNOTATE_CHUNK_SIZE"]
+    if output == "tsv":
+        lines = stream_annotations(
+            records,
+            buffer_length,
+            chunk_size,
+            lambda row: tsv_line(row, columns),
+            "\t".join(columns) + "\n",
+            with_vep,
+        )
+        mimetype = "text/tab-separated-values"
+    else:
+        lines = stream_annotations(
+            records,
+            buffer_length,
+            chunk_size,
+            lambda row: ndjson_line(row, columns),
+            with_vep=with_vep,
+        )
+        mimetype = "application/x-ndjson"
+    return current_app.response_class(stream_with_context(lines), mimetype=mimetype)
@@ -8,6 +8,45 @@ class Config:
     FLASK_APP = 'app'
     DEBUG = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Query the live gnomAD API when the population store isn't mounted
+    GNOMAD_API_FALLBACK = True
+    # Pooled gnomAD client, see gnomad_client.py
+    GNOMAD_API_URL = 'https://gnomad.broadinstitute.org/api'
+    GNOMAD_TIMEOUT = 10
+    GNOMAD_POOL_SIZE = 10
+    GNOMAD_MAX_WORKERS = 8
+    GNOMAD_CACHE_SIZE = 1024
+    GNOMAD_CACHE_TTL = 3600
+    GNOMAD_STALE_TTL = 86400
+    # Read only sqlite3 connections, see database.py
+    DATABASE_IMMUTABLE = True
+    SQLITE_MMAP_SIZE = 2**31
+    SQLITE_CACHE_SIZE = 65536  # KiB per connection
+    SQLITE_CACHED_STATEMENTS = 256
+    # HTTP caching of the viewer routes, see http_cache.py
+    HTTP_CACHE_MAX_AGE = 3600
+    # Part of the ETags, e.g. a release tag (default a digest of the app's
+    # code and templates)
+    BUILD_VERSION = None
+    RESPONSE_CACHE_BYTES = 64 * 2**20  # Of rendered responses per worker, 0 disables
+    RESPONSE_CACHE_TTL = 3600
+    # gzip of the cached routes' responses (level 0 disables)
+    COMPRESS_LEVEL = 6
+    COMPRESS_MIN_SIZE = 1024  # bytes
+    # Pages of the windowed viewer APIs, see viewer.py
+    API_PAGE_SIZE = 500  # variants
+    CONSERVATION_PAGE_SIZE = 4096  # positions
+    API_MAX_PAGE_SIZE = 10000
+    # Variants read and annotated at a time by the batch API, see annotate.py
+    ANNOTATE_CHUNK_SIZE = 1000
+    # Fingerprinted static assets, see build_assets.py and static_assets.py
+    STATIC_BUILD_FOLDER = 'static_build'  # relative to the app package
+    STATIC_MAX_AGE = 31536000
+    # Request timing, see metrics.py
+    METRICS_ENABLED = True
+    SERVER_TIMING = True  # Per request Server-Timing headers
+    # Clients which may read /metrics (e.g. add the Prometheus scraper's)
+    METRICS_ALLOWED_NETWORKS = ['127.0.0.0/8', '::1/128']
 
 
 class DevelopmentConfig(Config):
@@ -17,8 +56,16 @@ class DevelopmentConfig(Config):
     PORT = 5000
     IMPACT_URL = 'http://127.0.0.1:5000/viewer/utr_impact'
     SEARCH_URL = 'http://127.0.0.1:5000/viewer/possible_variants'
+    # Relative to the app package (see database.normalise_path)
     VARIANT_DATABASE = 'sqlite:///../../../data/database/variant_store.db'
     FEATURES_DATABASE = 'sqlite:///../../../data/database/features.db'
+    POPULATION_DATABASE = 'sqlite:///../../../data/database/population_store.db'
+    CONSERVATION_TRACKS = '../../../data/database/conservation_tracks.f32'
+    # The databases may be rebuilt while developing
+    DATABASE_IMMUTABLE = False
+    RESPONSE_CACHE_BYTES = 0
+    # Serve app/static as it is edited
+    STATIC_BUILD_FOLDER = None
 
 
 class ProductionConfig(Config):
@@ -30,6 +77,8 @@ class ProductionConfig(Config):
     SEARCH_URL = 'https://vutr.rarediseasegenomics.org/viewer/possible_variants'
     VARIANT_DATABASE = '/db/variant_store.db'
     FEATURES_DATABASE = '/db/features.db'
+    POPULATION_DATABASE = '/db/population_store.db'
+    CONSERVATION_TRACKS = '/db/conservation_tracks.f32'
 
 
 config_by_name = dict(production=ProductionConfig, development=DevelopmentConfig)
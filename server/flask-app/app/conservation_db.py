@@ -0,0 +1,46 @@
+"""
+Functions to access the packed conservation / CADD track store
+(see track_store.py)
+"""
+
+import os
+
+from .database import normalise_path
+from .track_store import TrackStore
+
+_config = {'path': None}
+_stores = {}
+
+
+def init_app(app):
+    """
+    Init app
+    """
+    path = app.config.get('CONSERVATION_TRACKS')
+    _config['path'] = normalise_path(path, app.root_path) if path else None
+
+
+def is_available():
+    """
+    Whether a track store has been configured and exists on disk
+    """
+    return _config['path'] is not None and os.path.isfile(_config['path'])
+
+
+def get_store():
+    """
+    Gets the memory map of the track store (opened once per store, the
+    read only mapping can be shared by forked workers)
+    """
+    path = _config['path']
+    if path not in _stores:
+        _stores[path] = TrackStore(path)
+    return _stores[path]
+
+
+def get_tracks(ensembl_transcript_id, tracks=None):
+    """
+    Gets the score tracks of a transcript
+    @returns (first tpos, dictionary of track -> float32 array) or None
+    """
+    return get_store().get(ensembl_transcript_id, tracks)
@@ -0,0 +1,224 @@
+"""
+Per-worker connection manager for the read-only sqlite3 databases
+
+Each thread of a worker keeps one connection per database for the
+lifetime of the worker, opened in read-only (and by default immutable)
+URI mode with tuned pragmas. Statements are cached on the connection so
+repeated queries skip the prepare step.
+
+Under the gevent worker the sqlite3 calls (which would block the event
+loop) are run on the hub's pool of native threads, each of which keeps
+its own connection.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+
+def offload_pool():
+    """
+    The gevent hub's native threadpool, if the process has been monkey
+    patched (by the gevent gunicorn worker), otherwise None
+    """
+    try:
+        from gevent import monkey, get_hub  # pylint: disable=C0415,E0401
+    except ImportError:
+        return None
+    if not monkey.is_module_patched('socket'):
+        return None
+    return get_hub().threadpool
+
+
+def normalise_path(path, root=None):
+    """
+    Strips the SQLAlchemy style sqlite:/// prefix from a database path
+    @param root : the directory relative paths are resolved against (the
+    app package, so that the development paths don't depend on the
+    working directory), the working directory if None
+    """
+    if path.startswith('sqlite:///'):
+        path = path[len('sqlite:///') :]
+    if root is not None:
+        path = os.path.join(root, path)
+    return os.path.abspath(path)
+
+
+def json_object_sql(columns):
+    """
+    SQL for a JSON object of the columns of a row, so that SQLite
+    serialises the rows itself, e.g. json_group_array(json_object(...))
+    """
+    return 'json_object({})'.format(
+        ', '.join(f"'{column}', \"{column}\"" for column in columns)
+    )
+
+
+class ConnectionManager:
+    """
+    Opens a database once per worker thread and hands the connection out
+    to every query made by that thread
+    """
+
+    def __init__(self, config_key, row_factory=None):
+        self.config_key = config_key
+        self.row_factory = row_factory
+        self.path = None
+        self.immutable = True
+        self.mmap_size = 0
+        self.cache_size = 0
+        self.cached_statements = 128
+        self.offload = True
+        self._local = threading.local()
+        self._tables = None
+        self._columns = {}
+        # Called with (config_key, seconds) after each query, see metrics.py
+        self.observer = None
+
+    def init_app(self, app):
+        """
+        Reads the database location and tuning options from the app config
+        """
+        path = app.config.get(self.config_key)
+        self.path = normalise_path(path, app.root_path) if path else None
+        self.immutable = app.config.get('DATABASE_IMMUTABLE', True)
+        self.mmap_size = app.config.get('SQLITE_MMAP_SIZE', 2**31)
+        self.cache_size = app.config.get('SQLITE_CACHE_SIZE', 65536)
+        self.cached_statements = app.config.get('SQLITE_CACHED_STATEMENTS', 256)
+        self.offload = app.config.get('SQLITE_OFFLOAD', True)
+        # Drop connections to a previously configured database
+        self._local = threading.local()
+        self._tables = None
+        self._columns = {}
+
+    def is_available(self):
+        """
+        Whether the database has been configured and exists on disk
+        """
+        return self.path is not None and os.path.isfile(self.path)
+
+    def uri(self):
+        """
+        Read only URI for the database
+        """
+        uri = f'file:{quote(self.path)}?mode=ro'
+        if self.immutable:
+            uri += '&immutable=1'
+        return uri
+
+    def connect(self):
+        """
+        Opens a new tuned, read-only connection
+        """
+        conn = sqlite3.connect(
+            self.uri(),
+            uri=True,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            cached_statements=self.cached_statements,
+        )
+        conn.row_factory = self.row_factory
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        # Negative values are in KiB rather than pages
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('PRAGMA query_only = 1')
+        return conn
+
+    def get_db(self):
+        """
+        Gets this thread's connection, opening it on first use (and again
+        after a fork, as connections can't be shared across processes)
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = self.connect()
+            self._local.pid = os.getpid()
+        return conn
+
+    def run(self, func, *args):
+        """
+        Runs func(*args), on a native thread if the event loop would
+        otherwise be blocked
+        """
+        pool = offload_pool() if self.offload else None
+        if self.observer is None:
+            return func(*args) if pool is None else pool.apply(func, args)
+        start = time.perf_counter()
+        try:
+            return func(*args) if pool is None else pool.apply(func, args)
+        finally:
+            self.observer(self.config_key, time.perf_counter() - start)
+
+    def _fetchall(self, sql, params):
+        return self.get_db().execute(sql, params).fetchall()
+
+    def _fetchone(self, sql, params):
+        return self.get_db().execute(sql, params).fetchone()
+
+    def _fetchtuples(self, sql, params):
+        cursor = self.get_db().cursor()
+        cursor.row_factory = None
+        return cursor.execute(sql, params).fetchall()
+
+    def query(self, sql, params=()):
+        """
+        Runs a query
+        @returns all of the rows
+        """
+        return self.run(self._fetchall, sql, params)
+
+    def query_one(self, sql, params=()):
+        """
+        Runs a query
+        @returns the first row or None
+        """
+        return self.run(self._fetchone, sql, params)
+
+    def query_tuples(self, sql, params=()):
+        """
+        Runs a query without the row factory
+        @returns all of the rows as tuples
+        """
+        return self.run(self._fetchtuples, sql, params)
+
+    def query_value(self, sql, params=()):
+        """
+        Runs a query for a single value, e.g. the JSON text of a
+        json_group_array, which can go into a response as is
+        @returns the first column of the first row or None
+        """
+        rows = self.query_tuples(sql, params)
+        return rows[0][0] if rows else None
+
+    def columns(self, table):
+        """
+        The column names of a table, in order
+        """
+        if table not in self._columns:
+            self._columns[table] = [
+                row[1] for row in self.query_tuples(f'PRAGMA table_info("{table}")')
+            ]
+        return self._columns[table]
+
+    def has_table(self, name):
+        """
+        Whether the database has a table (optional tables are only
+        created by some pipeline stages)
+        """
+        if self._tables is None:
+            self._tables = {
+                row['name']
+                for row in self.query("SELECT name FROM sqlite_master WHERE type='table'")
+            }
+        return name in self._tables
+
+    def close(self):
+        """
+        Closes this thread's connection
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -2,15 +2,10 @@
 Functions to access features store database
 """
 
-import sqlite3
-from flask import current_app, g  # pylint: disable=E0401
-
-
-def init_app(app):
-    """
-    Init app
-    """
-    app.teardown_appcontext(close_db)
+from .coordinates import ExonIndex
+from .database import ConnectionManager
+from .identifiers import IdentifierResolver
+from .reference_data import GeneAnnotations, TEDistribution
 
 
 def dict_factory(cursor, row):
@@ -23,23 +18,184 @@ def dict_factory(cursor, row):
     return d
 
 
+manager = ConnectionManager('FEATURES_DATABASE', row_factory=dict_factory)
+# In-memory lookups, by (name, database path)
+_lookups = {}
+
+
+def init_app(app):
+    """
+    Init app
+    The genomic / transcript coordinate mapping needs the
+    transcript_exon_intervals table, so a database without it fails here
+    rather than on every request
+    """
+    manager.init_app(app)
+    if manager.is_available() and not has_table('transcript_exon_intervals'):
+        raise RuntimeError(
+            f'{manager.path} has no transcript_exon_intervals table, '
+            'create it with pipeline/src/database/exon_intervals.py'
+        )
+
+
 def get_db():
     """
-    Get variant database
+    Get the worker's connection to the features database
+    """
+    return manager.get_db()
+
+
+def query(sql, params=()):
+    """
+    Runs a query against the features database
+    """
+    return manager.query(sql, params)
+
+
+def query_one(sql, params=()):
+    """
+    Runs a query against the features database for a single row
+    """
+    return manager.query_one(sql, params)
+
+
+def query_value(sql, params=()):
+    """
+    Runs a query against the features database for a single value
+    """
+    return manager.query_value(sql, params)
+
+
+def query_tuples(sql, params=()):
+    """
+    Runs a query against the features database, returning plain tuples
+    """
+    return manager.query_tuples(sql, params)
+
+
+def columns(table):
+    """
+    The column names of a table of the features database
+    """
+    return manager.columns(table)
+
+
+def has_table(name):
+    """
+    Whether the features database has a table
+    """
+    return manager.has_table(name)
+
+
+def load_once(name, loader):
+    """
+    Builds an in-memory lookup of the database once
+    @param loader : function building the lookup, run through the manager
+    """
+    key = (name, manager.path)
+    if key not in _lookups:
+        _lookups[key] = manager.run(loader)
+    return _lookups[key]
+
+
+def get_exon_index():
+    """
+    Gets the ExonIndex of the transcript exons in the features database
+    (loaded once per database)
+    """
+    return load_once('exon_index', _load_exon_index)
+
+
+def _load_exon_index():
+    cursor = get_db().cursor()
+    cursor.row_factory = None
+    return ExonIndex(
+        cursor.execute(
+            """
+            SELECT chr, ensembl_transcript_id, strand,
+                genomic_start, genomic_end, transcript_start
+            FROM transcript_exon_intervals
+            """
+        )
+    )
+
+
+def get_identifier_resolver():
+    """
+    Gets the IdentifierResolver of the mane_summary table
+    (loaded once per database)
     """
-    if 'fdb' not in g:
-        g.fdb = sqlite3.connect(
-            current_app.config['FEATURES_DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES,
+    return load_once(
+        'identifiers',
+        lambda: IdentifierResolver(get_db().execute('SELECT * FROM mane_summary')),
+    )
+
+
+def get_gene_annotations():
+    """
+    Gets the GeneAnnotations of the constraint, OMIM and ClinGen tables
+    (loaded once per database)
+    """
+    return load_once('gene_annotations', _load_gene_annotations)
+
+
+def _load_gene_annotations():
+    cursor = get_db().cursor()
+    cursor.row_factory = None
+    return GeneAnnotations(
+        cursor.execute('SELECT ensembl_gene_id, loeuf FROM loeuf_constraint').fetchall(),
+        cursor.execute('SELECT ensembl_gene_id, omim_entry FROM omim').fetchall(),
+        cursor.execute('SELECT hgnc_symbol, haplo_score FROM clingen').fetchall(),
+    )
+
+
+def get_te_distribution():
+    """
+    Gets the TEDistribution of the ORFs (loaded once per database)
+    Databases without the precomputed distribution (see
+    pipeline/src/database/te_distribution.py) are read in full
+    """
+    if has_table('te_quantiles'):
+        return load_once('te_distribution', _load_te_distribution)
+    return load_once('te_distribution', _scan_te_distribution)
+
+
+def _load_te_distribution():
+    cursor = get_db().cursor()
+    cursor.row_factory = None
+    quantiles = [
+        value
+        for (value,) in cursor.execute(
+            'SELECT efficiency FROM te_quantiles ORDER BY quantile'
         )
-        g.fdb.row_factory = dict_factory
-    return g.fdb
+    ]
+    histogram = cursor.execute(
+        'SELECT bin_start, bin_end, orfs FROM te_histogram ORDER BY bin_start'
+    ).fetchall()
+    edges = [bin_start for bin_start, _, _ in histogram] + [
+        bin_end for _, bin_end, _ in histogram[-1:]
+    ]
+    return TEDistribution(quantiles, edges, [orfs for _, _, orfs in histogram])
+
+
+def _scan_te_distribution():
+    cursor = get_db().cursor()
+    cursor.row_factory = None
+    return TEDistribution.from_values(
+        value for (value,) in cursor.execute('SELECT efficiency FROM orf_features')
+    )
 
 
-def close_db(e=None):  # pylint: disable=W0613
+def load_lookups():
     """
-    Close the db
+    Loads the in-memory lookups of the features database, so that a
+    worker doesn't build them while answering its first requests (see
+    gunicorn.conf.py, which loads them in the master when the app is
+    preloaded so that the workers share them)
     """
-    fdb = g.pop('fdb', None)
-    if fdb is not None:
-        fdb.close()
+    if not manager.is_available():
+        return
+    get_identifier_resolver()
+    get_gene_annotations()
+    get_te_distribution()
+    get_exon_index()
@@ -2,64 +2,125 @@
 A set of sqlite3 helper functions
 """
 
+import base64
 import json
-import requests
+import re
+import sys
+import zlib
+import numpy as np  # pylint: disable=E0401
+from flask import current_app  # pylint: disable=E0401
 
 # import the datasets
 from . import variant_db
 from . import features_db
+from . import population_db
+from . import conservation_db
+from .database import json_object_sql
+from .http_cache import mark_uncacheable
+from .identifiers import ID_KEYS
+from .metrics import traced
+from .track_store import pack_transcript
+from .utr_intervals import interval_offsets, resolve_interval
+
+# The conservation / CADD scores plotted by the viewer
+CONSERVATION_TRACKS = ("phylop", "phred_cadd")
+# The colour and type of the feature drawn for each UTR consequence
+UTR_CONSEQUENCE_STYLES = {
+    "uAUG_gained": ("main", "uAUG_gained"),
+    "uAUG_lost": ("null", "uAUG_lost"),
+    "uSTOP_lost": ("main", "uSTOP_lost"),
+    "uSTOP_gained": ("main", "uSTOP_gained"),
+    "uFrameShift": ("main", "uFrameshift"),
+}
+# The viewer bundle the server reads (pipeline/src/database/viewer_bundles.py
+# writes the version), other bundles are rebuilt from the tables instead
+BUNDLE_VERSION = 3
+BUNDLE_KEYS = (
+    "ensembl_transcript_id",
+    "ensembl_gene_id",
+    "hgnc",
+    "name",
+    "refseq_match",
+    "other_transcripts",
+    "gene_features",
+    "five_prime_utr_stats",
+    "transcript_features",
+    "constraint",
+    "clingen_entry",
+    "omim_id",
+    "smorfs",
+    "few_possible_variants",
+)
+# Sort key of the consequence in the variant windows, as the row value
+# comparison of a NULL consequence would drop the variant from every page
+# (idx_variant_annotations_window of the variant store is built on it)
+CONSEQUENCE_KEY = "COALESCE(five_prime_UTR_variant_consequence, '')"
+
+
+@traced
+def get_te_distribution():
+    """
+    Gets the distribution of the translational efficiency of all orfs
+    @returns dictionary with the number of orfs and their histogram
+    """
+    distribution = features_db.get_te_distribution()
+    return {"orfs": len(distribution), "histogram": distribution.histogram()}
+
+
+@traced
+def get_orf_te_percentile(orf_id):
+    """
+    Gets the translational efficiency of an orf and its percentile rank
+    among all orfs
+    @param orf_id
+    @returns dictionary, None if the orf is not found
+    """
+    result = features_db.query_one(
+        "SELECT ensembl_transcript_id, efficiency FROM orf_features WHERE orf_id=?",
+        [orf_id],
+    )
+    if result is None:
+        return None
+    return {
+        "orf_id": orf_id,
+        "ensembl_transcript_id": result["ensembl_transcript_id"],
+        "efficiency": result["efficiency"],
+        "percentile": features_db.get_te_distribution().percentile_rank(
+            result["efficiency"]
+        ),
+    }
 
 
-def get_all_te_values():
-    """
-    Gets the translational efficiency values for all orfs
-    """
-    cursor = features_db.get_db()
-    query = cursor.execute("SELECT efficiency from orf_features")
-    result = [te["efficiency"] for te in query.fetchall() if te is not None]
-    features_db.close_db()
-    return result
-
-
+@traced
 def get_smorfs(enst):
     """
     Gets the smorfs using the ensembl_transcript_id
     """
 
-    cursor = features_db.get_db()
-    query = cursor.execute(
+    result = features_db.query(
         "SELECT * FROM smorf_locations WHERE ensembl_transcript_id=?", [enst]
     )
-    result = query.fetchall()
 
     if result is not None:
         return result
     return None
 
 
+@traced
 def get_omim_id(ensg):
     """
     Gets the omim value
     @returns string if found, else None
     """
-    cursor = features_db.get_db()
-    query = cursor.execute(
-        "SELECT omim_entry FROM omim WHERE ensembl_gene_id=?", [ensg]
-    )
-    result = query.fetchone()
-    if result is not None:
-        return result["omim_entry"]
-    return None
+    return features_db.get_gene_annotations().omim_entry(ensg)
 
 
+@traced
 def get_clingen_entry(hgnc):
     """
     Gets clingen data
     """
-    cursor = features_db.get_db()
-    query = cursor.execute("SELECT * FROM clingen WHERE hgnc_symbol=?", [hgnc])
-    result = query.fetchone()
-    return result["haplo_score"] if result is not None else "Not curated"
+    return features_db.get_gene_annotations().haplo_score(hgnc, "Not curated")
 
 
 def parse_five_prime_utr_variant_consequence(conseq_str):
@@ -74,31 +135,17 @@ def parse_five_prime_utr_variant_consequence(conseq_str):
     }
 
 
+@traced
 def search_enst_by_transcript_id(variant_id):
     """
     Find all of the transcripts associated with a gpos
+    (on the variant's chromosome)
     """
-    gpos = variant_id.split("-")[1]
-    cursor = features_db.get_db()
-
-    # Query and search for results
-    query = cursor.execute(
-        "SELECT ensembl_transcript_id FROM genome_to_transcript_coordinates WHERE genomic_pos=? ",  # noqa: E501 # pylint: disable=C0301
-        [gpos],
-    )
-    result = query.fetchall()
-    features_db.close_db()
-    return result
-
-
-def parse_values(val, start_site, buffer_length):
-    """
-    Converts the val into an int
-    """
-    if val == "NA":  # pylint: disable=R1705
-        return start_site + buffer_length
-    else:
-        return int(val)
+    chrom, gpos = variant_id.split("-")[0:2]
+    return [
+        {"ensembl_transcript_id": enst}
+        for enst in features_db.get_exon_index().transcripts_at(chrom, int(gpos))
+    ]
 
 
 def convert_uploaded_variation_to_variant_id(uploaded_variation):
@@ -108,6 +155,7 @@ def convert_uploaded_variation_to_variant_id(uploaded_variation):
     return uploaded_variation.replace("_", "-").replace("/", "-")
 
 
+@traced
 def get_utr_annotation_for_list_variants(
     list_variants, possible_variants_dict, start_site, buffer_length
 ):
@@ -115,233 +163,369 @@ def get_utr_annotation_for_list_variants(
     Get the utr annotation for a list of variants
     """
 
-    high_impact_utr_variants = list(
-        set(  # pylint: disable=R1718
-            [
-                v["variant_id"]
-                for v in possible_variants_dict
-                if v["variant_id"] in list_variants
-            ]
+    list_variants = set(list_variants)
+    return [
+        find_intervals_for_utr_consequence(
+            var_id=v["variant_id"],
+            conseq_type=v["five_prime_UTR_variant_consequence"],
+            conseq_dict=v["five_prime_UTR_variant_annotation"],
+            cdna_pos=v["cDNA_position"],
+            start_site=start_site,
+            buffer_length=buffer_length,
+            annotation_id=v["annotation_id"],
+            offsets=v["utr_interval"],
         )
-    )
-
-    if len(high_impact_utr_variants) > 0:
-        intervals = [
-            find_intervals_for_utr_consequence(
-                var_id=v["variant_id"],
-                conseq_type=v["five_prime_UTR_variant_consequence"],
-                conseq_dict=v["five_prime_UTR_variant_annotation"],
-                cdna_pos=get_cdna_pos(v["cDNA_position"]),
-                start_site=start_site,
-                buffer_length=buffer_length,
-                annotation_id=v["annotation_id"],
-            )
-            for v in possible_variants_dict
-            if v["variant_id"] in high_impact_utr_variants
-        ]
-        return intervals
-    return []
-
-
-def get_cdna_pos(p):
-    """
-    Dirty fix
-    """
-    if "-" in p:
-        return int(p.split("-")[0])
-    return int(p)
+        for v in possible_variants_dict
+        if v["variant_id"] in list_variants
+    ]
 
 
 def find_intervals_for_utr_consequence(
-    var_id, conseq_type, conseq_dict, cdna_pos, start_site, buffer_length, annotation_id
+    var_id,
+    conseq_type,
+    conseq_dict,
+    cdna_pos,
+    start_site,
+    buffer_length,
+    annotation_id,
+    offsets=None,
 ):
     """
     Parses the output of UTR annotator to a dictionary of
     intervals [start, end] for the visualization
+    @param start_site, buffer_length : integers
+    @param offsets : the variant's precomputed (interval_start,
+    interval_end) from the variant store, worked out from the annotation
+    if not given (see utr_intervals.py)
     """
-
-    # TODO: DIRTY FIX
-    if isinstance(cdna_pos, int):
-        cdna_pos = str(cdna_pos)
-    cdna_pos = int(cdna_pos.split("-")[0]) if "-" in cdna_pos else int(cdna_pos)
-
     intervals = {}
     intervals["variant_id"] = var_id
     intervals["annotation_id"] = annotation_id
-    conseq_dict = parse_five_prime_utr_variant_consequence(conseq_dict)
-    if conseq_type == "uAUG_gained":
-        # Done
-        intervals["start"] = cdna_pos
-        intervals["end"] = int(cdna_pos) + int(
-            parse_values(
-                conseq_dict["uAUG_gained_DistanceToStop"], start_site, buffer_length
-            )
+    # The variant store holds the annotation already parsed
+    if isinstance(conseq_dict, str):
+        conseq_dict = parse_five_prime_utr_variant_consequence(conseq_dict)
+    if conseq_type in UTR_CONSEQUENCE_STYLES:
+        if offsets is None:
+            offsets = interval_offsets(conseq_type, conseq_dict, cdna_pos)
+        intervals["start"], intervals["end"] = resolve_interval(
+            conseq_type, *offsets, start_site, buffer_length
         )
         intervals["viz_type"] = "New Feature"
-        intervals["viz_color"] = "main"
-        intervals["type"] = "uAUG_gained"
-        intervals["kozak_strength"] = conseq_dict["uAUG_gained_KozakStrength"]
+        intervals["viz_color"], intervals["type"] = UTR_CONSEQUENCE_STYLES[conseq_type]
+        intervals["kozak_strength"] = conseq_dict[f"{conseq_type}_KozakStrength"]
 
-    elif conseq_type == "uAUG_lost":
-        # Done
-        intervals["start"] = int(conseq_dict["uAUG_lost_CapDistanceToStart"])
+    intervals.update(conseq_dict)
 
-        intervals["end"] = int(start_site) - parse_values(
-            conseq_dict["uAUG_lost_DistanceToCDS"], start_site, buffer_length
-        )
-        intervals["viz_type"] = "New Feature"
-        intervals["viz_color"] = "null"
-        intervals["type"] = "uAUG_lost"
-        intervals["kozak_strength"] = conseq_dict["uAUG_lost_KozakStrength"]
-
-    elif conseq_type == "uSTOP_lost":
-        intervals["start"] = cdna_pos
-        if conseq_dict["uSTOP_lost_AltStop"] == "True":
-            intervals["end"] = int(conseq_dict["uSTOP_lost_AltStopDistanceToCDS"])
-        else:
-            intervals["end"] = start_site + buffer_length
-        intervals["viz_type"] = "New Feature"
-        intervals["viz_color"] = "main"
-        intervals["type"] = "uSTOP_lost"
-        intervals["kozak_strength"] = conseq_dict["uSTOP_lost_KozakStrength"]
-
-    elif conseq_type == "uSTOP_gained":
-        # Get the cdna position of the start site
-        intervals["start"] = start_site - int(
-            conseq_dict["uSTOP_gained_ref_StartDistanceToCDS"]
-        )
-        # cDNA position of the new stop gained
-        intervals["end"] = start_site - parse_values(
-            conseq_dict["uSTOP_gained_newSTOPDistanceToCDS"], start_site, buffer_length
-        )
-        intervals["viz_type"] = "New Feature"
-        intervals["viz_color"] = "main"
-        intervals["type"] = "uSTOP_gained"
-        intervals["kozak_strength"] = conseq_dict["uSTOP_gained_KozakStrength"]
-
-    # Once we have indels as well
-    elif conseq_type == "uFrameShift":
-        frame_shift_pos = int(start_site) - parse_values(
-            int(conseq_dict["uFrameShift_ref_StartDistanceToCDS"]),
-            start_site,
-            buffer_length,
-        )
+    return intervals
 
-        intervals["start"] = frame_shift_pos
-        intervals["end"] = frame_shift_pos + parse_values(
-            conseq_dict["uFrameShift_alt_type_length"], start_site, buffer_length
-        )
-        intervals["viz_type"] = "New Feature"
-        intervals["viz_color"] = "main"
-        intervals["type"] = "uFrameshift"
-        intervals["kozak_strength"] = conseq_dict["uFrameShift_KozakStrength"]
 
-    intervals.update(conseq_dict)
+ID_COLUMNS = [
+    "ensembl_transcript_id",
+    "ensembl_gene_id",
+    "ensembl_protein_id",
+    "ncbi_gene_id",
+    "refseq_transcript_id",
+    "refseq_protein_id",
+    "mane_status",
+    "name",
+    "hgnc_symbol",
+    "hgnc_id",
+]
 
-    return intervals
+
+@traced
+def resolve_identifier(identifier, entity=None):
+    """
+    Looks an identifier up in the in-memory mane_summary index
+    @param entity : the column of the identifier, guessed from its
+    prefix if not given
+    @returns the mane_summary row (dictionary) or None
+    """
+    resolver = features_db.get_identifier_resolver()
+    if entity is None:
+        return resolver.resolve(identifier)
+    return resolver.get(entity, identifier)
 
 
+@traced
 def convert_between_ids(from_id, from_entity, to_entity):
     """
     Converts between different entity
     """
-    list_possible_cols = [
-        "ensembl_transcript_id",
-        "ensembl_gene_id",
-        "ensembl_protein_id",
-        "ncbi_gene_id",
-        "refseq_transcript_id",
-        "refseq_protein_id",
-        "mane_status",
-        "name",
-        "hgnc_symbol",
-        "hgnc_id",
-    ]
-    if from_entity in list_possible_cols and to_entity in list_possible_cols:
-        rows = features_db.get_db()
-        query = f"SELECT {to_entity} FROM mane_summary WHERE {from_entity}='{from_id}'"
-        results = rows.execute(query).fetchone()
-        features_db.close_db()
+    if from_entity in ID_KEYS and to_entity in ID_COLUMNS:
+        row = resolve_identifier(from_id, from_entity)
+        if row is not None:
+            return row[to_entity]
+    elif from_entity in ID_COLUMNS and to_entity in ID_COLUMNS:
+        # Column names are checked above, the id is bound as a parameter
+        # so that the statement is cached on the connection
+        results = features_db.query_one(
+            f"SELECT {to_entity} FROM mane_summary WHERE {from_entity}=?", [from_id]
+        )
         if results is not None:
             return results[to_entity]
     return None
 
 
+@traced
+def convert_between_ids_batch(from_ids, from_entity, to_entity):
+    """
+    Converts a list of ids between entities
+    @returns dictionary of from_id -> to_id (missing ids are left out)
+    """
+    if from_entity not in ID_KEYS or to_entity not in ID_COLUMNS:
+        return {}
+    resolver = features_db.get_identifier_resolver()
+    rows = {from_id: resolver.get(from_entity, from_id) for from_id in set(from_ids)}
+    return {from_id: row[to_entity] for from_id, row in rows.items() if row is not None}
+
+
+@traced
 def get_genomic_features(ensg):
     """
     Gets the genomic features tab
     """
-    cursor = features_db.get_db()
-
     # Query and search for results
-    query = cursor.execute(
+    result = features_db.query(
         "SELECT * FROM mane_genomic_features WHERE ensembl_gene_id=? ", [ensg]
     )
-    result = query.fetchall()
-    features_db.close_db()
     return result
 
 
+@traced
+def get_genomic_features_batch(ensgs):
+    """
+    Gets the genomic features of a list of genes in a single query
+    @returns dictionary of ensembl_gene_id -> list of features
+    """
+    features = {ensg: [] for ensg in ensgs}
+    rows = features_db.query(
+        """
+            SELECT * FROM mane_genomic_features
+            WHERE ensembl_gene_id IN (SELECT value FROM json_each(?))
+        """,
+        [json.dumps(sorted(features))],
+    )
+    for row in rows:
+        features[row["ensembl_gene_id"]].append(row)
+    return features
+
+
+SEARCH_SEPARATORS = re.compile(r"[\s_:/>]+")
+SEARCH_CHROM_PREFIX = re.compile(r"^(CHR)?([0-9]{1,2}|X|Y|MT?)-(?=[0-9]|$)")
+
+
+def normalise_variant_search_term(search_term):
+    """
+    Normalises a partial variant id to a variant_search key, e.g.
+    chr5:150904976 T>A -> 150904976-T-A
+    (all variants of a transcript share a chromosome, so it is dropped)
+    """
+    term = SEARCH_SEPARATORS.sub("-", search_term.strip().upper())
+    term = SEARCH_CHROM_PREFIX.sub("", term)
+    if term.startswith("CHR"):
+        term = term[3:]
+    return term
+
+
+@traced
+def search_possible_variants(ensembl_transcript_id, search_term, limit=10):
+    """
+    Typeahead search of the possible variants of a transcript
+    Uses a prefix range scan on the variant_search index if the variant
+    store has one and a (full scan) substring match otherwise
+    @returns a list of variant ids
+    """
+    if not variant_db.has_table("variant_search"):
+        rows = variant_db.query(
+            """
+            SELECT variant_id
+            FROM variant_annotations
+            WHERE variant_id LIKE ? COLLATE NOCASE
+            AND ensembl_transcript_id = ?
+            LIMIT ?;
+            """,
+            ["%" + search_term + "%", ensembl_transcript_id, limit],
+        )
+        return [row["variant_id"] for row in rows]
+
+    prefix = normalise_variant_search_term(search_term)
+    if not prefix:
+        rows = variant_db.query(
+            "SELECT variant_id FROM variant_search WHERE ensembl_transcript_id = ? LIMIT ?",
+            [ensembl_transcript_id, limit],
+        )
+    else:
+        # Everything that starts with prefix sorts in [prefix, prefix + 1)
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        rows = variant_db.query(
+            """
+            SELECT variant_id
+            FROM variant_search
+            WHERE ensembl_transcript_id = ?
+            AND search_key >= ? AND search_key < ?
+            LIMIT ?;
+            """,
+            [ensembl_transcript_id, prefix, upper, limit],
+        )
+    return [row["variant_id"] for row in rows]
+
+
+@traced
+def get_possible_variants_window(
+    ensembl_transcript_id,
+    start=None,
+    end=None,
+    consequences=None,
+    after=None,
+    limit=500,
+):
+    """
+    Gets a page of the possible variants of a transcript whose first cDNA
+    position (see variant_db.cdna_start_column) is in [start, end],
+    ordered by it (variants without a cDNA position are never in a window)
+    The JSON array of the page is built by SQLite, without a Python
+    object per variant
+    @param start, end : default to the whole transcript
+    @param consequences : only variants with these UTR consequences
+    @param after : the key of the last variant of the previous page
+    @returns (JSON text of the variants, key of the last variant or None
+    on the last page)
+    """
+    start = 1 if start is None else start
+    end = sys.maxsize if end is None else end
+    cdna_start = variant_db.cdna_start_column()
+    consequence_filter = ""
+    params = [ensembl_transcript_id, start, end, *(after or [start - 1, "", ""])]
+    if consequences:
+        consequence_filter = """
+            AND five_prime_UTR_variant_consequence IN (SELECT value FROM json_each(?))
+        """
+        params.append(json.dumps(sorted(consequences)))
+    # One extra row tells whether there is another page, it is dropped
+    # from the array SQLite builds (so the rows are only sorted once)
+    row = variant_db.query_one(
+        f"""
+        SELECT
+            CASE WHEN n > ? THEN json_remove(variants, '$[#-1]') ELSE variants END
+                AS variants,
+            CASE WHEN n > ? THEN json_extract(variants, '$[#-2]') END AS last
+        FROM (
+            SELECT json_group_array(json_object(
+                'variant_id', variant_id,
+                'cdna_pos', cdna_pos,
+                'cdna_start', cdna_start,
+                'consequence', consequence
+            )) AS variants, count(*) AS n
+            FROM (
+                SELECT variant_id, cdna_pos, {cdna_start} AS cdna_start,
+                    five_prime_UTR_variant_consequence AS consequence
+                FROM variant_annotations
+                WHERE ensembl_transcript_id = ?
+                AND {cdna_start} BETWEEN ? AND ?
+                AND ({cdna_start}, variant_id, {CONSEQUENCE_KEY}) > (?, ?, ?)
+                {consequence_filter}
+                ORDER BY cdna_start, variant_id, {CONSEQUENCE_KEY}
+                LIMIT ?
+            )
+        )
+        """,
+        [limit, limit, *params, limit + 1],
+    )
+    if row["last"] is None:
+        return row["variants"], None
+    last = json.loads(row["last"])
+    # The key holds the consequence as CONSEQUENCE_KEY sorts it
+    return row["variants"], [
+        last["cdna_start"],
+        last["variant_id"],
+        last["consequence"] or "",
+    ]
+
+
+def encode_cursor(key):
+    """
+    Encodes the sort key of the last item of a page as an opaque
+    pagination cursor
+    """
+    return base64.urlsafe_b64encode(
+        json.dumps(key, separators=(",", ":")).encode("utf-8")
+    ).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a pagination cursor back into the sort key
+    @raises ValueError if the cursor is malformed
+    """
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except ValueError as error:
+        raise ValueError(f"Invalid cursor {cursor}") from error
+
+
+@traced
 def find_all_high_impact_utr_variants(ensembl_transcript_id):
     """
     Finds all possible UTR variants for a
      given transcript id from the database
     """
-    db = variant_db.get_db()
-    cursor = db.execute(
-        "SELECT variant_id FROM variant_annotations WHERE ensembl_transcript_id=?",
-        [ensembl_transcript_id],
+    return variant_db.get_transcript_variants(ensembl_transcript_id).variant_ids()
+
+
+@traced
+def find_few_utr_variants(ensembl_transcript_id, limit=5):
+    """
+    Finds the first few possible UTR variants of a transcript, the
+    examples of the viewer's variant search
+    @returns list of variant ids in database order
+    """
+    rows = variant_db.query(
+        "SELECT variant_id FROM variant_annotations "
+        "WHERE ensembl_transcript_id = ? LIMIT ?",
+        [ensembl_transcript_id, limit],
     )
-    rows = cursor.fetchall()
-    variant_db.close_db()
-    return [i[0] for i in rows]
+    return [row["variant_id"] for row in rows]
 
 
 def get_transcript_position(ensembl_transcript_id, gpos):
     """
     Gets the transcript position for the transcript / gpos combo
     """
-
-    db = features_db.get_db()
-    cursor = db.execute(
-        "SELECT transcript_pos FROM genome_to_transcript_coordinates WHERE ensembl_transcript_id=? AND genomic_pos=?",  # noqa: E501 # pylint: disable=C0301
-        [ensembl_transcript_id, int(gpos)],
-    )
-    result = cursor.fetchone()
-    features_db.close_db()
-    if result is not None:  # TODO
-        return result["transcript_pos"]
+    exon_map = features_db.get_exon_index().get(ensembl_transcript_id)
+    tpos = exon_map.to_transcript(int(gpos)) if exon_map is not None else None
+    if tpos is not None:  # TODO
+        return tpos
     return -1  # TODO Quick fix
 
 
-def get_possible_variants(ensembl_transcript_id):
+@traced
+def get_transcript_positions(ensembl_transcript_id, gpos_list):
     """
-    Searches the database for variants
+    Gets the transcript positions for a list of genomic positions
+    on a transcript
+    @param ensembl_transcript_id
+    @param gpos_list : list of genomic positions
+    @returns dictionary of gpos -> tpos (-1 when not found)
     """
-    var_db = variant_db.get_db()
-    cursor = var_db.execute(
-        "SELECT annotations FROM variant_annotations WHERE ensembl_transcript_id =?",
-        [ensembl_transcript_id],
-    )
-    rows = cursor.fetchall()
-    variants = [json.loads(row[0]) for row in rows]
-    variant_db.close_db()
-
-    # There might be multiple annotations for a given variant
-    range_vars = range(len(variants))
-    for idx, var in enumerate(variants):
-        var.update(
-            {
-                "variant_id": convert_uploaded_variation_to_variant_id(
-                    var["#Uploaded_variation"]
-                ),
-                "annotation_id": f"annotation-{var['#Uploaded_variation']}-{range_vars[idx]}",
-            }
-        )
+    return {
+        int(gpos): get_transcript_position(ensembl_transcript_id, gpos)
+        for gpos in gpos_list
+    }
 
-    return variants
 
+@traced
+def get_possible_variants(ensembl_transcript_id, variant_ids=None):
+    """
+    Gets the UTR annotations of the possible variants of a transcript
+    @param variant_ids : only return the annotations of these variants
+    """
+    return variant_db.get_transcript_variants(ensembl_transcript_id).annotations(
+        variant_ids
+    )
 
+
+@traced
 def process_gnomad_data(gnomad_data, ensembl_transcript_id):
     """
     Get the gnomAD data and find their transcript coordinates
@@ -360,13 +544,19 @@ def process_gnomad_data(gnomad_data, ensembl_transcript_id):
         # if len(var['ref']) == 1 and len(var['alt']) == 1
     ]
 
-    # Add the transcript relative positions for both
-    for clinvar in gnomad_data["clinvar_variants"]:
-        clinvar.update(
-            {"tpos": get_transcript_position(ensembl_transcript_id, clinvar["pos"])}
-        )
-    for var in gnomad_data["variants"]:
-        var.update({"tpos": get_transcript_position(ensembl_transcript_id, var["pos"])})
+    # Add the transcript relative positions for both in one lookup
+    # (as copies, the responses may be shared through the gnomAD client cache)
+    tpos = get_transcript_positions(
+        ensembl_transcript_id,
+        [var["pos"] for var in gnomad_data["clinvar_variants"] + gnomad_data["variants"]],
+    )
+    gnomad_data["clinvar_variants"] = [
+        {**clinvar, "tpos": tpos[int(clinvar["pos"])]}
+        for clinvar in gnomad_data["clinvar_variants"]
+    ]
+    gnomad_data["variants"] = [
+        {**var, "tpos": tpos[int(var["pos"])]} for var in gnomad_data["variants"]
+    ]
 
     # Get the variant ids
     gnomad_variants_list = list(
@@ -381,115 +571,185 @@ def process_gnomad_data(gnomad_data, ensembl_transcript_id):
     return gnomad_data, gnomad_variants_list, clinvar_variants_list
 
 
+@traced
 def get_transcript_features(ensembl_transcript_id):
     """
     Get transcript features
     """
-    db = features_db.get_db()
-    cursor = db.execute(
+    rows = features_db.query_one(
         "SELECT * FROM mane_transcript_features WHERE ensembl_transcript_id=?",
         [ensembl_transcript_id],
     )
-    rows = cursor.fetchone()
-    features_db.close_db()
     return rows
 
 
-def get_genome_to_transcript_intervals(ensembl_transcript_id, tpos):
+@traced
+def get_transcript_features_batch(ensembl_transcript_ids):
     """
-    Retrieves all of the features of the uorfs / uorfs
-    for the native architechure of the gene
+    Gets the transcript features of a list of transcripts in a single query
+    @returns dictionary of ensembl_transcript_id -> features (or None)
     """
-    db = features_db.get_db()
-    cursor = db.execute(
-        "SELECT genomic_pos FROM genome_to_transcript_coordinates WHERE ensembl_transcript_id=? AND transcript_pos=?",  # noqa: E501 # pylint: disable=C0301
-        [ensembl_transcript_id, tpos],
+    features = dict.fromkeys(ensembl_transcript_ids)
+    rows = features_db.query(
+        """
+            SELECT * FROM mane_transcript_features
+            WHERE ensembl_transcript_id IN (SELECT value FROM json_each(?))
+        """,
+        [json.dumps(sorted(features))],
+    )
+    features.update({row["ensembl_transcript_id"]: row for row in rows})
+    return features
+
+
+@traced
+def get_variant_annotations_batch(variant_ids, with_vep=False):
+    """
+    Gets the UTR annotations of a list of variants in a single query (a
+    seek per variant on the variant_id index)
+    @param with_vep : whether to select the annotations blob too (see
+    variant_db.decode_annotations)
+    @returns dictionary of variant_id -> variant_annotations rows, one per
+    transcript (variants not in the store are left out)
+    """
+    annotations = ", annotations" if with_vep else ""
+    rows = variant_db.query(
+        f"""
+            SELECT ensembl_transcript_id, variant_id, cdna_pos,
+                five_prime_UTR_variant_consequence,
+                five_prime_UTR_variant_annotation{variant_db.interval_columns()}
+                {annotations}
+            FROM variant_annotations
+            WHERE variant_id IN (SELECT value FROM json_each(?))
+        """,
+        [json.dumps(sorted(set(variant_ids)))],
     )
-    result = cursor.fetchone()
-    features_db.close_db()
-    return result["genomic_pos"]
+    variants = {}
+    for row in rows:
+        variants.setdefault(row["variant_id"], []).append(row)
+    return variants
 
 
+def get_genome_to_transcript_intervals(ensembl_transcript_id, tpos):
+    """
+    Gets the genomic position of a transcript position
+    @returns None if the transcript or the position isn't known
+    """
+    exon_map = features_db.get_exon_index().get(ensembl_transcript_id)
+    return exon_map.to_genome(tpos) if exon_map is not None else None
+
+
+@traced
 def get_all_orfs_features(ensembl_transcript_id):
     """
     Retrieves all of the features of the uorfs / uorfs
     for the native architechure of the gene
+    @returns the rows as JSON text (built by SQLite), for the page
     """
-    db = features_db.get_db()
-    cursor = db.execute(
-        "SELECT * FROM orf_features WHERE ensembl_transcript_id=?",
+    return features_db.query_value(
+        f"""
+        SELECT json_group_array({json_object_sql(features_db.columns("orf_features"))})
+        FROM orf_features WHERE ensembl_transcript_id=?
+        """,
         [ensembl_transcript_id],
     )
-    rows = cursor.fetchall()
-    features_db.close_db()
-
-    return rows
 
 
-def get_conservation_scores(ensembl_transcript_id):
+@traced
+def get_conservation_scores(
+    ensembl_transcript_id,
+    tracks=CONSERVATION_TRACKS,
+    start=None,
+    end=None,
+    limit=None,
+):
     """
-    Gets the phylop and gerp scores for a given transcript
+    Gets the per base conservation / CADD scores for a given transcript,
+    from the packed track store if there is one
     @param ensembl_transcript_id
-    @returns a dictionary of scores
-    """
-    db = features_db.get_db()
-    cursor = db.execute(
-        "SELECT tpos, phastcons, phylop, gerp_s, phred_cadd, raw_cadd FROM conservation_scores WHERE ensembl_transcript_id=?",
-        [ensembl_transcript_id],
-    )
-    rows = cursor.fetchall()
-    features_db.close_db()
-    return rows
+    @param tracks : the scores to get
+    @param start, end : only the scores of these transcript positions
+    @param limit : at most this many positions
+    @returns a dictionary of the first tpos, the number of positions,
+    each track as base64 encoded little endian float32 (NaN where a
+    position has no score) and the tpos following a limited window
+    (next_tpos, None if there are no more scores)
+    """
+    empty = {"tpos_start": 0, "length": 0, "tracks": {}, "next_tpos": None}
+    if conservation_db.is_available():
+        found = conservation_db.get_tracks(ensembl_transcript_id, tracks)
+    else:
+        # Plain tuples, straight into numpy
+        rows = features_db.query_tuples(
+            f"SELECT tpos, {', '.join(tracks)} FROM conservation_scores WHERE ensembl_transcript_id=?",  # noqa: E501 # pylint: disable=C0301
+            [ensembl_transcript_id],
+        )
+        found = None
+        if rows:
+            columns = np.array(rows, dtype=np.float64).T
+            tpos_start, packed = pack_transcript(
+                columns[0], dict(zip(tracks, columns[1:])), tracks
+            )
+            found = tpos_start, dict(zip(tracks, packed))
+
+    if found is None:
+        return empty
+    tpos_start, scores = found
+
+    # Slices of the memory map are still views
+    length = len(next(iter(scores.values())))
+    first = 0 if start is None else max(start - tpos_start, 0)
+    last = min(length if end is None else end - tpos_start + 1, length)
+    if first >= last:
+        return empty
+    next_tpos = None
+    if limit is not None and last - first > limit:
+        last = first + limit
+        next_tpos = tpos_start + last
+
+    return {
+        "tpos_start": tpos_start + first,
+        "length": last - first,
+        "tracks": {
+            track: base64.b64encode(values[first:last]).decode("ascii")
+            for track, values in scores.items()
+        },
+        "next_tpos": next_tpos,
+    }
 
 
+@traced
 def get_constraint_score(ensembl_gene_id):
     """
     Get constraint score from the features db
     @param ensembl_gene_id
     @returns constraint score (double)
     """
-    db = features_db.get_db()
-    cursor = db.execute(
-        "SELECT loeuf FROM loeuf_constraint WHERE ensembl_gene_id=?",
-        [ensembl_gene_id],
-    )
-    result = cursor.fetchone()
-    features_db.close_db()
-
-    # Fixes unfound loeuf scores
-    if result is not None:
-        return result["loeuf"]
-
-    return None
+    return features_db.get_gene_annotations().loeuf(ensembl_gene_id)
 
 
+@traced
 def find_transcript_ids_by_gene_id(ensembl_gene_id):
     """
     Finds all ensembl_transcript_ids by ensembl_gene_id
     """
-    db = features_db.get_db()
-    cursor = db.execute(
-        "SELECT ensembl_transcript_id FROM mane_summary WHERE ensembl_gene_id=?",
-        [ensembl_gene_id],
-    )
-    rows = cursor.fetchall()
-    features_db.close_db()
+    transcripts = features_db.get_identifier_resolver().gene_transcripts(ensembl_gene_id)
 
     # Check if there are any results
-    if len(rows) == 0:
+    if len(transcripts) == 0:
         return None
-    return [i["ensembl_transcript_id"] for i in rows]
+    return transcripts
 
 
+@traced
 def get_gnomad_variants_in_utr_regions(utr_regions):
     """
     gnomAD search in utr regions
     """
     searches = [
-        gnomad_api_search_by_region(
-            chrom=ur["chr"][3:], start=ur["start"], stop=ur["end"]
-        )["region"]
-        for ur in utr_regions
+        search["region"]
+        for search in search_by_regions(
+            [(ur["chr"][3:], ur["start"], ur["end"]) for ur in utr_regions]
+        )
     ]
     data = {}
     # Append
@@ -498,45 +758,226 @@ def get_gnomad_variants_in_utr_regions(utr_regions):
     return data
 
 
-def gnomad_api_search_by_region(chrom, start, stop, timeout=10):
-    # embed variables into the GraphQL query as literals
-    q = f"""
-    query {{
-      region(chrom: "{chrom}", start: {int(start)}, stop: {int(stop)}, reference_genome: GRCh38) {{
-        clinvar_variants {{
-          transcript_id ref pos alt in_gnomad clinvar_variation_id gold_stars variant_id
-          review_status hgvsc clinical_significance major_consequence
-        }}
-        variants(dataset: gnomad_r3) {{
-          ref pos alt hgvsc variant_id
-          genome {{ af an ac }}
-          transcript_consequence {{
-            is_mane_select major_consequence sift_prediction polyphen_prediction is_mane_select_version
-          }}
-        }}
-      }}
-    }}
-    """
-
-    headers = {
-        # content-type like your curl example
-        "Content-Type": "application/graphql; charset=utf-8",
-        # make the request appear like a normal client
-        "User-Agent": "curl/7.88.1",  # or "Mozilla/5.0"
-        "Referer": "https://gnomad.broadinstitute.org",
-        "Accept": "application/json",
-    }
+@traced
+def get_population_tracks(
+    ensembl_transcript_id, buffer_length=40, start=None, end=None
+):
+    """
+    Gets the gnomAD and ClinVar variants in the 5' UTR of a transcript and
+    the UTR annotations of those that are possible high impact variants
+    @param start, end : only the variants at these transcript positions
+    @returns dictionary (gnomad_data, gnomad_utr_impact and
+    clinvar_utr_impact) or None if the transcript isn't found
+    """
+    bundle = get_viewer_bundle(ensembl_transcript_id)
+    if bundle is not None:
+        gene_features = bundle["gene_features"]
+        five_prime_utr_stats = bundle["five_prime_utr_stats"]
+    else:
+        five_prime_utr_stats = get_transcript_features(ensembl_transcript_id)
+        gene_features = get_genomic_features(
+            convert_between_ids(
+                ensembl_transcript_id, "ensembl_transcript_id", "ensembl_gene_id"
+            )
+        )
+    if five_prime_utr_stats is None:
+        return None
+    start_site = five_prime_utr_stats["start_site_pos"]
 
-    resp = requests.post(
-        "https://gnomad.broadinstitute.org/api",
-        data=q.encode("utf-8"),
-        headers=headers,
-        timeout=timeout,
+    utr_regions = [i for i in gene_features if i["type"] == "five_prime_UTR"]
+    gnomad_data, gnomad_variants_list, clinvar_variants_list = process_gnomad_data(
+        get_gnomad_variants_in_utr_regions(utr_regions), ensembl_transcript_id
     )
+    if start is not None or end is not None:
+        gnomad_data, gnomad_variants_list, clinvar_variants_list = window_gnomad_data(
+            gnomad_data, start, end
+        )
+
+    # Only the annotations of the matched variants are decoded
+    return {
+        "gnomad_data": gnomad_data,
+        "gnomad_utr_impact": get_utr_annotation_for_list_variants(
+            gnomad_variants_list,
+            get_possible_variants(ensembl_transcript_id, gnomad_variants_list),
+            start_site,
+            buffer_length,
+        ),
+        "clinvar_utr_impact": get_utr_annotation_for_list_variants(
+            clinvar_variants_list,
+            get_possible_variants(ensembl_transcript_id, clinvar_variants_list),
+            start_site,
+            buffer_length,
+        ),
+    }
+
+
+@traced
+def window_gnomad_data(gnomad_data, start=None, end=None):
+    """
+    Filters processed gnomAD data (see process_gnomad_data) to the
+    variants with a transcript position in [start, end]
+    @returns (gnomad_data, gnomAD variant ids, ClinVar variant ids)
+    """
 
-    if resp.status_code != 200:
-        raise RuntimeError(
-            f"gnomAD API returned {resp.status_code}: {resp.text[:1000]!s}"
+    def in_window(var):
+        return (start is None or var["tpos"] >= start) and (
+            end is None or var["tpos"] <= end
         )
 
-    return resp.json()["data"]
+    gnomad_data = {
+        **gnomad_data,
+        "variants": [var for var in gnomad_data["variants"] if in_window(var)],
+        "clinvar_variants": [
+            var for var in gnomad_data["clinvar_variants"] if in_window(var)
+        ],
+    }
+    return (
+        gnomad_data,
+        list({var["variant_id"] for var in gnomad_data["variants"]}),
+        list({var["variant_id"] for var in gnomad_data["clinvar_variants"]}),
+    )
+
+
+@traced
+def search_by_regions(regions):
+    """
+    Searches for gnomAD and ClinVar variants in a list of (chrom, start, stop)
+    regions using the offline population store, only going to the gnomAD API
+    (in parallel) if the store is not available and GNOMAD_API_FALLBACK is set
+    """
+    if population_db.is_available():
+        return [population_store_search_by_region(*region) for region in regions]
+    if current_app.config.get("GNOMAD_API_FALLBACK"):
+        # Live data, which the build's ETag doesn't cover
+        mark_uncacheable()
+        return get_gnomad_client().search_regions(regions)
+    return [{"region": {"variants": [], "clinvar_variants": []}} for _ in regions]
+
+
+def get_gnomad_client():
+    """
+    Gets the worker's pooled and cached gnomAD client
+    """
+    return current_app.extensions["gnomad_client"]
+
+
+@traced
+def population_store_search_by_region(chrom, start, stop):
+    """
+    Drop-in replacement for gnomad_api_search_by_region that
+    answers from the offline population store
+    @returns the same structure as the gnomAD API {"region": {...}}
+    """
+    gnomad_rows = population_db.query(
+        "SELECT * FROM gnomad_variants WHERE chrom=? AND pos BETWEEN ? AND ?",
+        [str(chrom), int(start), int(stop)],
+    )
+    clinvar_rows = population_db.query(
+        "SELECT * FROM clinvar_variants WHERE chrom=? AND pos BETWEEN ? AND ?",
+        [str(chrom), int(start), int(stop)],
+    )
+
+    variants = [
+        {
+            "ref": row["ref"],
+            "pos": row["pos"],
+            "alt": row["alt"],
+            "hgvsc": row["hgvsc"],
+            "variant_id": row["variant_id"],
+            "genome": {"af": row["af"], "an": row["an"], "ac": row["ac"]},
+            "transcript_consequence": {
+                "is_mane_select": bool(row["is_mane_select"]),
+                "major_consequence": row["major_consequence"],
+                "sift_prediction": row["sift_prediction"],
+                "polyphen_prediction": row["polyphen_prediction"],
+                "is_mane_select_version": bool(row["is_mane_select"]),
+            },
+        }
+        for row in gnomad_rows
+    ]
+    # Stores built before the ClinVar transcripts were kept have no columns
+    has_transcripts = bool(clinvar_rows) and "hgvsc" in clinvar_rows[0].keys()
+    clinvar_variants = [
+        {
+            "transcript_id": row["transcript_id"] if has_transcripts else None,
+            "ref": row["ref"],
+            "pos": row["pos"],
+            "alt": row["alt"],
+            "in_gnomad": bool(row["in_gnomad"]),
+            "clinvar_variation_id": row["clinvar_variation_id"],
+            "gold_stars": row["gold_stars"],
+            "variant_id": row["variant_id"],
+            "review_status": row["review_status"],
+            "hgvsc": row["hgvsc"] if has_transcripts else None,
+            "clinical_significance": row["clinical_significance"],
+            "major_consequence": row["major_consequence"],
+        }
+        for row in clinvar_rows
+    ]
+    return {"region": {"variants": variants, "clinvar_variants": clinvar_variants}}
+
+
+@traced
+def gnomad_api_search_by_region(chrom, start, stop):
+    """
+    Searches the gnomAD API for a region through the shared client
+    """
+    return get_gnomad_client().search_region(chrom, start, stop)
+
+
+@traced
+def get_viewer_bundle(ensembl_transcript_id):
+    """
+    Gets the precomputed static viewer data for a transcript
+    (built by pipeline/src/database/viewer_bundles.py)
+    @returns dictionary or None if there isn't a bundle, or it was built
+    for another BUNDLE_VERSION or lacks one of the BUNDLE_KEYS
+    """
+    if not features_db.has_table("viewer_bundles"):
+        return None
+    row = features_db.query_one(
+        "SELECT bundle FROM viewer_bundles WHERE ensembl_transcript_id=?",
+        [ensembl_transcript_id],
+    )
+    if row is None:
+        return None
+    bundle = json.loads(zlib.decompress(row["bundle"]))
+    if bundle.get("bundle_version") != BUNDLE_VERSION or any(
+        key not in bundle for key in BUNDLE_KEYS
+    ):
+        return None
+    return bundle
+
+
+@traced
+def build_viewer_bundle(ensembl_transcript_id):
+    """
+    Collects the static viewer data for a transcript from the
+    individual tables, for databases without viewer bundles
+    @returns dictionary with the same keys as a viewer bundle
+    """
+    # All of the transcript's ids in one lookup
+    summary = resolve_identifier(ensembl_transcript_id, "ensembl_transcript_id") or {}
+    ensembl_gene_id = summary.get("ensembl_gene_id")
+    hgnc = summary.get("hgnc_symbol")
+
+    return {
+        "ensembl_transcript_id": ensembl_transcript_id,
+        "ensembl_gene_id": ensembl_gene_id,
+        "hgnc": hgnc,
+        "name": summary.get("name"),
+        "refseq_match": summary.get("refseq_transcript_id"),
+        "other_transcripts": [
+            t
+            for t in find_transcript_ids_by_gene_id(ensembl_gene_id)
+            if t != ensembl_transcript_id
+        ],
+        "gene_features": get_genomic_features(ensembl_gene_id),
+        "five_prime_utr_stats": get_transcript_features(ensembl_transcript_id),
+        "transcript_features": get_all_orfs_features(ensembl_transcript_id),
+        "constraint": get_constraint_score(ensembl_gene_id),
+        "clingen_entry": get_clingen_entry(hgnc),
+        "omim_id": get_omim_id(ensembl_gene_id),
+        "smorfs": get_smorfs(ensembl_transcript_id),
+        "few_possible_variants": find_few_utr_variants(ensembl_transcript_id),
+    }
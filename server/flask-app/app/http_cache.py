@@ -0,0 +1,252 @@
+"""
+HTTP caching keyed on the database and app build
+
+The responses of the cached routes only depend on the request, the
+databases and the app itself (its code, templates and static asset
+build), so the build identifier (derived from the database files and the
+app version) and the URL make a strong ETag. Browsers and proxies are
+sent Cache-Control / ETag / Last-Modified headers and conditional
+requests are answered with 304 without running the view. Rendered
+responses can also be kept in an in-process LRU, bounded by the size of
+their bodies, which is cleared whenever the build changes
+
+Responses built from the live gnomAD API (see mark_uncacheable) don't
+only depend on the databases, so they are neither cached nor given an
+ETag
+
+Responses are gzipped for clients that accept it, the encoding is part of
+the ETag and of the LRU key so each representation is compressed once
+"""
+
+import gzip
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, g, make_response, request  # pylint: disable=E0401
+from werkzeug.http import is_resource_modified  # pylint: disable=E0401
+
+from .database import normalise_path
+from .gnomad_client import MISS, TTLLRUCache
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html', 'text/plain')
+# Not part of the app version (the asset build has its own digest)
+SKIPPED_FOLDERS = ('static', 'static_build', '__pycache__')
+DATABASE_KEYS = (
+    'FEATURES_DATABASE',
+    'VARIANT_DATABASE',
+    'POPULATION_DATABASE',
+    'CONSERVATION_TRACKS',
+)
+
+
+class BuildState:
+    """
+    The current build identifier and the rendered response cache
+    """
+
+    def __init__(self, paths, cache_bytes, cache_ttl, version='', version_mtime=0):
+        self.paths = paths
+        self.version = version
+        self.version_mtime = version_mtime
+        self.build_id = None
+        self.last_modified = None
+        # Weighed by the length of the body of the cached responses
+        self.cache = (
+            TTLLRUCache(
+                maxsize=cache_bytes,
+                ttl=cache_ttl,
+                stale_ttl=0,
+                weigh=lambda cached: len(cached[0]),
+            )
+            if cache_bytes
+            else None
+        )
+
+    def refresh(self):
+        """
+        Re-derives the build identifier from the database files (a stat
+        per file), clearing the response cache if it has changed
+        (immutable connections only see a rebuilt database after a
+        restart, so production builds change on deploy)
+        @returns the build identifier
+        """
+        digest = hashlib.sha1(f'{self.version};'.encode())
+        mtime = self.version_mtime
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            digest.update(
+                f'{path}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns};'.encode()
+            )
+            mtime = max(mtime, stat.st_mtime)
+        build_id = digest.hexdigest()[0:16]
+        if build_id != self.build_id:
+            self.build_id = build_id
+            self.last_modified = datetime.fromtimestamp(int(mtime), tz=timezone.utc)
+            if self.cache is not None:
+                self.cache.clear()
+        return build_id
+
+
+def app_version(app):
+    """
+    The version of the app for the build identifier : BUILD_VERSION, or a
+    digest of its modules and templates, and the digest of the static
+    asset build if there is one (set up by static_assets.init_app first)
+    @returns (version, modification time)
+    """
+    version = app.config.get('BUILD_VERSION')
+    mtime = 0
+    if not version:
+        digest = hashlib.sha1()
+        for root, dirs, files in os.walk(app.root_path):
+            dirs[:] = sorted(d for d in dirs if d not in SKIPPED_FOLDERS)
+            for name in sorted(files):
+                if name.endswith(('.py', '.html')):
+                    path = os.path.join(root, name)
+                    with open(path, 'rb') as source:
+                        digest.update(source.read())
+                    mtime = max(mtime, os.stat(path).st_mtime)
+        version = digest.hexdigest()[0:16]
+    assets = app.extensions.get('static_assets')
+    if assets is not None:
+        version = f'{version}:{assets.digest}'
+        mtime = max(mtime, assets.mtime)
+    return version, mtime
+
+
+def init_app(app):
+    """
+    Sets up the build state from the app configuration
+    """
+    paths = [
+        normalise_path(app.config[key], app.root_path)
+        for key in DATABASE_KEYS
+        if app.config.get(key)
+    ]
+    app.extensions['http_cache'] = BuildState(
+        paths,
+        app.config.get('RESPONSE_CACHE_BYTES', 0),
+        app.config.get('RESPONSE_CACHE_TTL', 3600),
+        *app_version(app),
+    )
+
+
+def get_build_id():
+    """
+    @returns the identifier of the current database build
+    """
+    return current_app.extensions['http_cache'].refresh()
+
+
+def mark_uncacheable():
+    """
+    Marks the response of the current request as one that must not be
+    cached, e.g. as it holds data fetched from the gnomAD API
+    """
+    g.uncacheable = True
+
+
+def cached_response(view):
+    """
+    Decorator adding conditional GET and response caching to a route
+    Only 200 responses are cached, unless marked uncacheable
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        state = current_app.extensions['http_cache']
+        build_id = state.refresh()
+        encoding = 'gzip' if accepts_gzip() else 'identity'
+        etag = hashlib.sha1(
+            f'{build_id}:{encoding}:{request.full_path}'.encode()
+        ).hexdigest()
+
+        if not is_resource_modified(
+            request.environ, etag=etag, last_modified=state.last_modified
+        ):
+            response = current_app.response_class(status=304)
+            return add_cache_headers(response, etag, state.last_modified)
+
+        key = (build_id, encoding, request.full_path)
+        if state.cache is not None:
+            cached, cache_state = state.cache.get(key)
+            if cache_state != MISS:
+                body, status, mimetype, content_encoding = cached
+                response = current_app.response_class(
+                    body, status=status, mimetype=mimetype
+                )
+                if content_encoding:
+                    response.content_encoding = content_encoding
+                response.headers['X-Response-Cache'] = 'hit'
+                return add_cache_headers(response, etag, state.last_modified)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200:
+            return response
+        if encoding == 'gzip':
+            compress_response(response)
+        if g.get('uncacheable'):
+            response.vary.add('Accept-Encoding')
+            response.cache_control.no_store = True
+            return response
+        if state.cache is not None and not response.direct_passthrough:
+            state.cache.set(
+                key,
+                (
+                    response.get_data(),
+                    response.status_code,
+                    response.mimetype,
+                    response.content_encoding,
+                ),
+            )
+        return add_cache_headers(response, etag, state.last_modified)
+
+    return wrapper
+
+
+def accepts_gzip():
+    """
+    Whether compression is enabled and the client accepts gzip
+    """
+    return (
+        current_app.config.get('COMPRESS_LEVEL', 0) > 0
+        and request.accept_encodings.quality('gzip') > 0
+    )
+
+
+def compress_response(response):
+    """
+    Gzips a response body in place if it is worth compressing
+    """
+    if (
+        response.direct_passthrough
+        or response.content_encoding
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return
+    body = response.get_data()
+    if len(body) < current_app.config.get('COMPRESS_MIN_SIZE', 1024):
+        return
+    response.set_data(
+        gzip.compress(
+            body, compresslevel=current_app.config['COMPRESS_LEVEL'], mtime=0
+        )
+    )
+    response.content_encoding = 'gzip'
+
+
+def add_cache_headers(response, etag, last_modified):
+    """
+    Adds the ETag, Last-Modified, Cache-Control and Vary headers
+    """
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get('HTTP_CACHE_MAX_AGE', 3600)
+    return response
@@ -0,0 +1,180 @@
+"""
+Resolves the gene and transcript identifiers of the MANE transcripts
+
+IdentifierResolver holds the mane_summary table of the features database
+in hash maps, one per identifier, so any identifier of a transcript
+(Ensembl transcript / gene / protein, RefSeq transcript / protein, NCBI
+gene, HGNC symbol or HGNC ID) resolves to its whole mane_summary row in
+a single lookup. Versioned ids (ENST00000274599.6, NM_001754.5) match
+the unversioned ones and symbols / HGNC IDs match in any case
+
+The rows are kept as TranscriptSummary records (with __slots__) rather
+than dictionaries, see coordinates.py on sharing them between workers
+"""
+
+import re
+
+# The columns of mane_summary (see pipeline/src/database/model.py)
+SUMMARY_COLUMNS = (
+    "ensembl_transcript_id",
+    "ensembl_gene_id",
+    "ensembl_protein_id",
+    "ncbi_gene_id",
+    "refseq_transcript_id",
+    "refseq_protein_id",
+    "mane_status",
+    "name",
+    "hgnc_symbol",
+    "hgnc_id",
+)
+# Identifier columns of mane_summary which are looked up
+ID_KEYS = (
+    "ensembl_transcript_id",
+    "ensembl_gene_id",
+    "ensembl_protein_id",
+    "refseq_transcript_id",
+    "refseq_protein_id",
+    "ncbi_gene_id",
+    "hgnc_symbol",
+    "hgnc_id",
+)
+# Columns whose ids may carry a version suffix
+VERSIONED_KEYS = (
+    "ensembl_transcript_id",
+    "ensembl_gene_id",
+    "ensembl_protein_id",
+    "refseq_transcript_id",
+    "refseq_protein_id",
+)
+# The column of an identifier, from its prefix (HGNC symbols otherwise)
+ID_PREFIXES = (
+    ("ENST", "ensembl_transcript_id"),
+    ("ENSG", "ensembl_gene_id"),
+    ("ENSP", "ensembl_protein_id"),
+    ("NM_", "refseq_transcript_id"),
+    ("NR_", "refseq_transcript_id"),
+    ("NP_", "refseq_protein_id"),
+    ("HGNC:", "hgnc_id"),
+)
+VERSION_RE = re.compile(r"\.\d+$")
+# Genes with MANE Plus Clinical transcripts resolve to the MANE Select
+PREFERRED_STATUS = "MANE Select"
+
+
+def normalise_id(identifier, key):
+    """
+    @returns the lookup key of an identifier of a column
+    """
+    identifier = str(identifier).strip().upper()
+    if key in VERSIONED_KEYS:
+        identifier = VERSION_RE.sub("", identifier)
+    return identifier
+
+
+def identifier_key(identifier):
+    """
+    @returns the column an identifier belongs to, guessed from its prefix
+    """
+    identifier = str(identifier).strip().upper()
+    for prefix, key in ID_PREFIXES:
+        if identifier.startswith(prefix):
+            return key
+    return "ncbi_gene_id" if identifier.isdigit() else "hgnc_symbol"
+
+
+class TranscriptSummary:
+    """
+    A mane_summary row, read like a dictionary (row["hgnc_symbol"])
+    """
+
+    __slots__ = SUMMARY_COLUMNS
+
+    def __init__(self, row):
+        """
+        @param row : dictionary of the columns
+        """
+        for column in SUMMARY_COLUMNS:
+            setattr(self, column, row.get(column))
+
+    def __getitem__(self, column):
+        if column not in SUMMARY_COLUMNS:
+            raise KeyError(column)
+        return getattr(self, column)
+
+    def get(self, column, default=None):
+        """
+        @returns the value of a column, default for unknown columns
+        """
+        return getattr(self, column) if column in SUMMARY_COLUMNS else default
+
+    def to_dict(self):
+        """
+        @returns the row as a dictionary
+        """
+        return {column: getattr(self, column) for column in SUMMARY_COLUMNS}
+
+
+class IdentifierResolver:
+    """
+    The mane_summary rows keyed by each of their identifiers
+    """
+
+    __slots__ = ("rows", "_maps", "_gene_transcripts")
+
+    def __init__(self, rows):
+        """
+        @param rows : the mane_summary rows (dictionaries)
+        """
+        self.rows = tuple(TranscriptSummary(row) for row in rows)
+        self._maps = {key: {} for key in ID_KEYS}
+        gene_transcripts = {}
+        for row in self.rows:
+            preferred = row.mane_status == PREFERRED_STATUS
+            for key, mapping in self._maps.items():
+                if row[key] is None:
+                    continue
+                lookup = normalise_id(row[key], key)
+                if lookup not in mapping or preferred:
+                    mapping[lookup] = row
+            if row.ensembl_gene_id is not None:
+                gene_transcripts.setdefault(
+                    normalise_id(row.ensembl_gene_id, "ensembl_gene_id"), []
+                ).append(row.ensembl_transcript_id)
+        self._gene_transcripts = {
+            gene: tuple(transcripts) for gene, transcripts in gene_transcripts.items()
+        }
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, key, identifier):
+        """
+        @param key : the column of the identifier, e.g. hgnc_symbol
+        @returns the mane_summary row of an identifier (None if it is
+        not known)
+        """
+        mapping = self._maps.get(key)
+        if mapping is None or identifier is None:
+            return None
+        return mapping.get(normalise_id(identifier, key))
+
+    def resolve(self, identifier):
+        """
+        @returns the mane_summary row of an identifier of any kind (None
+        if it is not known)
+        """
+        if identifier is None:
+            return None
+        return self.get(identifier_key(identifier), identifier)
+
+    def gene_transcripts(self, ensembl_gene_id):
+        """
+        @returns the ids of the MANE transcripts of a gene
+        """
+        if ensembl_gene_id is None:
+            return []
+        return list(
+            self._gene_transcripts.get(
+                normalise_id(ensembl_gene_id, "ensembl_gene_id"), []
+            )
+        )
@@ -11,12 +11,13 @@ from flask import (  # pylint: disable=E0401
 )
 
 from .helpers import (
-    convert_between_ids,
+    convert_between_ids_batch,
+    resolve_identifier,
     search_enst_by_transcript_id,
-    get_transcript_features,
-    get_genomic_features,
-    find_transcript_ids_by_gene_id
+    get_transcript_features_batch,
+    get_genomic_features_batch,
 )
+from .metrics import span
 
 main = Blueprint('main', __name__)
 
@@ -30,16 +31,10 @@ def gene_search():
     if re.search(r'\d-\d+-\w-\w', query):
         return redirect(url_for('main.search_variant', variant=query))
 
-    elif query[0:4] == 'ENSG':
-        ensembl_transcript_id = convert_between_ids(
-        query, 'ensembl_gene_id', 'ensembl_transcript_id'
-    )   
-    else: 
-        ensembl_transcript_id = convert_between_ids(
-            query, 'hgnc_symbol', 'ensembl_transcript_id'
-        )
-        
-    
+    # Any gene or transcript id (Ensembl, RefSeq, HGNC symbol or ID)
+    summary = resolve_identifier(query)
+    ensembl_transcript_id = summary['ensembl_transcript_id'] if summary else None
+
     if ensembl_transcript_id is not None:
         return redirect(
             url_for('viewer.viewer_page', ensembl_transcript_id=ensembl_transcript_id)
@@ -56,26 +51,33 @@ def search_variant(variant):
     # falls under
     # Extract Genomic position
     variant_list = search_enst_by_transcript_id(variant)
+
+    # Everything for all of the transcripts in a constant number of queries
+    transcript_ids = [enst['ensembl_transcript_id'] for enst in variant_list]
+    gene_ids = convert_between_ids_batch(
+        transcript_ids, 'ensembl_transcript_id', 'ensembl_gene_id'
+    )
+    gene_features = get_genomic_features_batch(set(gene_ids.values()))
+    transcript_features = get_transcript_features_batch(transcript_ids)
+
     variant_dat_list = []
-    for enst in variant_list :
-        print(enst)
+    for enst in transcript_ids:
         variant_dat = {}
-        variant_dat['ensembl_transcript_id'] = enst['ensembl_transcript_id']
-        variant_dat['ensembl_gene_id'] = convert_between_ids(enst['ensembl_transcript_id'],
-        'ensembl_transcript_id', 'ensembl_gene_id')
-        variant_dat['gene_features'] = get_genomic_features(
-            variant_dat['ensembl_gene_id'])
-        variant_dat['five_prime_utr_stats'] = get_transcript_features(enst['ensembl_transcript_id'])
+        variant_dat['ensembl_transcript_id'] = enst
+        variant_dat['ensembl_gene_id'] = gene_ids.get(enst)
+        variant_dat['gene_features'] = gene_features.get(variant_dat['ensembl_gene_id'], [])
+        variant_dat['five_prime_utr_stats'] = transcript_features[enst]
         variant_dat_list.append(variant_dat)
 
     impact_url = current_app.config['IMPACT_URL']
-    return render_template(
-        'variant.html',
-        variant_list=variant_list,
-        variant=variant,
-        variant_dat_list=variant_dat_list,
-        impact_url=impact_url
-    )
+    with span('render_template'):
+        return render_template(
+            'variant.html',
+            variant_list=variant_list,
+            variant=variant,
+            variant_dat_list=variant_dat_list,
+            impact_url=impact_url
+        )
 
 
 @main.route('/gene_not_found')
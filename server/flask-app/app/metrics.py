@@ -0,0 +1,359 @@
+"""
+Request timing and Prometheus metrics
+
+Spans time the helpers, the database queries, the gnomAD API calls and
+the template rendering. The spans of a request are summed by name and
+sent back in its Server-Timing header, e.g.
+
+    Server-Timing: db;dur=3.102;desc="7 queries", get_smorfs;dur=0.412, ...
+
+and every span, request and query is also recorded in latency histograms
+published in the Prometheus text format at /metrics, along with the
+query counts and the hit rates of the in-process caches. /metrics only
+answers the clients of METRICS_ALLOWED_NETWORKS (loopback by default)
+
+Every gnomAD API request is a gnomad_api span, including those the
+client makes on its own threads (the parallel region fetches and the
+background refresh of stale responses). Those have no request to add
+to, so they are only in the histograms, not in Server-Timing
+
+Metrics are kept per worker process, so with several gunicorn workers
+each scrape only sees the worker which served it
+"""
+
+import ipaddress
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from flask import (  # pylint: disable=E0401
+    abort,
+    current_app,
+    g,
+    has_app_context,
+    request,
+)
+
+# Seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LABEL_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n'})
+
+_config = {'enabled': False, 'server_timing': False, 'allowed_networks': ()}
+
+
+class Histogram:
+    """
+    A Prometheus histogram with a fixed set of labels
+    """
+
+    def __init__(self, name, documentation, labels, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """
+        Records a value for the label values
+        """
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per bucket counts (the last for +Inf) then the sum
+                series = [0] * (len(self.buckets) + 1) + [0.0]
+                self._series[label_values] = series
+            series[i] += 1
+            series[-1] += value
+
+    def expose(self):
+        """
+        @returns the lines of the text format
+        """
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for label_values, values in series:
+            labels = format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                bucket = f'{labels},le="{bound}"' if labels else f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{{{bucket}}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class Counter:
+    """
+    A Prometheus counter with a fixed set of labels
+    """
+
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        """
+        Increments the counter of the label values
+        """
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def expose(self):
+        """
+        @returns the lines of the text format
+        """
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} counter',
+        ]
+        with self._lock:
+            series = sorted(self._series.items())
+        lines.extend(
+            f'{self.name}{{{format_labels(self.labels, label_values)}}} {value}'
+            for label_values, value in series
+        )
+        return lines
+
+
+def format_labels(names, values):
+    """
+    @returns the name="value" pairs of a series
+    """
+    return ','.join(
+        '{}="{}"'.format(name, str(value).translate(LABEL_ESCAPES))
+        for name, value in zip(names, values)
+    )
+
+
+REQUEST_SECONDS = Histogram(
+    'vutr_request_duration_seconds',
+    'Time to serve a request',
+    ('endpoint', 'method', 'status'),
+)
+SPAN_SECONDS = Histogram(
+    'vutr_span_duration_seconds',
+    'Time spent in a helper, external call or template rendering',
+    ('span',),
+)
+QUERY_SECONDS = Histogram(
+    'vutr_db_query_duration_seconds',
+    'Time to run a database query',
+    ('database',),
+)
+QUERIES = Counter('vutr_db_queries_total', 'Database queries run', ('database',))
+GNOMAD_SECONDS = Histogram(
+    'vutr_gnomad_request_duration_seconds',
+    'Time for the gnomAD API to answer a request',
+    ('status',),
+)
+METRICS = (REQUEST_SECONDS, SPAN_SECONDS, QUERY_SECONDS, QUERIES, GNOMAD_SECONDS)
+
+
+def init_app(app):
+    """
+    Times the requests, database queries and gnomAD calls of the app and
+    adds the /metrics endpoint
+    """
+    _config['enabled'] = app.config.get('METRICS_ENABLED', True)
+    _config['server_timing'] = app.config.get('SERVER_TIMING', True)
+    _config['allowed_networks'] = tuple(
+        ipaddress.ip_network(network)
+        for network in app.config.get('METRICS_ALLOWED_NETWORKS', ())
+    )
+    if not _config['enabled']:
+        return
+    # pylint: disable=C0415
+    from . import features_db, variant_db, population_db
+
+    for manager in (features_db.manager, variant_db.manager, population_db.manager):
+        manager.observer = observe_query
+    if 'gnomad_client' in app.extensions:
+        app.extensions['gnomad_client'].observer = observe_gnomad
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+def record_span(name, seconds, unit=None):
+    """
+    Records the time spent in a span, adding it to the request's
+    Server-Timing entries
+    @param unit : what the span counts in Server-Timing (e.g. queries)
+    """
+    SPAN_SECONDS.observe(seconds, name)
+    if _config['server_timing'] and has_app_context():
+        timings = g.setdefault('server_timing', {})
+        total, count, _ = timings.get(name, (0.0, 0, unit))
+        timings[name] = (total + seconds, count + 1, unit)
+
+
+class span:  # pylint: disable=C0103
+    """
+    Context manager timing a block
+    """
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if _config['enabled']:
+            record_span(self.name, time.perf_counter() - self.start)
+
+
+def traced(func):
+    """
+    Decorator timing each call of a function as a span named after it
+    """
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _config['enabled']:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record_span(name, time.perf_counter() - start)
+
+    return wrapper
+
+
+def observe_query(database, seconds):
+    """
+    The ConnectionManager observer, called after each query
+    @param database : the config key, e.g. FEATURES_DATABASE
+    """
+    database = database.split('_')[0].lower()
+    QUERIES.inc(database)
+    QUERY_SECONDS.observe(seconds, database)
+    record_span('db', seconds, 'queries')
+
+
+def observe_gnomad(seconds, status):
+    """
+    The GnomadClient observer, called after each API request (on the
+    request's thread or one of the client's)
+    """
+    GNOMAD_SECONDS.observe(seconds, status)
+    record_span('gnomad_api', seconds, 'requests')
+
+
+def start_request():
+    """
+    Starts the request clock
+    """
+    g.request_start = time.perf_counter()
+
+
+def finish_request(response):
+    """
+    Records the request latency and adds the Server-Timing header
+    """
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    seconds = time.perf_counter() - start
+    endpoint = request.url_rule.endpoint if request.url_rule is not None else 'none'
+    REQUEST_SECONDS.observe(seconds, endpoint, request.method, response.status_code)
+
+    if _config['server_timing']:
+        entries = []
+        for name, (total, count, unit) in g.pop('server_timing', {}).items():
+            entry = f'{name};dur={total * 1000:.3f}'
+            if count > 1:
+                entry += f';desc="{count} {unit or "calls"}"'
+            entries.append(entry)
+        entries.append(f'total;dur={seconds * 1000:.3f}')
+        response.headers['Server-Timing'] = ', '.join(entries)
+    return response
+
+
+def cache_lines():
+    """
+    @returns the text format lines of the in-process cache counters
+    """
+    caches = {}
+    if 'gnomad_client' in current_app.extensions:
+        caches['gnomad'] = current_app.extensions['gnomad_client'].cache.stats()
+    http_cache = current_app.extensions.get('http_cache')
+    if http_cache is not None and http_cache.cache is not None:
+        caches['response'] = http_cache.cache.stats()
+
+    lines = []
+    for name, documentation, kind, key in (
+        ('vutr_cache_hits_total', 'Fresh cache hits', 'counter', 'hits'),
+        ('vutr_cache_stale_hits_total', 'Stale cache hits', 'counter', 'stale_hits'),
+        ('vutr_cache_misses_total', 'Cache misses', 'counter', 'misses'),
+        ('vutr_cache_evictions_total', 'Cache evictions', 'counter', 'evictions'),
+        ('vutr_cache_entries', 'Cached entries', 'gauge', 'size'),
+        (
+            'vutr_cache_weight',
+            'Weight of the cached entries (bytes for the responses)',
+            'gauge',
+            'weight',
+        ),
+        (
+            'vutr_cache_hit_ratio',
+            'Share of lookups hitting the cache',
+            'gauge',
+            'hit_rate',
+        ),
+    ):
+        lines.extend([f'# HELP {name} {documentation}', f'# TYPE {name} {kind}'])
+        lines.extend(
+            f'{name}{{cache="{cache}"}} {stats[key]}' for cache, stats in caches.items()
+        )
+    return lines
+
+
+def metrics_allowed():
+    """
+    Whether the client may read /metrics: its address is in one of the
+    METRICS_ALLOWED_NETWORKS and the request wasn't relayed by a proxy
+    (which would make an outside client look local)
+    """
+    if 'X-Forwarded-For' in request.headers or 'Forwarded' in request.headers:
+        return False
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return any(address in network for network in _config['allowed_networks'])
+
+
+def metrics_view():
+    """
+    The metrics of this worker in the Prometheus text format
+    (not found for other clients than METRICS_ALLOWED_NETWORKS)
+    """
+    if not metrics_allowed():
+        abort(404)
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    lines.extend(cache_lines())
+    return current_app.response_class(
+        '\n'.join(lines) + '\n', content_type=CONTENT_TYPE
+    )
@@ -0,0 +1,37 @@
+"""
+Functions to access the offline gnomAD / ClinVar population store
+"""
+
+import sqlite3
+
+from .database import ConnectionManager
+
+manager = ConnectionManager('POPULATION_DATABASE', row_factory=sqlite3.Row)
+
+
+def init_app(app):
+    """
+    Init app
+    """
+    manager.init_app(app)
+
+
+def is_available():
+    """
+    Whether a population store has been configured and exists on disk
+    """
+    return manager.is_available()
+
+
+def get_db():
+    """
+    Get the worker's connection to the population database
+    """
+    return manager.get_db()
+
+
+def query(sql, params=()):
+    """
+    Runs a query against the population database
+    """
+    return manager.query(sql, params)
@@ -0,0 +1,162 @@
+"""
+Compact in-memory copies of the small reference tables of the features
+database
+
+GeneAnnotations answers the per gene LOEUF constraint, OMIM and ClinGen
+lookups of the viewer page and TEDistribution holds the distribution of
+the translational efficiency of the ORFs. Both are loaded once per
+worker (or once in the gunicorn master when the app is preloaded, see
+gunicorn.conf.py) and keep their values in arrays and tuples rather than
+a dictionary per row
+
+This module has no dependencies, so that the pipeline can keep a copy of
+it to compute the same distribution (see sync_shared_modules.py)
+"""
+
+import math
+from array import array
+from bisect import bisect_right
+
+
+class GeneAnnotations:
+    """
+    The LOEUF score and OMIM entry of each gene and the ClinGen
+    haploinsufficiency score of each HGNC symbol
+    The first row of a gene in each table is used, as by the SQL lookups
+    """
+
+    __slots__ = ("_genes", "_loeuf", "_omim", "_clingen")
+
+    def __init__(self, constraint_rows, omim_rows, clingen_rows):
+        """
+        @param constraint_rows : (ensembl_gene_id, loeuf) rows
+        @param omim_rows : (ensembl_gene_id, omim_entry) rows
+        @param clingen_rows : (hgnc_symbol, haplo_score) rows
+        """
+        constraint, omim = {}, {}
+        for ensg, loeuf in constraint_rows:
+            constraint.setdefault(ensg, loeuf)
+        for ensg, omim_entry in omim_rows:
+            omim.setdefault(ensg, omim_entry)
+
+        # Position of each gene in the arrays
+        genes = sorted(set(constraint) | set(omim), key=str)
+        self._genes = {ensg: i for i, ensg in enumerate(genes)}
+        self._loeuf = array(
+            "d",
+            [
+                math.nan if constraint.get(ensg) is None else constraint[ensg]
+                for ensg in genes
+            ],
+        )
+        self._omim = tuple(omim.get(ensg) for ensg in genes)
+        self._clingen = {}
+        for hgnc, haplo_score in clingen_rows:
+            self._clingen.setdefault(hgnc, haplo_score)
+
+    def loeuf(self, ensembl_gene_id):
+        """
+        @returns the LOEUF score of a gene or None
+        """
+        i = self._genes.get(ensembl_gene_id)
+        if i is None or math.isnan(self._loeuf[i]):
+            return None
+        return self._loeuf[i]
+
+    def omim_entry(self, ensembl_gene_id):
+        """
+        @returns the OMIM entry of a gene or None
+        """
+        i = self._genes.get(ensembl_gene_id)
+        return None if i is None else self._omim[i]
+
+    def haplo_score(self, hgnc_symbol, default=None):
+        """
+        @returns the ClinGen haploinsufficiency score of a gene, default
+        if it hasn't been curated
+        """
+        return self._clingen.get(hgnc_symbol, default)
+
+
+class TEDistribution:
+    """
+    The distribution of the translational efficiencies of the ORFs, as
+    quantiles and a histogram (the te_quantiles and te_histogram tables
+    written by pipeline/src/database/te_distribution.py)
+
+    The efficiency of the i-th of the n + 1 quantiles is the one at rank
+    i / n of the sorted efficiencies, so the percentile rank of any
+    efficiency is found by bisecting them, to within 100 / n
+    """
+
+    __slots__ = ("quantiles", "edges", "counts")
+
+    def __init__(self, quantiles, edges, counts):
+        """
+        @param quantiles : efficiencies at evenly spaced ranks, from the
+        lowest to the highest
+        @param edges : the len(counts) + 1 bin edges of the histogram
+        @param counts : the number of ORFs in each bin
+        """
+        self.quantiles = array("d", quantiles)
+        self.edges = array("d", edges)
+        self.counts = array("q", counts)
+
+    @classmethod
+    def from_values(cls, efficiencies, n_quantiles=1000, n_bins=50):
+        """
+        Computes the distribution of efficiencies
+        @param efficiencies : iterable of efficiencies (None is skipped)
+        @param n_quantiles : quantile intervals (n_quantiles + 1 are kept)
+        @param n_bins : histogram bins, of equal width
+        """
+        values = sorted(value for value in efficiencies if value is not None)
+        if not values:
+            return cls([], [], [])
+
+        # Linear interpolation between the closest ranks
+        quantiles = []
+        for i in range(n_quantiles + 1):
+            position = i * (len(values) - 1) / n_quantiles
+            below = int(position)
+            above = min(below + 1, len(values) - 1)
+            quantiles.append(
+                values[below] + (values[above] - values[below]) * (position - below)
+            )
+
+        lowest, highest = values[0], values[-1]
+        if highest == lowest:
+            return cls(quantiles, [lowest, highest], [len(values)])
+        width = (highest - lowest) / n_bins
+        edges = [lowest + i * width for i in range(n_bins)] + [highest]
+        counts = [0] * n_bins
+        for value in values:
+            counts[min(int((value - lowest) / width), n_bins - 1)] += 1
+        return cls(quantiles, edges, counts)
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def percentile_rank(self, efficiency):
+        """
+        @returns the percentile rank of an efficiency, from 0 (at or below
+        the lowest) to 100 (at or above the highest), None for a missing
+        efficiency or an empty distribution
+        """
+        if efficiency is None or not self.quantiles:
+            return None
+        n_quantiles = len(self.quantiles) - 1
+        i = bisect_right(self.quantiles, efficiency)
+        if i == 0:
+            return 0.0
+        if i > n_quantiles:
+            return 100.0
+        below, above = self.quantiles[i - 1], self.quantiles[i]
+        fraction = (efficiency - below) / (above - below) if above > below else 0.0
+        return 100.0 * (i - 1 + fraction) / n_quantiles
+
+    def histogram(self):
+        """
+        @returns the histogram as a dictionary of bin edges and counts
+        """
+        return {"edges": self.edges.tolist(), "counts": self.counts.tolist()}
@@ -883,6 +883,20 @@ var reverse = function(x) {
 };
 
 
+/**
+ * Decodes a score track sent by the server
+ * @param {string} packed - base64 encoded little endian float32 values
+ * @returns {Float32Array} the scores, NaN where a position has no score
+ */
+var decodeScoreTrack = function(packed) {
+    if (!packed) {
+        return new Float32Array(0);
+    }
+    const bytes = Uint8Array.from(atob(packed), c => c.charCodeAt(0));
+    return new Float32Array(bytes.buffer);
+};
+
+
 /**
  * Creates the main transcript viewer consists of 
  * uORFS, gnomAD and clinvar using Feature Viewer.
@@ -893,10 +907,10 @@ var reverse = function(x) {
  * @param {number} buffer - The amount of bps of buffer from the CDS to the end of the viz.
  * @param {str} seq - The sequence of the cDNA 
  * @param {[Obj]} smorf - The smORF with evidence dataset
- * @param {[Obj]} gnomad_utr_impact - gnomAD dataset for v3.1.2 variants
- * @param {[Obj]} clinvar_utr_impact - The object from gnomAD API
  * @param {[Obj]} genomic_features - The genomic features (exons) from MANE gff
- * @returns {FeatureViewer}
+ * @returns {Obj} The feature viewers, the gnomAD / ClinVar and conservation
+ * tracks are added to them by addPopulationTracks and addConservationTracks
+ * once they have been fetched
  */
 var createTranscriptViewer = function(
     tr_obj,
@@ -906,10 +920,7 @@ var createTranscriptViewer = function(
     buffer,
     seq,
     smorf,
-    gnomad_utr_impact,
-    clinvar_utr_impact,
-    genomic_features,
-    conservation_data
+    genomic_features
 ) {
 
     // Subset to the first 100 bases following the CDS
@@ -1043,27 +1054,82 @@ var createTranscriptViewer = function(
         }
     });
 
-    /*
-    Conservation Track
-    */
+    /* gnomAD Variant Track */
 
-    var phylop = [];
-    var cadd = [];
+    var gnomad_variant_ft = new FeatureViewer.createFeature(sequence,
+        '#gnomad_tracks', {
+            showAxis: false,
+            showSequence: false,
+            brushActive: false,
+            toolbar: false,
+            bubbleHelp: true,
+            zoomMax: 10
+        })
 
-    // Populate conservation tracks
-    conservation.forEach(e => {
-        const pos = scInterval(e['tpos'], e['tpos'], start_site, buffer, strand)['start'];
+    var clinvar_variant_ft = new FeatureViewer.createFeature(sequence,
+        '#clinvar_tracks', {
+            showAxis: false,
+            showSequence: false,
+            brushActive: false,
+            toolbar: false,
+            bubbleHelp: true,
+            zoomMax: 10
+        })
 
-        phylop.push({
-            x: pos,
-            y: e['phylop']
-        });
+    var viewers = {
+        'clinvar_ft': clinvar_variant_ft,
+        'gnomad_ft': gnomad_variant_ft,
+        'arch_ft': ft2
+    };
 
-        cadd.push({
-            x: pos,
-            y: e['phred_cadd']
-        })
+    return viewers;
+
+}
+
+/**
+ * Adds the conservation / CADD score lines (fetched from the conservation
+ * endpoint after the page has rendered) to the transcript viewer
+ * @param {Obj} viewers - The feature viewers from createTranscriptViewer
+ * @param {[Obj]} conservation_pages - The pages of packed scores
+ * (tpos_start, length and tracks, see decodeScoreTrack)
+ * @param {number} start_site - The start site of the CDS
+ * @param {string} strand - Which strand is this gene on? "-" or "+"
+ * @param {number} buffer - The amount of bps of buffer from the CDS to the end of the viz.
+ * @returns {None}
+ */
+var addConservationTracks = function(
+    viewers,
+    conservation_pages,
+    start_site,
+    strand,
+    buffer
+) {
+    var ft2 = viewers['arch_ft'];
+    var phylop = [];
+    var cadd = [];
+
+    // Populate conservation tracks (positions without a score are NaN)
+    conservation_pages.forEach(conservation_data => {
+        const phylop_scores = decodeScoreTrack(conservation_data['tracks']['phylop']);
+        const cadd_scores = decodeScoreTrack(conservation_data['tracks']['phred_cadd']);
+        for (let i = 0; i < conservation_data['length']; i++) {
+            const tpos = conservation_data['tpos_start'] + i;
+            const pos = scInterval(tpos, tpos, start_site, buffer, strand)['start'];
+
+            if (!isNaN(phylop_scores[i])) {
+                phylop.push({
+                    x: pos,
+                    y: phylop_scores[i]
+                });
+            }
 
+            if (!isNaN(cadd_scores[i])) {
+                cadd.push({
+                    x: pos,
+                    y: cadd_scores[i]
+                })
+            }
+        }
     });
 
     ft2.addFeature({
@@ -1084,19 +1150,62 @@ var createTranscriptViewer = function(
         color: '#99999',
         height: "2"
     });
+}
 
+/**
+ * Fetches every page of a windowed JSON API, following the next_cursor
+ * of each response
+ * @param {str} url - The API endpoint
+ * @param {Obj} params - The query parameters, e.g. the start and end of the window
+ * @param {function} onPage - Called with the data of each page
+ * @param {function} onDone - Called once the last page has been fetched
+ * @returns {None}
+ */
+var fetchPages = function(url, params, onPage, onDone) {
+    $.ajax({
+        url: url,
+        data: params,
+        dataType: 'json',
+        error: function(e) {
+            console.log(e)
+        },
+        success: function(res) {
+            onPage(res['data']);
+            if (res['next_cursor']) {
+                fetchPages(url, {
+                    ...params,
+                    cursor: res['next_cursor']
+                }, onPage, onDone);
+            } else {
+                onDone();
+            }
+        }
+    });
+}
 
-    /* gnomAD Variant Track */
-
-    var gnomad_variant_ft = new FeatureViewer.createFeature(sequence,
-        '#gnomad_tracks', {
-            showAxis: false,
-            showSequence: false,
-            brushActive: false,
-            toolbar: false,
-            bubbleHelp: true,
-            zoomMax: 10
-        })
+/**
+ * Adds the gnomAD and ClinVar variants (fetched from the population
+ * endpoint after the page has rendered) to the viewers
+ * @param {Obj} viewers - The feature viewers from createTranscriptViewer
+ * @param {Obj} gnomad_data - The gnomAD and ClinVar variants in the 5' UTR
+ * @param {[Obj]} gnomad_utr_impact - UTR annotations of the gnomAD variants
+ * @param {[Obj]} clinvar_utr_impact - UTR annotations of the ClinVar variants
+ * @param {number} start_site - The start site of the CDS
+ * @param {string} strand - Which strand is this gene on? "-" or "+"
+ * @param {number} buffer - The amount of bps of buffer from the CDS to the end of the viz.
+ * @returns {None}
+ */
+var addPopulationTracks = function(
+    viewers,
+    gnomad_data,
+    gnomad_utr_impact,
+    clinvar_utr_impact,
+    start_site,
+    strand,
+    buffer
+) {
+    var gnomad_variant_ft = viewers['gnomad_ft'];
+    var clinvar_variant_ft = viewers['clinvar_ft'];
 
     var pop_variants = gnomad_data['variants']; // gnomAD variants from the API
     var pop_variants = pop_variants.map(e => ({
@@ -1181,15 +1290,6 @@ var createTranscriptViewer = function(
 
 
     });
-    var clinvar_variant_ft = new FeatureViewer.createFeature(sequence,
-        '#clinvar_tracks', {
-            showAxis: false,
-            showSequence: false,
-            brushActive: false,
-            toolbar: false,
-            bubbleHelp: true,
-            zoomMax: 10
-        })
     var clinvar_variants = gnomad_data['clinvar_variants'];
     var clinvar_variants = clinvar_variants.map(e => ({
         ...e,
@@ -1268,15 +1368,6 @@ var createTranscriptViewer = function(
     
 
     }}});
-
-    var viewers = {
-        'clinvar_ft': clinvar_variant_ft,
-        'gnomad_ft': gnomad_variant_ft,
-        'arch_ft': ft2
-    };
-
-    return viewers;
-
 }
 
 /** 
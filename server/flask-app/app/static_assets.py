@@ -0,0 +1,97 @@
+"""
+Serves the fingerprinted static assets written by build_assets.py
+
+When a build is configured (STATIC_BUILD_FOLDER) url_for('static', ...)
+returns the fingerprinted name of an asset and the static route sends it
+with an immutable Cache-Control, as a new build changes the name. The
+brotli or gzip variant written at build time is sent to clients which
+accept it. Without a build (e.g. when developing) app/static is served
+as is
+"""
+
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory  # pylint: disable=E0401
+
+MANIFEST = 'manifest.json'
+# In order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class AssetBuild:
+    """
+    The manifest of a build
+    """
+
+    def __init__(self, folder):
+        path = os.path.join(folder, MANIFEST)
+        with open(path, 'rb') as manifest:
+            data = manifest.read()
+        manifest = json.loads(data)
+        self.folder = folder
+        # Changes with the fingerprint of any asset (see http_cache.py)
+        self.digest = hashlib.sha1(data).hexdigest()
+        self.mtime = os.stat(path).st_mtime
+        self.assets = manifest['assets']
+        self.encodings = manifest['encodings']
+        self.fingerprinted = set(self.assets.values())
+
+
+def init_app(app):
+    """
+    Serves the static assets from the build, if there is one
+    """
+    folder = app.config.get('STATIC_BUILD_FOLDER')
+    if not folder:
+        return
+    folder = os.path.join(app.root_path, folder)
+    if not os.path.isfile(os.path.join(folder, MANIFEST)):
+        app.logger.warning('No static asset build in %s, serving app/static', folder)
+        return
+    app.extensions['static_assets'] = AssetBuild(folder)
+    app.url_defaults(fingerprint_url)
+    app.view_functions['static'] = send_asset
+
+
+def fingerprint_url(endpoint, values):
+    """
+    Swaps the file name of static urls for the fingerprinted name
+    """
+    if endpoint == 'static' and 'filename' in values:
+        build = current_app.extensions['static_assets']
+        values['filename'] = build.assets.get(values['filename'], values['filename'])
+
+
+def send_asset(filename):
+    """
+    The static route
+    Assets which aren't part of the build are looked up in app/static
+    """
+    build = current_app.extensions['static_assets']
+    if filename not in build.fingerprinted:
+        return current_app.send_static_file(filename)
+
+    max_age = current_app.config.get('STATIC_MAX_AGE', 31536000)
+    available = build.encodings.get(filename, ())
+    for encoding, suffix in ENCODINGS:
+        if encoding in available and request.accept_encodings.quality(encoding) > 0:
+            mimetype = mimetypes.guess_type(filename)[0]
+            response = send_from_directory(
+                build.folder,
+                filename + suffix,
+                mimetype=mimetype or 'application/octet-stream',
+                max_age=max_age,
+            )
+            response.content_encoding = encoding
+            break
+    else:
+        response = send_from_directory(build.folder, filename, max_age=max_age)
+
+    if available:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -2,34 +2,223 @@
 Functions to access variant store database
 """
 
-
 import sqlite3
-from flask import current_app, g  # pylint: disable=E0401
+
+from flask import g, has_app_context  # pylint: disable=E0401
+
+from .database import ConnectionManager
+from .metrics import span
+from .variant_codec import codec_from_connection, parse_utr_annotation
+
+manager = ConnectionManager('VARIANT_DATABASE', row_factory=sqlite3.Row)
+_codecs = {}
 
 
 def init_app(app):
     """
     Init app
     """
-    app.teardown_appcontext(close_db)
+    manager.init_app(app)
 
 
 def get_db():
     """
-    Get variant database
+    Get the worker's connection to the variant database
+    """
+    return manager.get_db()
+
+
+def query(sql, params=()):
+    """
+    Runs a query against the variant database
+    """
+    return manager.query(sql, params)
+
+
+def query_one(sql, params=()):
+    """
+    Runs a query against the variant database for a single row
+    """
+    return manager.query_one(sql, params)
+
+
+def query_value(sql, params=()):
+    """
+    Runs a query against the variant database for a single value
+    """
+    return manager.query_value(sql, params)
+
+
+def has_table(name):
+    """
+    Whether the variant database has a table
+    """
+    return manager.has_table(name)
+
+
+def has_intervals():
+    """
+    Whether the variant database has the precomputed UTR consequence
+    intervals (the interval_start and interval_end columns)
+    """
+    return 'interval_start' in manager.columns('variant_annotations')
+
+
+def interval_columns():
+    """
+    The interval columns to add to a variant_annotations select list
+    (none for stores built without them)
+    """
+    return ', interval_start, interval_end' if has_intervals() else ''
+
+
+def cdna_start_column():
     """
-    if 'vdb' not in g:
-        g.vdb = sqlite3.connect(
-            current_app.config['VARIANT_DATABASE'], detect_types=sqlite3.PARSE_DECLTYPES
+    The integer first cDNA position of a variant, to filter and sort by
+    (cdna_pos holds VEP's cDNA_position, a range such as 120-121 for
+    indels). Stores built without the cdna_start column take the leading
+    integer of cdna_pos, which is what SQLite's CAST gives
+    """
+    if 'cdna_start' in manager.columns('variant_annotations'):
+        return 'cdna_start'
+    return 'CAST(cdna_pos AS INTEGER)'
+
+
+def utr_interval(row):
+    """
+    The precomputed (interval_start, interval_end) of a variant_annotations
+    row, see utr_intervals.py
+    @returns None if the row has none (the store predates them or the
+    consequence has no interval)
+    """
+    if 'interval_start' not in row.keys() or row['interval_start'] is None:
+        return None
+    return row['interval_start'], row['interval_end']
+
+
+def get_codec():
+    """
+    Gets the codec for the annotations column of the variant database
+    (read from its store_metadata once per database)
+    """
+    if manager.path not in _codecs:
+        _codecs[manager.path] = manager.run(lambda: codec_from_connection(get_db()))
+    return _codecs[manager.path]
+
+
+def decode_annotations(row):
+    """
+    Decodes the full VEP row of a variant_annotations row (the row has to
+    include the annotations column and the typed columns)
+    """
+    return get_codec().decode(row['annotations'], row)
+
+
+class TranscriptVariants:
+    """
+    The variant_annotations rows of one transcript, read in a single
+    pass. Only the columns the viewer uses are selected (never the full
+    VEP annotations blob) and the UTR annotation JSON is decoded lazily,
+    the first time a variant's annotation is asked for
+    """
+
+    def __init__(self, ensembl_transcript_id, rows):
+        self.ensembl_transcript_id = ensembl_transcript_id
+        self._rows = rows
+        self._annotations = None
+
+    @classmethod
+    def load(cls, ensembl_transcript_id):
+        """
+        Reads the rows for a transcript
+        """
+        rows = query(
+            f"""
+                SELECT variant_id, cdna_pos, five_prime_UTR_variant_consequence,
+                    five_prime_UTR_variant_annotation{interval_columns()}
+                FROM variant_annotations
+                WHERE ensembl_transcript_id = ?
+            """,
+            [ensembl_transcript_id],
         )
-        g.vdb.row_factory = sqlite3.Row
-    return g.vdb
+        return cls(ensembl_transcript_id, rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def variant_ids(self):
+        """
+        @returns the variant ids in database order
+        """
+        return [row['variant_id'] for row in self._rows]
+
+    def first(self, n=5):
+        """
+        @returns the first n variant ids
+        """
+        return [row['variant_id'] for row in self._rows[0:n]]
+
+    def annotations(self, variant_ids=None):
+        """
+        Gets the UTR annotations, optionally only for a set of variant ids
+        @returns a list of dictionaries (one per row, as there might be
+        multiple annotations for a given variant)
+        """
+        with span('decode_variant_annotations'):
+            if self._annotations is None:
+                self._annotations = [
+                    _LazyAnnotation(row, idx) for idx, row in enumerate(self._rows)
+                ]
+            if variant_ids is None:
+                return [a.decode() for a in self._annotations]
+            variant_ids = set(variant_ids)
+            return [
+                a.decode() for a in self._annotations if a.variant_id in variant_ids
+            ]
+
+
+class _LazyAnnotation:
+    """
+    A row whose annotation JSON is decoded on first access
+    """
+
+    __slots__ = ('variant_id', '_row', '_idx', '_decoded')
+
+    def __init__(self, row, idx):
+        self.variant_id = row['variant_id']
+        self._row = row
+        self._idx = idx
+        self._decoded = None
+
+    def decode(self):
+        """
+        @returns the annotation dictionary
+        """
+        if self._decoded is None:
+            row = self._row
+            self._decoded = {
+                'variant_id': self.variant_id,
+                'annotation_id': f'annotation-{self.variant_id}-{self._idx}',
+                'cDNA_position': row['cdna_pos'],
+                'five_prime_UTR_variant_consequence': row[
+                    'five_prime_UTR_variant_consequence'
+                ],
+                'five_prime_UTR_variant_annotation': parse_utr_annotation(
+                    row['five_prime_UTR_variant_annotation']
+                ),
+                'utr_interval': utr_interval(row),
+            }
+        return self._decoded
 
 
-def close_db(e=None):  # pylint: disable=W0613
+def get_transcript_variants(ensembl_transcript_id):
     """
-    Close the db
+    Gets the TranscriptVariants for a transcript, memoised for the
+    lifetime of the request
     """
-    vdb = g.pop('vdb', None)
-    if vdb is not None:
-        vdb.close()
+    if not has_app_context():
+        return TranscriptVariants.load(ensembl_transcript_id)
+    cache = g.setdefault('transcript_variants', {})
+    if ensembl_transcript_id not in cache:
+        cache[ensembl_transcript_id] = TranscriptVariants.load(ensembl_transcript_id)
+    return cache[ensembl_transcript_id]
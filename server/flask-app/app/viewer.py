@@ -10,40 +10,81 @@ from flask import (  # pylint: disable=E0401
     request,
     jsonify,
     current_app,
+    url_for,
 )  # pylint disable=E0401
 
 from .helpers import (
-    get_possible_variants,
-    process_gnomad_data,
-    find_all_high_impact_utr_variants,
-    get_genomic_features,
-    get_transcript_features,
-    convert_between_ids,
-    get_smorfs,
-    get_constraint_score,
-    get_all_orfs_features,
-    get_utr_annotation_for_list_variants,
     find_intervals_for_utr_consequence,
-    get_gnomad_variants_in_utr_regions,
-    get_omim_id,
+    get_population_tracks,
+    get_viewer_bundle,
+    build_viewer_bundle,
     get_conservation_scores,
-    get_clingen_entry,
-    find_transcript_ids_by_gene_id
+    get_orf_te_percentile,
+    get_te_distribution,
+    get_possible_variants_window,
+    search_possible_variants,
+    encode_cursor,
+    decode_cursor,
 )
 from . import variant_db
+from .http_cache import cached_response
+from .metrics import span
+from .variant_codec import parse_utr_annotation
 
 
 viewer = Blueprint("viewer", __name__)
 
 
+def position_args():
+    """
+    Parses the start / end transcript positions of the windowed APIs
+    (default the whole transcript)
+    @returns (start, end)
+    @raises ValueError if a position isn't an integer
+    """
+    start = request.args.get("start")
+    end = request.args.get("end")
+    return int(start) if start else None, int(end) if end else None
+
+
+def window_args(default_limit):
+    """
+    Parses the query parameters of the paged windowed APIs
+    start / end : transcript positions (see position_args)
+    cursor : the next_cursor of the previous page
+    limit : the page size
+    @returns (start, end, cursor key, limit)
+    @raises ValueError if a parameter is invalid
+    """
+    start, end = position_args()
+    cursor = request.args.get("cursor")
+    limit = int(request.args.get("limit", default_limit))
+    max_limit = current_app.config["API_MAX_PAGE_SIZE"]
+    if not 0 < limit <= max_limit:
+        raise ValueError(f"limit must be between 1 and {max_limit}")
+    return start, end, decode_cursor(cursor) if cursor else None, limit
+
+
+def json_text_response(data, **fields):
+    """
+    A JSON response with data already serialised (e.g. by SQLite), so
+    that it isn't decoded just to be encoded again
+    @param data : JSON text
+    @param fields : the other members of the response
+    """
+    body = json.dumps({"message": "Ok", **fields}, separators=(",", ":"))
+    return current_app.response_class(
+        f'{body[:-1]},"data":{data}}}', mimetype="application/json"
+    )
+
+
 def get_first_variants(ensembl_transcript_id):
     """
     Get the first 5 variants for a given ENST
     @param ensembl_transcript_id
     @returns a list of the first 5 variants
     """
-    db = variant_db.get_db()
-    cursor = db.execute(
+    rows = variant_db.query(
         """
             SELECT variant_id
             FROM variant_annotations
@@ -52,12 +93,11 @@ def get_first_variants(ensembl_transcript_id):
         """,
         [ensembl_transcript_id],
     )
-    rows = [u['variant_id'] for u in cursor.fetchall()]
-    return rows
-
+    return [u['variant_id'] for u in rows]
 
 
 @viewer.route("/viewer/possible_variants", methods=["GET"])
+@cached_response
 def get_possible_variants_api():
     """
     A JSON API resource to get the possible variants for a supplied search query
@@ -79,29 +119,14 @@ def get_possible_variants_api():
                 ),
                 400,
             )
-        db = variant_db.get_db()  # pylint: disable=C0103
-
-        cursor = None
         search_term = request.args.get("search_term")
         if not search_term:
-            cursor = db.execute("""
-                SELECT variant_id
-                FROM variant_annotations
-                WHERE ensembl_transcript_id = ?
-                LIMIT 5;
-                """, [ensembl_transcript_id])
-        else : 
-            cursor = db.execute("""
-                SELECT variant_id
-                FROM variant_annotations
-                WHERE variant_id LIKE ? COLLATE NOCASE
-                AND ensembl_transcript_id = ?
-                LIMIT 10;
-            """, ["%" + search_term + "%", ensembl_transcript_id])
-        
-        rows = cursor.fetchall()
+            variant_ids = get_first_variants(ensembl_transcript_id)
+        else:
+            variant_ids = search_possible_variants(ensembl_transcript_id, search_term)
+
         # Convert row objects to dictionaries
-        rows_as_dict = [{'text': row['variant_id'], 'id' : row['variant_id']} for row in rows]
+        rows_as_dict = [{'text': variant_id, 'id': variant_id} for variant_id in variant_ids]
         response_object = {
             "message": "Ok",
             "data": rows_as_dict,
@@ -130,19 +155,22 @@ def get_possible_variants_api():
 
 
 @viewer.route("/viewer/utr_impact", methods=["GET"])
+@cached_response
 def get_utr_impacts():
     """
     A JSON API resource to get the 5' UTR annotation for a supplied variant
     @param variant_id e.g. 5-150904976-T-A
     @param ensembl_transcript_id e.g. ENST00000274599
+    @param start_site : the 5' UTR length of the transcript
+    @param buffer : bases drawn past the start site
     """
     try:
         variant_id = request.args.get("variant_id")
         ensembl_transcript_id = request.args.get("ensembl_transcript_id")
-        start_site = request.args.get("start_site")
-        buffer = request.args.get("buffer")
+        start_site = request.args.get("start_site", type=int)
+        buffer = request.args.get("buffer", type=int)
 
-        if not all([variant_id, ensembl_transcript_id, start_site, buffer]):
+        if not all([variant_id, ensembl_transcript_id]) or None in (start_site, buffer):
             return (
                 jsonify(
                     {
@@ -153,18 +181,18 @@ def get_utr_impacts():
                 400,
             )
 
-        db = variant_db.get_db()
-        cursor = db.execute(
-            """
-                SELECT annotations, five_prime_UTR_variant_annotation 
-                FROM variant_annotations 
+        # Only the typed columns are needed, the VEP row isn't decoded
+        variant = variant_db.query_one(
+            f"""
+                SELECT cdna_pos, five_prime_UTR_variant_consequence,
+                    five_prime_UTR_variant_annotation{variant_db.interval_columns()}
+                FROM variant_annotations
                 WHERE ensembl_transcript_id = ? AND variant_id = ?
             """,
             [ensembl_transcript_id, variant_id],
         )
-        rows = cursor.fetchall()
 
-        if not rows:
+        if variant is None:
             return (
                 jsonify(
                     {
@@ -175,16 +203,16 @@ def get_utr_impacts():
                 404,
             )
 
-        variant = [json.loads(row[0]) for row in rows][0]
-        annotation = [json.loads(row[1]) for row in rows][0]
+        annotation = parse_utr_annotation(variant["five_prime_UTR_variant_annotation"])
         intervals = find_intervals_for_utr_consequence(
             var_id=variant_id,
             conseq_type=variant["five_prime_UTR_variant_consequence"],
-            conseq_dict=variant["five_prime_UTR_variant_annotation"],
-            cdna_pos=variant["cDNA_position"],
+            conseq_dict=annotation,
+            cdna_pos=variant["cdna_pos"],
             start_site=start_site,
             buffer_length=buffer,
             annotation_id=variant_id,
+            offsets=variant_db.utr_interval(variant),
         )
 
         response_object = {
@@ -194,7 +222,6 @@ def get_utr_impacts():
                 "intervals": intervals,
             },
         }
-        print(response_object)
         return jsonify(response_object), 200
 
     except SQLiteError as error:
@@ -217,95 +244,250 @@ def get_utr_impacts():
         )
 
 
-@viewer.route("/viewer/<ensembl_transcript_id>")
-def viewer_page(ensembl_transcript_id):
+@viewer.route("/viewer/population/<ensembl_transcript_id>", methods=["GET"])
+@cached_response
+def get_population_variants_api(ensembl_transcript_id):
     """
-    Collects data for a given ENST
-    @param ensembl_transcript_id
+    A JSON API resource with the gnomAD and ClinVar tracks of the viewer,
+    fetched by the page once the transcript view has rendered
+    @param ensembl_transcript_id e.g. ENST00000274599
+    @param start, end : only the variants at these transcript positions
     """
-    buffer = 40
+    try:
+        start, end = position_args()
+        tracks = get_population_tracks(ensembl_transcript_id, start=start, end=end)
+        if tracks is None:
+            return (
+                jsonify(
+                    {
+                        "message": "No transcript found for the given ensembl_transcript_id",
+                        "data": {},
+                    }
+                ),
+                404,
+            )
+        return jsonify({"message": "Ok", "data": tracks}), 200
 
-    # Convert IDs and get basic data
-    ensembl_gene_id = convert_between_ids(
-        ensembl_transcript_id, "ensembl_transcript_id", "ensembl_gene_id"
-    )
-    hgnc = convert_between_ids(
-        ensembl_transcript_id, "ensembl_transcript_id", "hgnc_symbol"
-    )
-    name = convert_between_ids(ensembl_transcript_id, "ensembl_transcript_id", "name")
-    refseq_match = convert_between_ids(
-        ensembl_transcript_id, "ensembl_transcript_id", "refseq_transcript_id"
-    )
+    except ValueError as error:
+        return jsonify({"message": str(error), "data": {}}), 400
+
+    except SQLiteError as error:
+        return (
+            jsonify(
+                {"message": "Database error occurred: {}".format(str(error)), "data": {}}
+            ),
+            500,
+        )
+
+    except Exception as error:  # pylint: disable=W0703
+        return (
+            jsonify(
+                {
+                    "message": "An unexpected error occurred: {}".format(str(error)),
+                    "data": {},
+                }
+            ),
+            500,
+        )
+
+
+@viewer.route("/viewer/variants/<ensembl_transcript_id>", methods=["GET"])
+@cached_response
+def get_variants_window_api(ensembl_transcript_id):
+    """
+    A JSON API resource with a page of the possible variants of a
+    transcript in a window of cDNA positions
+    @param ensembl_transcript_id e.g. ENST00000274599
+    @param start, end : cDNA positions (default the whole transcript)
+    @param consequence : comma separated UTR consequences e.g. uAUG_gained
+    @param cursor : the next_cursor of the previous page
+    @param limit : variants per page
+    """
+    try:
+        start, end, after, limit = window_args(current_app.config["API_PAGE_SIZE"])
+        if after is not None and (not isinstance(after, list) or len(after) != 3):
+            raise ValueError("Invalid cursor")
+        consequence = request.args.get("consequence")
+        variants, last = get_possible_variants_window(
+            ensembl_transcript_id,
+            start,
+            end,
+            consequence.split(",") if consequence else None,
+            after,
+            limit,
+        )
+        return (
+            json_text_response(
+                variants, next_cursor=encode_cursor(last) if last else None
+            ),
+            200,
+        )
+
+    except ValueError as error:
+        return jsonify({"message": str(error), "data": []}), 400
+
+    except SQLiteError as error:
+        return (
+            jsonify(
+                {"message": "Database error occurred: {}".format(str(error)), "data": []}
+            ),
+            500,
+        )
+
+    except Exception as error:  # pylint: disable=W0703
+        return (
+            jsonify(
+                {
+                    "message": "An unexpected error occurred: {}".format(str(error)),
+                    "data": [],
+                }
+            ),
+            500,
+        )
 
-    # Other transcripts
-    other_transcripts = [t for t in find_transcript_ids_by_gene_id(
-        ensembl_gene_id) if t != ensembl_transcript_id]
 
-    # Get features
-    gene_features = get_genomic_features(ensembl_gene_id)
-    five_prime_utr_stats = get_transcript_features(ensembl_transcript_id)
-    transcript_features = get_all_orfs_features(ensembl_transcript_id)
+@viewer.route("/viewer/conservation/<ensembl_transcript_id>", methods=["GET"])
+@cached_response
+def get_conservation_window_api(ensembl_transcript_id):
+    """
+    A JSON API resource with the conservation / CADD scores of a window of
+    transcript positions, see get_conservation_scores
+    @param ensembl_transcript_id e.g. ENST00000274599
+    @param start, end : transcript positions (default the whole transcript)
+    @param cursor : the next_cursor of the previous page
+    @param limit : positions per page
+    """
+    try:
+        start, end, after, limit = window_args(
+            current_app.config["CONSERVATION_PAGE_SIZE"]
+        )
+        if after is not None:
+            if not isinstance(after, int):
+                raise ValueError("Invalid cursor")
+            start = after
+        scores = get_conservation_scores(
+            ensembl_transcript_id, start=start, end=end, limit=limit
+        )
+        next_tpos = scores.pop("next_tpos")
+        next_cursor = encode_cursor(next_tpos) if next_tpos is not None else None
+        return (
+            jsonify({"message": "Ok", "data": scores, "next_cursor": next_cursor}),
+            200,
+        )
 
-    # Score and position data
-    constraint = get_constraint_score(ensembl_gene_id)
-    start_site = five_prime_utr_stats["start_site_pos"]
+    except ValueError as error:
+        return jsonify({"message": str(error), "data": {}}), 400
 
-    # Clinical data
-    clingen_entry = get_clingen_entry(hgnc)
-    omim_id = get_omim_id(ensembl_gene_id)
+    except SQLiteError as error:
+        return (
+            jsonify(
+                {"message": "Database error occurred: {}".format(str(error)), "data": {}}
+            ),
+            500,
+        )
+
+    except Exception as error:  # pylint: disable=W0703
+        return (
+            jsonify(
+                {
+                    "message": "An unexpected error occurred: {}".format(str(error)),
+                    "data": {},
+                }
+            ),
+            500,
+        )
 
-    # smORF data
-    smorfs = get_smorfs(ensembl_transcript_id)
 
-    # Variants
-    possible_variants = get_possible_variants(ensembl_transcript_id)
-    all_possible_variants = find_all_high_impact_utr_variants(ensembl_transcript_id)
-    few_possible_variants = get_first_variants(ensembl_transcript_id)
+@viewer.route("/viewer/te_percentile/<orf_id>", methods=["GET"])
+@cached_response
+def get_te_percentile_api(orf_id):
+    """
+    A JSON API resource with the translational efficiency of an ORF, its
+    percentile rank among all ORFs and the histogram of their efficiencies
+    @param orf_id
+    """
+    try:
+        orf = get_orf_te_percentile(orf_id)
+        if orf is None:
+            return (
+                jsonify({"message": "No ORF found for the given orf_id", "data": {}}),
+                404,
+            )
+        return (
+            jsonify({"message": "Ok", "data": {**orf, **get_te_distribution()}}),
+            200,
+        )
 
-    # Conservation scores
-    conservation_scores = get_conservation_scores(ensembl_transcript_id)
+    except SQLiteError as error:
+        return (
+            jsonify(
+                {"message": "Database error occurred: {}".format(str(error)), "data": {}}
+            ),
+            500,
+        )
+    except Exception as error:  # pylint: disable=W0703
+        return (
+            jsonify(
+                {
+                    "message": "An unexpected error occurred: {}".format(str(error)),
+                    "data": {},
+                }
+            ),
+            500,
+        )
 
-    # UTR regions
-    utr_regions = [i for i in gene_features if i["type"] == "five_prime_UTR"]
 
-    # Gnomad data
-    gnomad_data, gnomad_variants_list, clinvar_variants_list = process_gnomad_data(
-        get_gnomad_variants_in_utr_regions(utr_regions), ensembl_transcript_id
-    )
+@viewer.route("/viewer/<ensembl_transcript_id>")
+@cached_response
+def viewer_page(ensembl_transcript_id):
+    """
+    Collects data for a given ENST
+    The gnomAD / ClinVar and conservation tracks are loaded separately by
+    the page (see get_population_variants_api and
+    get_conservation_window_api)
+    @param ensembl_transcript_id
+    """
+    # Static transcript data, from a single precomputed bundle if available
+    bundle = get_viewer_bundle(ensembl_transcript_id)
+    if bundle is None:
+        bundle = build_viewer_bundle(ensembl_transcript_id)
 
-    gnomad_utr_impact = get_utr_annotation_for_list_variants(
-        gnomad_variants_list, possible_variants, start_site, buffer
-    )
-    clinvar_utr_impact = get_utr_annotation_for_list_variants(
-        clinvar_variants_list, possible_variants, start_site, buffer
-    )
+    # The ORFs go into the page as JSON (serialised by SQLite without a bundle)
+    transcript_features = bundle["transcript_features"]
+    if not isinstance(transcript_features, str):
+        transcript_features = json.dumps(transcript_features)
 
     # URLs for external services
     impact_url = current_app.config["IMPACT_URL"]
     search_url = current_app.config["SEARCH_URL"]
-
-    return render_template(
-        "viewer.html",
+    population_url = url_for(
+        "viewer.get_population_variants_api",
+        ensembl_transcript_id=ensembl_transcript_id,
+    )
+    conservation_url = url_for(
+        "viewer.get_conservation_window_api",
         ensembl_transcript_id=ensembl_transcript_id,
-        ensembl_gene_id=ensembl_gene_id,
-        hgnc=hgnc,
-        name=name,
-        refseq_match=refseq_match,
-        smorfs=smorfs,
-        clingen_entry=clingen_entry,
-        omim_id=omim_id,
-        impact_url=impact_url,
-        conservation_scores=conservation_scores,
-        few_possible_variants=few_possible_variants,
-        search_url=search_url,
-        gnomad_data=gnomad_data,
-        constraint=constraint,
-        gene_features=gene_features,
-        five_prime_utr_stats=five_prime_utr_stats,
-        transcript_features=transcript_features,
-        gnomad_utr_impact=gnomad_utr_impact,
-        clinvar_utr_impact=clinvar_utr_impact,
-        all_possible_variants=all_possible_variants,
-        other_transcripts=other_transcripts
     )
 
+    with span("render_template"):
+        return render_template(
+            "viewer.html",
+            ensembl_transcript_id=ensembl_transcript_id,
+            ensembl_gene_id=bundle["ensembl_gene_id"],
+            hgnc=bundle["hgnc"],
+            name=bundle["name"],
+            refseq_match=bundle["refseq_match"],
+            smorfs=bundle["smorfs"],
+            clingen_entry=bundle["clingen_entry"],
+            omim_id=bundle["omim_id"],
+            impact_url=impact_url,
+            few_possible_variants=bundle["few_possible_variants"],
+            search_url=search_url,
+            population_url=population_url,
+            conservation_url=conservation_url,
+            constraint=bundle["constraint"],
+            gene_features=bundle["gene_features"],
+            five_prime_utr_stats=bundle["five_prime_utr_stats"],
+            transcript_features=transcript_features,
+            other_transcripts=bundle["other_transcripts"]
+        )
@@ -0,0 +1,231 @@
+"""
+Builds the static assets served in production
+
+Only the files referenced by the templates (url_for('static', ...)) and
+the fonts / images their stylesheets load are copied from app/static to
+the build folder, each with a content hash in its name, e.g.
+dist/js/utrviewer.js -> dist/js/utrviewer.3f2a9c1b2e4d.js, so that they
+can be cached forever. The build fails if any of them is missing. Text
+assets are also written gzipped (.gz) and, if the brotli module is
+installed, brotli compressed (.br). The manifest.json of the build maps
+the original names to the fingerprinted ones, see app/static_assets.py
+
+Usage : python3 build_assets.py
+        python3 build_assets.py --output app/static_build
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+
+try:
+    import brotli  # pylint: disable=E0401
+except ImportError:
+    brotli = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+# Already compressed formats aren't worth compressing again
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.map', '.svg', '.ttf', '.eot', '.json', '.txt'
+)
+
+STATIC_URL_RE = re.compile(
+    r"""url_for\(\s*['"]static['"]\s*,\s*filename\s*=\s*['"]([^'"]+)['"]"""
+)
+CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+class MissingAssets(Exception):
+    """
+    Assets referenced by a template or a stylesheet which aren't in the
+    static folder
+    """
+
+    def __init__(self, static_folder, missing):
+        super().__init__(
+            f'{len(missing)} referenced assets not in {static_folder}:\n  '
+            + '\n  '.join(sorted(set(missing)))
+        )
+
+
+def template_assets(template_folder):
+    """
+    @returns the static files referenced by the templates
+    """
+    assets = set()
+    for name in sorted(os.listdir(template_folder)):
+        if name.endswith('.html'):
+            path = os.path.join(template_folder, name)
+            with open(path, encoding='utf-8') as template:
+                assets.update(STATIC_URL_RE.findall(template.read()))
+    return assets
+
+
+def css_references(stylesheet, css):
+    """
+    @returns the local files loaded by a stylesheet, as
+    (url as written, static path) pairs
+    """
+    references = []
+    for _, url in CSS_URL_RE.findall(css):
+        if re.match(r'^(data:|[a-z]+:|/|#)', url):
+            continue
+        path = re.split(r'[?#]', url, maxsplit=1)[0]
+        path = os.path.normpath(os.path.join(os.path.dirname(stylesheet), path))
+        references.append((url, path.replace(os.sep, '/')))
+    return references
+
+
+def fingerprint(name, content):
+    """
+    @returns the name with the hash of the content before the extension
+    """
+    digest = hashlib.sha256(content).hexdigest()[0:HASH_LENGTH]
+    root, extension = os.path.splitext(name)
+    return f'{root}.{digest}{extension}'
+
+
+def compress(path, content, level):
+    """
+    Writes the gzip and brotli variants of a file when they are smaller
+    @returns the encodings written
+    """
+    encodings = []
+    variants = [('gzip', '.gz', lambda: gzip.compress(content, level, mtime=0))]
+    if brotli is not None:
+        variants.insert(0, ('br', '.br', lambda: brotli.compress(content, quality=11)))
+    for encoding, suffix, compressor in variants:
+        compressed = compressor()
+        if len(compressed) < len(content):
+            with open(path + suffix, 'wb') as out:
+                out.write(compressed)
+            encodings.append(encoding)
+    return encodings
+
+
+def build(static_folder, template_folder, output, level):
+    """
+    Writes the fingerprinted assets and the manifest
+    @returns the manifest
+    """
+    pending = sorted(template_assets(template_folder))
+    missing = [
+        f'{name} (template)'
+        for name in pending
+        if not os.path.isfile(os.path.join(static_folder, name))
+    ]
+    pending = [name for name in pending if f'{name} (template)' not in missing]
+
+    # Stylesheets are written after the files they load so that their
+    # urls can be rewritten to the fingerprinted names
+    contents = {}
+    dependencies = {}
+    while pending:
+        name = pending.pop()
+        if name in contents:
+            continue
+        with open(os.path.join(static_folder, name), 'rb') as asset:
+            contents[name] = asset.read()
+        if name.endswith('.css'):
+            dependencies[name] = css_references(name, contents[name].decode('utf-8'))
+            for _, path in dependencies[name]:
+                if os.path.isfile(os.path.join(static_folder, path)):
+                    pending.append(path)
+                else:
+                    missing.append(f'{path} ({name})')
+
+    # A missing asset would only show up as a 404 in production
+    if missing:
+        raise MissingAssets(static_folder, missing)
+
+    if os.path.isdir(output):
+        shutil.rmtree(output)
+    manifest = {'assets': {}, 'encodings': {}}
+    for name in sorted(contents, key=lambda name: (name in dependencies, name)):
+        content = contents[name]
+        if name in dependencies:
+            css = content.decode('utf-8')
+            for url, path in dependencies[name]:
+                hashed_url = url.replace(
+                    os.path.basename(path),
+                    os.path.basename(manifest['assets'][path]),
+                    1,
+                )
+                css = css.replace(f'({url})', f'({hashed_url})')
+                css = css.replace(f'("{url}")', f'("{hashed_url}")')
+                css = css.replace(f"('{url}')", f"('{hashed_url}')")
+            content = css.encode('utf-8')
+
+        hashed_name = fingerprint(name, content)
+        path = os.path.join(output, hashed_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as out:
+            out.write(content)
+        manifest['assets'][name] = hashed_name
+        if name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+            encodings = compress(path, content, level)
+            if encodings:
+                manifest['encodings'][hashed_name] = encodings
+
+    with open(os.path.join(output, MANIFEST), 'w', encoding='utf-8') as out:
+        json.dump(manifest, out, indent=1, sort_keys=True)
+    return manifest
+
+
+def main(args):
+    """Entry point"""
+    if brotli is None:
+        print('brotli is not installed, only writing gzip variants')
+    try:
+        manifest = build(args.static, args.templates, args.output, args.level)
+    except MissingAssets as error:
+        print(error)
+        sys.exit(1)
+    size = sum(
+        os.path.getsize(os.path.join(args.output, name))
+        for name in manifest['assets'].values()
+    )
+    print(
+        f'Wrote {len(manifest["assets"])} assets ({size / 2**20:.1f} MiB, '
+        f'{len(manifest["encodings"])} precompressed) to {args.output}'
+    )
+    if not manifest['assets']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Builds the fingerprinted and precompressed static assets'
+    )
+    parser.add_argument(
+        '--static',
+        default=os.path.join(HERE, 'app', 'static'),
+        type=str,
+        help='Source static folder',
+    )
+    parser.add_argument(
+        '--templates',
+        default=os.path.join(HERE, 'app', 'templates'),
+        type=str,
+        help='Templates whose assets are built',
+    )
+    parser.add_argument(
+        '--output',
+        default=os.path.join(HERE, 'app', 'static_build'),
+        type=str,
+        help='Build folder (replaced), STATIC_BUILD_FOLDER of the app config',
+    )
+    parser.add_argument(
+        '--level',
+        default=9,
+        type=int,
+        help='gzip compression level',
+    )
+    main(args=parser.parse_args())
@@ -0,0 +1,64 @@
+"""
+Gunicorn configuration
+
+The default gevent worker serves many concurrent viewer requests per
+process, as the outbound gnomAD calls yield to other requests and the
+sqlite3 reads are run on a native threadpool (see app/database.py)
+
+Set GUNICORN_WORKER_CLASS=gthread to go back to threaded workers
+
+The app is preloaded by default (GUNICORN_PRELOAD=0 to turn it off): the
+master builds the in-memory lookups of the features database once and
+the forked workers share their pages copy-on-write, rather than each
+worker holding its own copy
+"""
+
+import gc
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8080')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.environ.get('GUNICORN_WORKERS', 3))
+# Concurrent requests per gevent worker
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+# Threads per gthread worker
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() not in ('0', 'false', 'no')
+
+if preload_app and worker_class == 'gevent':
+    # The app's locks and sockets are created in the master, so it has to
+    # be patched before the app is loaded rather than in the workers
+    from gevent import monkey  # pylint: disable=E0401,C0413
+
+    monkey.patch_all()
+
+
+def when_ready(server):
+    """
+    Loads the lookups in the master of a preloaded app, and moves them
+    out of the reach of the garbage collector so that collections in the
+    workers don't write to (and so copy) the shared pages
+    """
+    if not server.cfg.preload_app:
+        return
+    from app import features_db  # pylint: disable=C0415
+
+    try:
+        features_db.load_lookups()
+    except Exception as error:  # pylint: disable=W0703
+        server.log.warning('Could not load the features database lookups: %s', error)
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    """
+    Loads the in-memory lookups of the features database before the
+    worker takes requests (already done by the master when preloaded)
+    """
+    from app import features_db  # pylint: disable=C0415
+
+    try:
+        features_db.load_lookups()
+    except Exception as error:  # pylint: disable=W0703
+        worker.log.warning('Could not load the features database lookups: %s', error)
@@ -1,3 +1,80 @@
-curl -s -X POST \
- -H 'Content-Type: application/json' \
- "http://127.0.0.1:5000/viewer/utr_impact?variant_id=5-150904976-T-A&ensembl_transcript_id=ENST00000274599"
+#!/usr/bin/env bash
+# Checks the JSON APIs of a running server
+# Usage : ./test_api.sh [base url (default http://127.0.0.1:5000)]
+#         ENST=ENST00000274599 VARIANT=5-150904976-T-A ./test_api.sh
+#         START_SITE=<5' UTR length of ENST> also checks /viewer/utr_impact
+set -euo pipefail
+
+BASE_URL=${1:-http://127.0.0.1:5000}
+ENST=${ENST:-ENST00000274599}
+VARIANT=${VARIANT:-5-150904976-T-A}
+START_SITE=${START_SITE:-}
+
+# Fails on an HTTP error status
+get() {
+  curl -sf "$@"
+}
+
+# Runs a python expression on the JSON response read from stdin (as r)
+check() {
+  python3 -c "import json, sys; r = json.load(sys.stdin); $1"
+}
+
+if [ -n "$START_SITE" ]; then
+  echo "utr_impact"
+  get "$BASE_URL/viewer/utr_impact?variant_id=$VARIANT&ensembl_transcript_id=$ENST&start_site=$START_SITE&buffer=40" \
+    | check "assert r['message'] == 'Ok', r"
+else
+  echo "utr_impact skipped (no START_SITE)"
+fi
+
+echo "possible_variants (typeahead)"
+get "$BASE_URL/viewer/possible_variants?ensembl_transcript_id=$ENST&search_term=${VARIANT:0:5}" \
+  | check "assert r['data'], r"
+
+echo "variants window, two pages joined by the cursor"
+all=$(get "$BASE_URL/viewer/variants/$ENST?limit=10")
+first=$(get "$BASE_URL/viewer/variants/$ENST?limit=5")
+cursor=$(echo "$first" | check "print(r['next_cursor'])")
+second=$(get "$BASE_URL/viewer/variants/$ENST?limit=5&cursor=$cursor")
+python3 - "$all" "$first" "$second" <<'EOF'
+import json, sys
+whole, first, second = (json.loads(page) for page in sys.argv[1:4])
+assert len(first['data']) == 5, first
+assert first['data'] + second['data'] == whole['data'], (first, second, whole)
+EOF
+
+echo "population"
+get "$BASE_URL/viewer/population/$ENST" \
+  | check "assert set(r['data']) >= {'gnomad_data', 'gnomad_utr_impact', 'clinvar_utr_impact'}, r"
+
+echo "conservation, two pages joined by the cursor"
+cursor=$(get "$BASE_URL/viewer/conservation/$ENST?limit=10" \
+  | check "assert r['message'] == 'Ok', r; print(r['next_cursor'])")
+get "$BASE_URL/viewer/conservation/$ENST?limit=10&cursor=$cursor" \
+  | check "assert r['message'] == 'Ok', r"
+
+echo "annotate, a VCF"
+IFS=- read -r chrom pos ref alt <<< "$VARIANT"
+printf '##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\nchr%s\t%s\t.\t%s\t%s\n' \
+  "$chrom" "$pos" "$ref" "$alt" \
+  | get -X POST -H 'Content-Type: text/plain' --data-binary @- \
+    "$BASE_URL/api/annotate?format=tsv" \
+  | python3 -c "
+import sys
+lines = sys.stdin.read().splitlines()
+assert lines[0].startswith('input\tvariant_id'), lines
+assert len(lines) > 1 and lines[1].split('\t')[1] == '$VARIANT', lines
+"
+
+echo "annotate, a JSON list"
+get -X POST -H 'Content-Type: application/json' \
+  -d "[\"$VARIANT\", \"not-a-variant\"]" "$BASE_URL/api/annotate" \
+  | python3 -c "
+import json, sys
+rows = [json.loads(line) for line in sys.stdin]
+assert any(row['variant_id'] == '$VARIANT' for row in rows), rows
+assert any(row['input'] == 'not-a-variant' and row['error'] for row in rows), rows
+"
+
+echo "All checks passed"
@@ -19,7 +19,7 @@ setuptools.setup(
     long_description_content_type='text/markdown',
     url=f'https://github.com/Computational-Rare-Disease-Genomics-WHG/UTR-Visualisation-App/',
     license='MIT',
-    packages=[PKG],
+    packages=setuptools.find_packages(include=[PKG, f'{PKG}.*']),
     include_package_data=True,
     zip_safe=False,
     keywords='bioinformatics',
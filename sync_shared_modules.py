@@ -0,0 +1,74 @@
+"""
+Keeps the copies of the server modules shared with utr_utils and the
+pipeline in sync
+
+The server's docker image is built from server/flask-app alone and the
+pipeline only ships pipeline/, so the few dependency free modules they
+share with the server are copied next to the code that uses them rather
+than loaded from server/flask-app/app. The server's copy is the one to
+edit, then run this script to update the others
+
+Usage : python3 sync_shared_modules.py
+        python3 sync_shared_modules.py --check
+"""
+
+import argparse
+import shutil
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent
+SERVER_APP = ROOT / 'server' / 'flask-app' / 'app'
+
+# Server module -> its copies
+SHARED_MODULES = {
+    'coordinates.py': ['utr_utils/tools/coordinates.py'],
+    'gnomad_client.py': ['utr_utils/tools/gnomad_client.py'],
+    'track_store.py': ['pipeline/src/database/track_store.py'],
+    'reference_data.py': ['pipeline/src/database/reference_data.py'],
+    'utr_intervals.py': ['pipeline/src/database/utr_intervals.py'],
+    'variant_codec.py': [
+        'pipeline/src/database/variant_codec.py',
+        'utr_utils/tools/variant_codec.py',
+    ],
+}
+
+
+def out_of_sync():
+    """
+    @returns the (source, copy) paths whose copy differs from the server's
+    """
+    stale = []
+    for module, copies in SHARED_MODULES.items():
+        source = SERVER_APP / module
+        for copy in copies:
+            copy = ROOT / copy
+            if not copy.is_file() or copy.read_bytes() != source.read_bytes():
+                stale.append((source, copy))
+    return stale
+
+
+def main(args):
+    """Entry point"""
+    stale = out_of_sync()
+    for source, copy in stale:
+        if args.check:
+            print(f'{copy.relative_to(ROOT)} differs from {source.relative_to(ROOT)}')
+        else:
+            shutil.copyfile(source, copy)
+            print(f'Updated {copy.relative_to(ROOT)}')
+    if args.check and stale:
+        print('Run python3 sync_shared_modules.py to update the copies')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Copies the shared server modules to utr_utils and the pipeline'
+    )
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help='Only report the copies that are out of date (exits 1 if any are)',
+    )
+    main(args=parser.parse_args())
@@ -0,0 +1,162 @@
+"""
+Converts between genomic and transcript relative coordinates
+
+The features database stores each exon of a MANE transcript once, as
+(chr, strand, genomic start / end, transcript start), in the
+transcript_exon_intervals table. ExonMap converts the positions of one
+transcript in either direction with a binary search over its exons and
+ExonIndex finds the transcripts with an exon over a genomic position
+
+The coordinates are held in arrays rather than lists of ints, which
+keeps them compact and, as reading them doesn't touch the reference
+count of an object per position, shared with forked gunicorn workers
+when the app is preloaded
+
+This module has no dependencies so that utr_utils can keep a copy of it
+(see sync_shared_modules.py)
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+def normalise_chrom(chrom):
+    """
+    Strips the chr prefix so that MANE (chr1) and gnomAD (1) chromosome
+    names compare equal
+    """
+    chrom = str(chrom)
+    return chrom[3:] if chrom[0:3].lower() == "chr" else chrom
+
+
+class ExonMap:
+    """
+    The exons of a transcript
+    Positions outside of the exons map to None
+    """
+
+    __slots__ = (
+        "chrom",
+        "strand",
+        "_gstarts",
+        "_gends",
+        "_tstarts",
+        "_torder",
+        "_tkeys",
+    )
+
+    def __init__(self, chrom, strand, exons):
+        """
+        @param exons : (genomic_start, genomic_end, transcript_start) of
+        each exon, the genomic start being the lower coordinate
+        """
+        exons = sorted(exons)
+        self.chrom = normalise_chrom(chrom)
+        self.strand = strand
+        self._gstarts = array("q", [exon[0] for exon in exons])
+        self._gends = array("q", [exon[1] for exon in exons])
+        self._tstarts = array("q", [exon[2] for exon in exons])
+        # Exons in transcript order (the reverse on the - strand)
+        self._torder = array(
+            "l", sorted(range(len(exons)), key=self._tstarts.__getitem__)
+        )
+        self._tkeys = array("q", [self._tstarts[i] for i in self._torder])
+
+    def __len__(self):
+        return len(self._gstarts)
+
+    def intervals(self):
+        """
+        @returns the (genomic_start, genomic_end) of each exon
+        """
+        return zip(self._gstarts, self._gends)
+
+    def to_transcript(self, gpos):
+        """
+        @returns the transcript position of a genomic position
+        """
+        i = bisect_right(self._gstarts, gpos) - 1
+        if i < 0 or gpos > self._gends[i]:
+            return None
+        if self.strand == "-":
+            return self._tstarts[i] + self._gends[i] - gpos
+        return self._tstarts[i] + gpos - self._gstarts[i]
+
+    def to_genome(self, tpos):
+        """
+        @returns the genomic position of a transcript position
+        """
+        j = bisect_right(self._tkeys, tpos) - 1
+        if j < 0:
+            return None
+        i = self._torder[j]
+        offset = tpos - self._tstarts[i]
+        if offset > self._gends[i] - self._gstarts[i]:
+            return None
+        if self.strand == "-":
+            return self._gends[i] - offset
+        return self._gstarts[i] + offset
+
+
+class ExonIndex:
+    """
+    The ExonMaps of every transcript with, per chromosome, their exons
+    sorted by genomic start
+    """
+
+    __slots__ = ("transcripts", "_ids", "_chroms")
+
+    def __init__(self, rows):
+        """
+        @param rows : (chr, ensembl_transcript_id, strand, genomic_start,
+        genomic_end, transcript_start) of each exon
+        """
+        exons = {}
+        for chrom, enst, strand, gstart, gend, tstart in rows:
+            exons.setdefault(enst, (chrom, strand, []))[2].append(
+                (gstart, gend, tstart)
+            )
+        self.transcripts = {
+            enst: ExonMap(chrom, strand, transcript_exons)
+            for enst, (chrom, strand, transcript_exons) in exons.items()
+        }
+
+        # The exons of a chromosome refer to their transcript by position
+        self._ids = tuple(sorted(self.transcripts))
+        by_chrom = {}
+        for i, enst in enumerate(self._ids):
+            exon_map = self.transcripts[enst]
+            by_chrom.setdefault(exon_map.chrom, []).extend(
+                (gstart, gend, i) for gstart, gend in exon_map.intervals()
+            )
+        self._chroms = {}
+        for chrom, chrom_exons in by_chrom.items():
+            chrom_exons.sort()
+            self._chroms[chrom] = (
+                array("q", [exon[0] for exon in chrom_exons]),
+                array("q", [exon[1] for exon in chrom_exons]),
+                array("l", [exon[2] for exon in chrom_exons]),
+                # The longest exon bounds how far back an overlap can start
+                max(exon[1] - exon[0] for exon in chrom_exons),
+            )
+
+    def get(self, ensembl_transcript_id):
+        """
+        @returns the ExonMap of a transcript (None if it is not known)
+        """
+        return self.transcripts.get(ensembl_transcript_id)
+
+    def transcripts_at(self, chrom, gpos):
+        """
+        @returns the sorted ids of the transcripts with an exon over the
+        genomic position
+        """
+        if normalise_chrom(chrom) not in self._chroms:
+            return []
+        starts, ends, transcripts, span = self._chroms[normalise_chrom(chrom)]
+        hi = bisect_right(starts, gpos)
+        lo = bisect_left(starts, gpos - span, 0, hi)
+        return [
+            self._ids[i]
+            for i in sorted({transcripts[i] for i in range(lo, hi) if ends[i] >= gpos})
+        ]
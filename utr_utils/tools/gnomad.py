@@ -9,18 +9,27 @@ https://gnomad.broadinstitute.org/api
 # flake8: noqa
 # TODO: Clean utils
 
-import json
-import requests  # pylint: disable=E0401
-
-
 import pandas as pd
 
 from pathlib import Path
 from functools import reduce
+from utr_utils.tools import gnomad_client
 from utr_utils.tools.utils import convert_uploaded_variation_to_variant_id
 
 script_path = Path(__file__).parent
 
+_client = None
+
+
+def get_client():
+    """
+    The pooled / cached gnomAD client, created on first use
+    """
+    global _client
+    if _client is None:
+        _client = gnomad_client.GnomadClient()
+    return _client
+
 
 def gnomad_search_by_transcript_id(transcript_id):
     """
@@ -93,19 +102,7 @@ def gnomad_search_by_transcript_id(transcript_id):
   }
   """
 
-    response = requests.post(
-        'https://gnomad.broadinstitute.org/api',
-        data=json.dumps(
-            {
-                'query': transcript_query,
-                'variables': {'transcript_id': transcript_id},
-            }
-        ),
-        headers={
-            'Content-Type': 'application/json',
-        },
-    ).json()
-    return response['data']
+    return get_client().query(transcript_query, {'transcript_id': transcript_id})
 
 
 def gnomad_search_by_gene_id(hgnc):
@@ -168,20 +165,7 @@ def gnomad_search_by_gene_id(hgnc):
       }
     }
   """
-    response = requests.post(
-        'https://gnomad.broadinstitute.org/api',
-        data=json.dumps(
-            {
-                'query': gene_query,
-                'variables': {'hgnc': hgnc},
-            }
-        ),
-        headers={
-            'Content-Type': 'application/json',
-        },
-    ).json()
-
-    return response['data']
+    return get_client().query(gene_query, {'hgnc': hgnc})
 
 
 def get_constraint_by_ensg(ensg):
@@ -209,10 +193,10 @@ def get_constraint_by_ensg(ensg):
 
 def get_gnomad_variants_in_utr_regions(utr_regions):
     searches = [
-        gnomad_api_search_by_region(
-            chrom=ur['chr'][3:], start=ur['start'], stop=ur['end']
-        )['region']
-        for ur in utr_regions
+        search['region']
+        for search in get_client().search_regions(
+            [(ur['chr'][3:], ur['start'], ur['end']) for ur in utr_regions]
+        )
     ]
     data = {}
     # Append
@@ -225,61 +209,4 @@ def gnomad_api_search_by_region(chrom, start, stop):
     """
     For prototyping purposes
     """
-    region_variant_query = """
-
-
-query get_data ($chrom : String!,
-								$start : Int!,
-								$stop : Int!){
-  region(chrom: $chrom, start:$start, stop:$stop, reference_genome:GRCh38){
-  clinvar_variants {
-        transcript_id
-        ref
-        pos
-        alt
-        in_gnomad
-        clinvar_variation_id
-        gold_stars
-        variant_id
-        review_status
-        hgvsc
-        clinical_significance
-        major_consequence
-      }
-      variants(dataset: gnomad_r3) {
-        ref
-        pos
-        alt
-        hgvsc
-        variant_id
-        genome {
-          af
-          an
-          ac
-        }
-        transcript_consequence {
-          is_mane_select
-          major_consequence
-          sift_prediction
-          polyphen_prediction
-          is_mane_select_version
-        }
-      }
-  }
-
-  }
-  """
-    response = requests.post(
-        'https://gnomad.broadinstitute.org/api',
-        data=json.dumps(
-            {
-                'query': region_variant_query,
-                'variables': {'start': start, 'stop': stop, 'chrom': chrom},
-            }
-        ),
-        headers={
-            'Content-Type': 'application/json',
-        },
-    ).json()
-
-    return response['data']
+    return get_client().search_region(chrom, start, stop)
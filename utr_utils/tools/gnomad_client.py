@@ -0,0 +1,279 @@
+"""
+A pooled, concurrent and cached client for the gnomAD GraphQL API
+
+This module only depends on requests so that utr_utils can keep a copy
+of it (see sync_shared_modules.py)
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests  # pylint: disable=E0401
+from requests.adapters import HTTPAdapter  # pylint: disable=E0401
+
+GNOMAD_API_URL = "https://gnomad.broadinstitute.org/api"
+
+REGION_QUERY = """
+    query {{
+      region(chrom: "{chrom}", start: {start}, stop: {stop}, reference_genome: GRCh38) {{
+        clinvar_variants {{
+          transcript_id ref pos alt in_gnomad clinvar_variation_id gold_stars variant_id
+          review_status hgvsc clinical_significance major_consequence
+        }}
+        variants(dataset: {dataset}) {{
+          ref pos alt hgvsc variant_id
+          genome {{ af an ac }}
+          transcript_consequence {{
+            is_mane_select major_consequence sift_prediction polyphen_prediction is_mane_select_version
+          }}
+        }}
+      }}
+    }}
+    """  # noqa: E501 # pylint: disable=C0301
+
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+
+class TTLLRUCache:
+    """
+    A bounded, thread-safe LRU cache where entries are fresh for ttl
+    seconds, can be served stale for a further stale_ttl seconds
+    while they are revalidated and are evicted after that
+
+    maxsize bounds the number of entries, or their total weight if a
+    weigh function is given (e.g. the length of a response body)
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, stale_ttl=86400, weigh=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.weigh = weigh
+        self.weight = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Looks up a key
+        @returns (value, state) where state is one of FRESH, STALE or MISS
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, MISS
+            value, stored_at, weight = entry
+            age = time.monotonic() - stored_at
+            if age > self.ttl + self.stale_ttl:
+                del self._entries[key]
+                self.weight -= weight
+                self.misses += 1
+                return None, MISS
+            self._entries.move_to_end(key)
+            if age > self.ttl:
+                self.stale_hits += 1
+                return value, STALE
+            self.hits += 1
+            return value, FRESH
+
+    def set(self, key, value):
+        """
+        Stores a value, evicting the least recently used entries if full
+        (a value heavier than maxsize isn't stored)
+        """
+        weight = 1 if self.weigh is None else self.weigh(value)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.weight -= previous[2]
+            if weight > self.maxsize:
+                return
+            self._entries[key] = (value, time.monotonic(), weight)
+            self.weight += weight
+            while self.weight > self.maxsize:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.weight -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Removes all of the entries
+        """
+        with self._lock:
+            self._entries.clear()
+            self.weight = 0
+
+    def stats(self):
+        """
+        Hit / miss counters for the cache
+        """
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "weight": self.weight,
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            }
+
+
+class GnomadClient:
+    """
+    Client for the gnomAD API with a keep-alive connection pool,
+    parallel region fetching and a TTL + LRU response cache keyed
+    on (chrom, start, stop, dataset)
+    """
+
+    def __init__(
+        self,
+        api_url=GNOMAD_API_URL,
+        timeout=10,
+        pool_size=10,
+        max_workers=8,
+        cache_size=1024,
+        cache_ttl=3600,
+        stale_ttl=86400,
+    ):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.cache = TTLLRUCache(maxsize=cache_size, ttl=cache_ttl, stale_ttl=stale_ttl)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "User-Agent": "curl/7.88.1",
+                "Referer": "https://gnomad.broadinstitute.org",
+                "Accept": "application/json",
+            }
+        )
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self.revalidation_errors = 0
+        # Called with (seconds, status code) after each API request
+        self.observer = None
+
+    def post(self, data, content_type):
+        """
+        Posts a query to the API over the pooled session
+        @returns the "data" field of the response
+        """
+        start = time.perf_counter()
+        try:
+            resp = self.session.post(
+                self.api_url,
+                data=data,
+                headers={"Content-Type": content_type},
+                timeout=self.timeout,
+            )
+        except requests.RequestException:
+            if self.observer is not None:
+                self.observer(time.perf_counter() - start, "error")
+            raise
+        if self.observer is not None:
+            self.observer(time.perf_counter() - start, resp.status_code)
+        if resp.status_code != 200:
+            raise RuntimeError(
+                f"gnomAD API returned {resp.status_code}: {resp.text[:1000]!s}"
+            )
+        return resp.json()["data"]
+
+    def query(self, query, variables=None):
+        """
+        Runs a GraphQL query with variables (uncached)
+        """
+        return self.post(
+            json.dumps({"query": query, "variables": variables or {}}),
+            "application/json",
+        )
+
+    def fetch_region(self, chrom, start, stop, dataset="gnomad_r3"):
+        """
+        Fetches a region from the API and stores it in the cache
+        """
+        q = REGION_QUERY.format(
+            chrom=chrom, start=int(start), stop=int(stop), dataset=dataset
+        )
+        data = self.post(q.encode("utf-8"), "application/graphql; charset=utf-8")
+        self.cache.set((str(chrom), int(start), int(stop), dataset), data)
+        return data
+
+    def _revalidate(self, chrom, start, stop, dataset):
+        key = (str(chrom), int(start), int(stop), dataset)
+        try:
+            self.fetch_region(chrom, start, stop, dataset)
+        except (requests.RequestException, RuntimeError, ValueError):
+            # Keep serving the stale response until the next attempt
+            self.revalidation_errors += 1
+        finally:
+            with self._refresh_lock:
+                self._refreshing.discard(key)
+
+    def search_region(self, chrom, start, stop, dataset="gnomad_r3"):
+        """
+        Gets the gnomAD and ClinVar variants in a region
+        Stale responses are returned straight away and refreshed in
+        the background
+        @returns {"region": {"variants": [...], "clinvar_variants": [...]}}
+        """
+        key = (str(chrom), int(start), int(stop), dataset)
+        data, state = self.cache.get(key)
+        if state == FRESH:
+            return data
+        if state == STALE:
+            with self._refresh_lock:
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    self._executor.submit(
+                        self._revalidate, chrom, start, stop, dataset
+                    )
+            return data
+        return self.fetch_region(chrom, start, stop, dataset)
+
+    def search_regions(self, regions, dataset="gnomad_r3"):
+        """
+        Fetches a list of (chrom, start, stop) regions in parallel
+        @returns a list of responses in the same order as regions
+        """
+        futures = [
+            self._executor.submit(self.search_region, chrom, start, stop, dataset)
+            for chrom, start, stop in regions
+        ]
+        return [future.result() for future in futures]
+
+    def stats(self):
+        """
+        Cache counters for monitoring
+        """
+        return {**self.cache.stats(), "revalidation_errors": self.revalidation_errors}
+
+
+def init_app(app):
+    """
+    Creates one client per worker from the app configuration
+    """
+    app.extensions["gnomad_client"] = GnomadClient(
+        api_url=app.config.get("GNOMAD_API_URL", GNOMAD_API_URL),
+        timeout=app.config.get("GNOMAD_TIMEOUT", 10),
+        pool_size=app.config.get("GNOMAD_POOL_SIZE", 10),
+        max_workers=app.config.get("GNOMAD_MAX_WORKERS", 8),
+        cache_size=app.config.get("GNOMAD_CACHE_SIZE", 1024),
+        cache_ttl=app.config.get("GNOMAD_CACHE_TTL", 3600),
+        stale_ttl=app.config.get("GNOMAD_STALE_TTL", 86400),
+    )
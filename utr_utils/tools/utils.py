@@ -9,6 +9,9 @@ import re
 import json
 from pathlib import Path
 
+# A copy of the server's module (see sync_shared_modules.py)
+from utr_utils.tools import coordinates
+
 script_path = Path(__file__).parent
 
 
@@ -40,14 +43,16 @@ def convert_uploaded_variation_to_variant_id(uploaded_variation):
 
 def find_transcript_location(glookup_table, variant_pos, ensembl_transcript_id):
     """
-    Filters the glookup_table to find the genome position's transcript cdna location
+    Finds the genome position's transcript cdna location from the exon
+    intervals in the glookup_table
     """
-    return int(
-        glookup_table[
-            (variant_pos == glookup_table['gpos'])
-            & (ensembl_transcript_id == glookup_table['ensembl_transcript_id'])
-        ]['tpos'].values[0]
+    exons = glookup_table[ensembl_transcript_id == glookup_table['ensembl_transcript_id']]
+    exon_map = coordinates.ExonMap(
+        exons['seqid'].values[0],
+        exons['strand'].values[0],
+        zip(exons['gstart'], exons['gend'], exons['tstart']),
     )
+    return int(exon_map.to_transcript(int(variant_pos)))
 
 
 def add_tloc_to_dict(variant_item, glookup_table, ensembl_transcript_id):
@@ -63,7 +68,7 @@ def add_tloc_to_dict(variant_item, glookup_table, ensembl_transcript_id):
 def get_lookup_df(ensembl_transcript_id):
 
     glookup_table = pd.read_csv(
-        script_path / "../../data/pipeline/UTR_Genome_Transcript_Coordinates.tsv",
+        script_path / "../../data/pipeline/UTR_Genome_Transcript_Intervals.tsv",
         sep="\t",
     )
     return glookup_table[ensembl_transcript_id == glookup_table.ensembl_transcript_id]
@@ -4,14 +4,20 @@
 # TODO: Clean utils
 import pandas as pd
 import json
-from pathlib import Path
+
+# A copy of the server's codec of the variant store (see sync_shared_modules.py)
+from utr_utils.tools import variant_codec
 
 
 def get_all_possible_variants(ensembl_transcript_id, cursor):
+    codec = variant_codec.codec_from_connection(cursor.connection)
     cursor.execute(
-        'SELECT annotations FROM variant_annotations WHERE ensembl_transcript_id =?',
+        'SELECT ensembl_transcript_id, cdna_pos, five_prime_UTR_variant_consequence, '
+        'five_prime_UTR_variant_annotation, annotations '
+        'FROM variant_annotations WHERE ensembl_transcript_id =?',
         [ensembl_transcript_id],
     )
+    columns = [col[0] for col in cursor.description]
     rows = cursor.fetchall()
-    variants = [json.loads(row[0]) for row in rows]
+    variants = [codec.decode(row[4], dict(zip(columns, row))) for row in rows]
     return variants
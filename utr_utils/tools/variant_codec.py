@@ -0,0 +1,159 @@
+"""
+Compact storage format for the VEP rows of the variant store
+
+The fields the server reads (cDNA_position and the UTRannotator
+consequence / annotation) are typed columns of variant_annotations and
+the rest of the VEP row is stored in the annotations column as a JSON
+list of values, in the column order held in store_metadata, deflated
+against a preset dictionary of the most common values (also in
+store_metadata) so that each row can still be decoded on its own
+
+Stores built before this format hold the whole row as JSON text and no
+store_metadata table, LegacyCodec reads those
+
+This module has no dependencies so that the pipeline and utr_utils can
+keep a copy of it (see sync_shared_modules.py)
+"""
+
+import json
+import zlib
+from collections import Counter
+
+FORMAT_VERSION = 2
+
+# VEP columns stored outside of the annotations blob, with the
+# variant_annotations column they are stored in
+TYPED_COLUMNS = {
+    "Feature": "ensembl_transcript_id",
+    "cDNA_position": "cdna_pos",
+    "five_prime_UTR_variant_consequence": "five_prime_UTR_variant_consequence",
+    "five_prime_UTR_variant_annotation": "five_prime_UTR_variant_annotation",
+}
+
+# zlib can use up to 32 KiB, but loading the dictionary dominates the
+# decode time of a row that small and a few KiB compress nearly as well
+ZDICT_SIZE = 4096
+
+
+def parse_utr_annotation(value):
+    """
+    Parses a stored UTRannotator annotation into a keyed dictionary
+    Accepts the JSON text of older stores and the UTRannotator
+    key:value,key:value string
+    """
+    if not value:
+        return {}
+    if value[0] == "{":
+        return json.loads(value)
+    return dict(annotation.split(":", 1) for annotation in value.split(","))
+
+
+def build_zdict(rows, size=ZDICT_SIZE):
+    """
+    Builds a preset dictionary from a sample of rows (lists of values)
+    The most frequent values go last, as they are the cheapest to refer to
+    """
+    counts = Counter(json.dumps(value) for row in rows for value in row)
+    # Only worth having if it appears more than once
+    tokens = [
+        token
+        for token, count in sorted(counts.items(), key=lambda i: i[1] * len(i[0]))
+        if count > 1
+    ]
+    zdict = b""
+    for token in reversed(tokens):
+        token = token.encode("utf-8") + b","
+        if len(zdict) + len(token) > size:
+            break
+        zdict = token + zdict
+    return zdict
+
+
+class AnnotationCodec:
+    """
+    Encodes / decodes the annotations blob of the compact format
+    """
+
+    def __init__(self, columns, zdict=b"", level=9):
+        self.columns = list(columns)
+        self.zdict = zdict
+        self.level = level
+
+    @classmethod
+    def from_sample(cls, rows, level=9):
+        """
+        Creates a codec from a sample of VEP rows (dictionaries)
+        """
+        columns = [col for col in rows[0] if col not in TYPED_COLUMNS]
+        zdict = build_zdict([[row[col] for col in columns] for row in rows])
+        return cls(columns, zdict, level)
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """
+        Creates a codec from the (key, value) rows of store_metadata
+        """
+        metadata = dict(metadata)
+        return cls(json.loads(metadata["annotation_columns"]), metadata["zdict"])
+
+    def metadata(self):
+        """
+        @returns the (key, value) rows to store in store_metadata
+        """
+        return [
+            ("format_version", str(FORMAT_VERSION)),
+            ("annotation_columns", json.dumps(self.columns)),
+            ("zdict", self.zdict),
+        ]
+
+    def encode(self, row):
+        """
+        Encodes the untyped fields of a VEP row (dictionary)
+        @returns bytes
+        """
+        compressor = zlib.compressobj(self.level, zdict=self.zdict)
+        data = json.dumps([row[col] for col in self.columns], separators=(",", ":"))
+        return compressor.compress(data.encode("utf-8")) + compressor.flush()
+
+    def decode(self, blob, typed=None):
+        """
+        Decodes an annotations blob back into the VEP row
+        @param typed : the typed columns of the row (keyed by the
+        variant_annotations column names) to merge back in
+        @returns dictionary
+        """
+        decompressor = zlib.decompressobj(zdict=self.zdict)
+        values = json.loads(decompressor.decompress(blob) + decompressor.flush())
+        row = dict(zip(self.columns, values))
+        if typed is not None:
+            for vep_col, col in TYPED_COLUMNS.items():
+                row[vep_col] = typed[col]
+        return row
+
+
+class LegacyCodec:
+    """
+    Reads stores where annotations holds the whole VEP row as JSON text
+    """
+
+    columns = None
+
+    def decode(self, blob, typed=None):  # pylint: disable=W0613
+        """
+        @returns dictionary
+        """
+        return json.loads(blob)
+
+
+def codec_from_connection(conn):
+    """
+    Gets the codec for an open variant store connection
+    """
+    has_metadata = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='store_metadata'"
+    ).fetchone()
+    if not has_metadata:
+        return LegacyCodec()
+    return AnnotationCodec.from_metadata(
+        tuple(row) for row in conn.execute("SELECT key, value FROM store_metadata")
+    )